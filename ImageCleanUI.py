@@ -209,6 +209,14 @@ class CheckBoxItem(BoxLayout):
     @staticmethod
     def value_keep_originals():
         return cleaner_app.keep_original_files
+
+    @staticmethod
+    def set_link_files(touch):
+        cleaner_app.link_files = touch
+
+    @staticmethod
+    def value_link_files():
+        return cleaner_app.link_files
     #@staticmethod
     #def set_process_duplicates(touch):
     #    cleaner_app.check_for_duplicates = touch
@@ -531,6 +539,7 @@ class Main(FloatLayout):
            "'Save Images To' is where they will be stored - it can be the same as the From folder\n\n"
            "Options\n"
            "Keep Originals      - If selected no changes to Import From,  usually files are copied and deleted. \n"
+           "Link Originals      - Kept originals on the same drive are linked (or cloned) rather than copied, saving space\n"
            "Look for Duplicates - Files with similar names, but in different folders are checked and if\n "
            "they are the same,  the copy is moved to duplicates folder. On large output folders this can take a while.\n"
            "Look for Thumbnails - Isolate images that are very small (Often created by other importing software)\n"
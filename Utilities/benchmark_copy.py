@@ -0,0 +1,111 @@
+"""
+Compare copying undated JPEGs and then setting their date (set_date rewrites the copy) with setting the date as they
+are copied (ImageCleaner.copy_content).   Both are timed over a folder of JPEGs whose dates come from their names,  and
+on Linux the bytes read and written are taken from /proc/self/io.
+
+python -m Utilities.benchmark_copy [--files 200] [--size 2000] [--folder path]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Callable, Dict
+
+from PIL import Image
+
+# pylint: disable=import-error
+from backend.cleaner import CleanerBase, ImageCleaner
+from backend.file_ops import copy_file
+
+IO_COUNTERS = Path('/proc/self/io')
+
+
+def io_counters() -> Dict[str, int]:
+    """
+    :return: rchar and wchar (bytes passed to read and write calls),  empty if the platform does not count them
+    """
+    if not IO_COUNTERS.exists():
+        return {}
+    values = dict(line.split(': ') for line in IO_COUNTERS.read_text(encoding='utf-8').splitlines())
+    return {key: int(values[key]) for key in ('rchar', 'wchar')}
+
+
+def make_images(folder: Path, files: int, size: int):
+    """
+    Undated JPEGs,  each with a date in its name
+    :param folder:
+    :param files:
+    :param size: Width and height in pixels
+    :return:
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    image = Image.effect_noise((size, size), 64).convert('RGB')  # Noise,  so the files are not tiny
+    for index in range(files):
+        image.save(folder.joinpath(f'20200101_{index:06d}.jpg'), quality=90)
+
+
+def copy_then_set(image: ImageCleaner, new_file: Path):
+    """
+    What relocate_file used to do
+    """
+    copy_file(image.path, new_file)
+    image.set_date(new_file)
+
+
+def copy_with_date(image: ImageCleaner, new_file: Path):
+    """
+    What relocate_file does now
+    """
+    image.copy_content(image.path, new_file)
+
+
+def run(name: str, method: Callable[[ImageCleaner, Path], None], source: Path, output: Path):
+    """
+    Time one way of copying the folder
+    :param name:
+    :param method:
+    :param source:
+    :param output:
+    :return:
+    """
+    shutil.rmtree(output, ignore_errors=True)
+    output.mkdir(parents=True)
+    CleanerBase.clear_caches()
+    images = [ImageCleaner(path) for path in sorted(source.iterdir())]
+    for image in images:
+        assert image.updates_metadata, f'{image.path} should get a date'
+    before, started = io_counters(), time.perf_counter()
+    for image in images:
+        method(image, output.joinpath(image.path.name))
+    seconds, after = time.perf_counter() - started, io_counters()
+    total = sum(path.stat().st_size for path in source.iterdir())
+    line = f'{name:15} {len(images)} files,  {total / 1024 / 1024:.1f} MB in {seconds:.3f}s'
+    if before:
+        line += (f',  read {(after["rchar"] - before["rchar"]) / total:.2f}x'
+                 f'  written {(after["wchar"] - before["wchar"]) / total:.2f}x the data')
+    print(line)
+
+
+def main():
+    """
+    Parse the arguments and run both ways
+    :return:
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--files', type=int, default=200, help='How many JPEGs to make')
+    parser.add_argument('--size', type=int, default=2000, help='Their width and height')
+    parser.add_argument('--folder', type=Path, help='Work here rather than in a temporary folder')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.folder) as work:
+        source, output = Path(work).joinpath('input'), Path(work).joinpath('output')
+        make_images(source, args.files, args.size)
+        for _ in range(2):  # The second round has a warm cache for both
+            run('copy then set', copy_then_set, source, output)
+            run('set while copy', copy_with_date, source, output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Persistent inventory of the output folder,  so a run does not have to walk the whole library to know what is in it
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+from functools import wraps
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger('Cleaner')
+
+SCHEMA_VERSION = 4  # 4: perceptual hashes are taken from the reduced decode (see backend.decode)
+RACY_WINDOW = 2 * 1000 * 1000 * 1000  # ns, folders changed this close to their scan can not be trusted
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER, scanned_ns INTEGER);
+    CREATE INDEX IF NOT EXISTS folders_parent ON folders (parent);
+    CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, folder TEXT, size INTEGER, mtime_ns INTEGER,
+                                      inode INTEGER, phash BLOB);
+    CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+    CREATE TABLE IF NOT EXISTS imports (dev INTEGER, inode INTEGER, path TEXT, size INTEGER, mtime_ns INTEGER,
+                                        settings TEXT, decision TEXT, PRIMARY KEY (dev, inode));
+"""
+
+
+def locked(method: Callable) -> Callable:
+    """
+    Serialise a Catalog method,  files can be relocated on worker threads (see PlanExecutor)
+    :param method:
+    :return:
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class CatalogFile(NamedTuple):
+    """
+    What the catalog knows about a file
+    """
+    path: Path
+    size: int
+    mtime_ns: int
+    inode: int
+
+
+class Catalog:
+    """
+    A SQLite catalog of the folders and files under root.
+
+    Every folder is stored with the mtime it had when it was listed.   Adding,  removing or renaming a member changes
+    the mtime of a folder,  so while it is unchanged the members can be loaded from the catalog rather than the disk.
+    Files carry size/mtime/inode so later consumers can tell if what they cached about a file is still valid.
+
+    The imports table is the input side manifest,  what was decided for each input file that was left in place (and
+    with which settings,  a decision only holds for the settings it was made with).
+
+    The connection is shared by every thread that relocates files,  each method holds the lock while it uses it.
+    """
+    def __init__(self, db_path: Path, root: Path):
+        self.root = root
+        self._root_key = root.as_posix()
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(str(db_path), check_same_thread=False)
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            logger.debug('Catalog %s is out of date,  rebuilding it', db_path)
+            self.connection.executescript('DROP TABLE IF EXISTS folders; DROP TABLE IF EXISTS files; '
+                                          'DROP TABLE IF EXISTS imports;')
+            self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.connection.executescript(SCHEMA)
+
+    def contains(self, path: Path) -> bool:
+        """
+        Only things living under root belong in the catalog
+        :param path:
+        :return:
+        """
+        key = path.as_posix()
+        return key == self._root_key or key.startswith(f'{self._root_key}/')
+
+    @locked
+    def is_current(self, folder: Path, mtime_ns: int) -> bool:
+        """
+        Test if the stored members of this folder can be trusted
+        :param folder:
+        :param mtime_ns: The current mtime of the folder
+        :return: True if the folder is known and has not changed since it was listed
+        """
+        row = self.connection.execute('SELECT mtime_ns, scanned_ns FROM folders WHERE path = ?',
+                                      (folder.as_posix(),)).fetchone()
+        if not row:
+            return False
+        return row[0] == mtime_ns and mtime_ns < row[1] - RACY_WINDOW
+
+    @locked
+    def load_folder(self, folder: Path) -> Tuple[List[Path], List[CatalogFile]]:
+        """
+        Get the stored members of a folder
+        :param folder:
+        :return: (sub-folders, files)
+        """
+        key = folder.as_posix()
+        folders = [Path(row[0]) for row in
+                   self.connection.execute('SELECT path FROM folders WHERE parent = ?', (key,))]
+        files = [CatalogFile(Path(row[0]), *row[1:]) for row in
+                 self.connection.execute('SELECT path, size, mtime_ns, inode FROM files WHERE folder = ?', (key,))]
+        return folders, files
+
+    @locked
+    def store_folder(self, folder: Path, mtime_ns: int, folders: List[Path],
+                     files: List[Tuple[Path, Optional[os.stat_result]]]) -> List[CatalogFile]:
+        """
+        Replace the stored members of a folder with a fresh listing
+        :param folder:
+        :param mtime_ns: The mtime of the folder at the time of the listing
+        :param folders: The sub-folders found
+        :param files: The files found,  with their stat results if the caller has them
+        :return: The files as stored
+        """
+        key = folder.as_posix()
+        current = {path.as_posix() for path in folders}
+        for known, in self.connection.execute('SELECT path FROM folders WHERE parent = ?', (key,)).fetchall():
+            if known not in current:
+                self.forget_folder(Path(known))
+        for sub_folder in current:  # Sub-folders are known,  but not current until they have been listed
+            self.connection.execute('INSERT OR IGNORE INTO folders VALUES (?, ?, NULL, 0)', (sub_folder, key))
+
+        self.connection.execute('DELETE FROM files WHERE folder = ?', (key,))
+        stored = [self.add_file(path, stat) for path, stat in files]
+        self.connection.execute('INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?)',
+                                (key, folder.parent.as_posix(), mtime_ns, time.time_ns()))
+        return [value for value in stored if value]
+
+    @locked
+    def forget_folder(self, folder: Path):
+        """
+        Remove a folder and everything below it
+        :param folder:
+        :return:
+        """
+        key = folder.as_posix()
+        prefix = f'{key}/'
+        for table, column in (('folders', 'path'), ('files', 'folder')):
+            self.connection.execute(f'DELETE FROM {table} WHERE {column} = ? OR substr({column}, 1, ?) = ?',
+                                    (key, len(prefix), prefix))
+
+    @locked
+    def add_file(self, path: Path, stat: Optional[os.stat_result] = None) -> Optional[CatalogFile]:
+        """
+        Add or refresh a file
+        :param path:
+        :param stat: The stat result if the caller already has it
+        :return: What was stored (if anything)
+        """
+        if not self.contains(path):
+            return None
+        try:
+            stat = stat if stat else os.stat(path)
+        except FileNotFoundError:
+            logger.debug('Catalog can not add %s,  it does not exist', path)
+            return None
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, NULL)',
+                                (path.as_posix(), path.parent.as_posix(), stat.st_size, stat.st_mtime_ns,
+                                 stat.st_ino))
+        return CatalogFile(path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    @locked
+    def remove_file(self, path: Path):
+        """
+        Remove a file
+        :param path:
+        :return:
+        """
+        self.connection.execute('DELETE FROM files WHERE path = ?', (path.as_posix(),))
+
+    @locked
+    def rename_file(self, old_path: Path, new_path: Path):
+        """
+        Track a rename,  the stat data is refreshed for the new path
+        :param old_path:
+        :param new_path:
+        :return:
+        """
+        self.remove_file(old_path)
+        self.add_file(new_path)
+
+    @locked
+    def perceptual_hash(self, path: Path, stat: os.stat_result) -> Optional[int]:
+        """
+        Any perceptual hash stored for this file,  it is dropped whenever the file is refreshed and only trusted while
+        the file has the mtime and inode it had when it was hashed (it may have been edited in place since)
+        :param path:
+        :param stat: Its current stat
+        :return: hash or None
+        """
+        row = self.connection.execute('SELECT phash, mtime_ns, inode FROM files WHERE path = ?',
+                                      (path.as_posix(),)).fetchone()
+        if row and row[0] is not None and row[1:] == (stat.st_mtime_ns, stat.st_ino):
+            return int.from_bytes(row[0], 'big')
+        return None
+
+    @locked
+    def set_perceptual_hash(self, path: Path, value: int, stat: os.stat_result):
+        """
+        Store the perceptual hash for a catalogued file,  along with the stat of the file it was taken from
+        :param path:
+        :param value: 64 bit hash
+        :param stat: The stat of the file that was hashed
+        :return:
+        """
+        self.connection.execute('UPDATE files SET phash = ?, size = ?, mtime_ns = ?, inode = ? WHERE path = ?',
+                                (value.to_bytes(8, 'big'), stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                                 path.as_posix()))
+
+    @locked
+    def import_decision(self, path: Path, stat: os.stat_result, settings: str) -> Optional[str]:
+        """
+        What an earlier run decided for this input file,  if neither it nor the settings have changed since
+        :param path:
+        :param stat: Its current stat
+        :param settings: A summary of the options that affect the decision
+        :return: The decision or None
+        """
+        row = self.connection.execute('SELECT path, size, mtime_ns, settings, decision FROM imports '
+                                      'WHERE dev = ? AND inode = ?', (stat.st_dev, stat.st_ino)).fetchone()
+        if row and row[:4] == (path.as_posix(), stat.st_size, stat.st_mtime_ns, settings):
+            return row[4]
+        return None
+
+    @locked
+    def record_import(self, path: Path, stat: os.stat_result, settings: str, decision: str):
+        """
+        Remember what was decided for an input file that stays where it is
+        :param path:
+        :param stat: Its stat at the time of the decision
+        :param settings: A summary of the options that affect the decision
+        :param decision: see ImageClean.import_file
+        :return:
+        """
+        self.connection.execute('INSERT OR REPLACE INTO imports VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (stat.st_dev, stat.st_ino, path.as_posix(), stat.st_size, stat.st_mtime_ns, settings,
+                                 decision))
+
+    @locked
+    def commit(self):
+        """
+        Write out any pending changes
+        :return:
+        """
+        self.connection.commit()
+
+    @locked
+    def close(self):
+        """
+        Commit and close the database
+        :return:
+        """
+        self.connection.commit()
+        self.connection.close()
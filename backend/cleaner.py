@@ -5,17 +5,27 @@ import logging
 import os
 import platform
 import re
+import stat as stat_module
 
+from array import array
 from datetime import datetime
-from filecmp import cmp
 from functools import cached_property
+from hashlib import blake2b
 from pathlib import Path
-from shutil import copyfile
-from typing import List, Dict, Optional, TypeVar, Union
+from typing import List, Dict, Optional, Tuple, TypeVar, Union
 from PIL import Image, UnidentifiedImageError
 
 import piexif
 
+# pylint: disable=import-error
+from backend.decode import reduced_image
+from backend.content_index import full_digest, partial_digest, sampled_digest, SAMPLE_MINIMUM
+from backend.metadata import ImageMetadataMixin, movie_duration, probe_dimensions, sidecar_path
+from backend.plan import Operation, Outcome
+from backend.registry import DEFAULT_LIBRARY, Library, registry_key
+from backend.transfer import TransferMixin, count, move_counts
+from backend.similarity import dhash
+
 if platform.system() != 'Windows':  # pragma: no cover
     import pyheif  # pylint: disable=import-outside-toplevel, import-error
 
@@ -24,6 +34,7 @@ logger = logging.getLogger('Cleaner')
 
 IMAGE_FILES = ['.JPG', '.HEIC', '.AVI', '.MP4', '.THM', '.RTF', '.PNG', '.JPEG', '.MOV', '.TIFF']
 SMALL_IMAGE = 360  # If width and height are less than this, it is thumbnail or some other derived file.
+SMALL_IMAGE_BYTES = SMALL_IMAGE * SMALL_IMAGE * 8 + 1024 * 1024  # 16 bit RGBA plus 1MB of metadata,  at most
 SMALL_FOLDER = 30  # Less than this and we should consider the folder small.
 
 CT = TypeVar("CT", bound="Cleaner")  # pylint: disable=invalid-name
@@ -31,27 +42,59 @@ FileCT = TypeVar("FileCT", bound="FileCleaner")  # pylint: disable=invalid-name
 ImageCT = TypeVar("ImageCT", bound="ImageCleaner")  # pylint: disable=invalid-name
 FolderCT = TypeVar("FolderCT", bound="Folder")  # pylint: disable=invalid-name
 
-# A couple of caches
-output_files: Dict[str, List[CT]] = {}  # This is used to store output files  - each element is a file clearner
-output_folders: Dict[str, FolderCT] = {}  # This is used to store output folders
+# Counters for the whole process,  whichever library the files are in
+stat_counts: Dict[str, int] = {'made': 0, 'saved': 0}  # How well the per object stat cache is doing
 
 # Inter-instance data
 PICTURE_FILES = ['.jpg', '.jpeg', '.tiff', '.tif', '.png', '.bmp', '.heic']
 MOVIE_FILES = ['.mov', '.avi', '.mp4']
 
 
-def make_cleaner_object(entry: Path) -> Union[FileCT, ImageCT, FolderCT]:
+def make_cleaner_object(entry: Path, size: Optional[int] = None, stat: Optional[os.stat_result] = None,
+                        library: Optional[Library] = None) -> Union[FileCT, ImageCT, FolderCT]:
     """
     shortcut for making Cleaner Objects,   if it is a folder,  check for a cached copy first.
     :param: entry  - A path object representing the folder or the file
+    :param: size  - The file size,  if the caller already knows it
+    :param: stat  - The stat result,  if the caller already has it (e.g. from a directory listing)
+    :param: library  - The library the object belongs to,  DEFAULT_LIBRARY if it is not part of an import
     :return:
     """
-    assert not entry.is_dir()  # entry must be a file
+    if stat:
+        assert not stat_module.S_ISDIR(stat.st_mode)  # entry must be a file
+    else:
+        assert not entry.is_dir()  # entry must be a file
 
     suffix = entry.suffix.lower()
     if suffix in PICTURE_FILES or suffix in MOVIE_FILES:
-        return ImageCleaner(entry)
-    return FileCleaner(entry)
+        return ImageCleaner(entry, size=size, stat=stat, library=library)
+    return FileCleaner(entry, size=size, stat=stat, library=library)
+
+
+def heic_to_jpeg(source: Path, new_name: Path) -> bool:  # pragma: win
+    """
+    Decode a HEIC file and save it as a JPEG with the same EXIF.   This only reads source,  so it can run in a worker
+    process (see backend.convert).
+    :param source:
+    :param new_name: This is replaced if it exists
+    :return: True if the JPEG was written,  files without EXIF are not converted
+    """
+    exif_dict = None
+    heif_file = pyheif.read(source)
+    image = Image.frombytes(heif_file.mode, heif_file.size, heif_file.data, "raw", heif_file.mode, heif_file.stride)
+    try:
+        for metadata in heif_file.metadata or []:
+            if 'type' in metadata and metadata['type'] == 'Exif':  # pragma: no branch
+                exif_dict = piexif.load(metadata['data'])
+        if exif_dict:
+            exif_bytes = piexif.dump(exif_dict)
+            image.save(new_name, format("JPEG"), exif=exif_bytes)
+            return True
+    except AttributeError as error:
+        logger.error('Conversion error: %s - Reason %s is no metadata attribute', source, error)
+    return False
+
+
 # Compile once for performance
 
 
@@ -64,32 +107,35 @@ FOLDER_PARSERS = [  # Used to loop over _get_date_from_path_name
     [re.compile(r'(.*)'), None, 0, '']  # Whatever we have must be the description (if any)
 ]
 
-FN_DATE = re.compile(r'^([1-2]\d{3})([0-1]\d)([0-3]\d)_\d{6}')
 YEAR = re.compile(r'^[1-2]\d{3}$')
 MONTH_OR_DAY = re.compile(r'^\d{2}$')
 CLEAN = re.compile(r'^[ \-_]+')
 SKIP_FOLDER = re.compile(r'^\d{8}-\d{6}$')
 
 
-class CleanerBase:
+class CleanerBase(TransferMixin):  # pylint: disable=too-many-instance-attributes, too-many-public-methods
     """
     A class to encapsulate the Path object that is going to be cleaned
     """
-    def __init__(self, path_entry: Path):
+    def __init__(self, path_entry: Path, size: Optional[int] = None, stat: Optional[os.stat_result] = None,
+                 library: Optional[Library] = None):
         self.path = path_entry
+        self.library = library if library else DEFAULT_LIBRARY  # Where we register,  and how files are relocated
 
         self._date = None
         self._metadate = False  # Is set when retrieving the date.
+        self._stat = stat
+        self._size = stat.st_size if stat and size is None else size
+        self.origin: Optional[Path] = None  # Where the content really is,  if we only pretended to relocate it
+        self.stamp: Optional[Tuple[int, int]] = None  # (mtime_ns,  inode) from the catalog,  checked on the first stat
 
     def __eq__(self, other) -> bool:
         if self.__class__ == other.__class__:
-            try:
-                if os.stat(self.path).st_ino == os.stat(other.path).st_ino:
+            if self.stat() and other.stat():
+                if self.is_same_file(other):
                     return True
-                if os.stat(self.path).st_size == os.stat(other.path).st_size:
-                    return cmp(self.path, other.path, shallow=False)
-            except FileNotFoundError:
-                logger.error('File %s or %s does not exists', self.path, other.path)
+                return self.same_content(other)
+            logger.error('File %s or %s does not exists', self.path, other.path)
         return False
 
     def __lt__(self, other) -> bool:
@@ -118,16 +164,157 @@ class CleanerBase:
         """
         return self._date
 
+    @property
+    def content_path(self) -> Path:
+        """
+        The file holding our content,  normally that is just path
+        :return:
+        """
+        return self.origin if self.origin else self.path
+
+    def stat(self) -> Optional[os.stat_result]:
+        """
+        Stat the file once per run,  the result is kept until the file is moved or changed (see invalidate_stat)
+        :return: stat result or None if the file does not exist
+        """
+        if self._stat is not None:
+            count(stat_counts, 'saved')
+            return self._stat
+        count(stat_counts, 'made')
+        try:
+            self._stat = os.stat(self.content_path)
+        except FileNotFoundError:
+            return None
+        if self.stamp:
+            stamp, self.stamp = self.stamp, None
+            if stamp != (self._stat.st_mtime_ns, self._stat.st_ino):
+                self.content_changed(self._stat)
+        return self._stat
+
+    def content_changed(self, stat: os.stat_result):
+        """
+        The file is not what the catalog said it was (it was edited in place),  forget what we knew about its content
+        and put it back in the content index and the catalog as it is now
+        :param stat: Its current stat
+        :return:
+        """
+        logger.debug('%s has changed since it was catalogued', self.path)
+        self.forget_content()
+        self._stat, self._size = stat, stat.st_size
+        self.library.registry.reindex(self)
+        if self.library.catalog:
+            self.library.catalog.add_file(self.path, stat)
+
+    def invalidate_stat(self):
+        """
+        The file has been moved or changed underneath us
+        :return:
+        """
+        self._stat = None
+
+    def is_same_file(self, other: CT) -> bool:
+        """
+        Test if two objects are the very same file (the same path or a hard link)
+        :param other:
+        :return:
+        """
+        mine, theirs = self.stat(), other.stat()
+        return bool(mine and theirs) and (mine.st_dev, mine.st_ino) == (theirs.st_dev, theirs.st_ino)
+
+    @property
+    def size(self) -> Optional[int]:
+        """
+        The file size,  cached since it is the first thing we compare on
+        :return: size in bytes or None if the file does not exist
+        """
+        if self._size is None:
+            stat = self.stat()
+            if not stat:
+                return None
+            self._size = stat.st_size
+        return self._size
+
+    @cached_property
+    def partial_digest(self) -> bytes:
+        """
+        Digest of the ends of the file,  cheap enough to tell most same sized files apart
+        :return:
+        """
+        return partial_digest(self.content_path, self.size)
+
+    @cached_property
+    def content_digest(self) -> bytes:
+        """
+        Digest of the whole file,  only calculated when the partial digests collide
+        :return:
+        """
+        return full_digest(self.content_path, self.size)
+
+    @property
+    def sampled_digest(self) -> bytes:
+        """
+        Digest of windows through the file,  only big movies have one
+        :return: empty if there is none
+        """
+        return b''
+
+    def same_content(self, other: CT) -> bool:
+        """
+        Tiered comparison of file contents,  size then partial digest then sampled digest then full digest.   Big movies
+        that match on their sampled digest are taken to be the same unless verify_movies is set.
+        :param other:
+        :return: True if the files are byte for byte the same
+        """
+        if self.size is None or self.size != other.size:
+            return False
+        try:
+            if self.partial_digest != other.partial_digest:
+                return False
+            if self.sampled_digest != other.sampled_digest:
+                return False
+            if self.sampled_digest and not self.library.verify_movies:
+                return True
+            return self.content_digest == other.content_digest
+        except OSError as error:
+            logger.error('Could not compare %s and %s (%s)', self.path, other.path, error)
+        return False
+
+    def read_comparisons(self):
+        """
+        Read the digests comparing this file with the registered ones will need (see get_registered),  on a worker
+        thread so the comparisons made later are cheap.   The registry may have changed by then,  anything this missed
+        is simply read when it is needed.
+        :return:
+        """
+        try:
+            for value in self.library.registry.candidates(self):
+                if value is self or value.__class__ != self.__class__:
+                    continue
+                if value.partial_digest != self.partial_digest or value.sampled_digest != self.sampled_digest:
+                    continue
+                if not self.sampled_digest or self.library.verify_movies:
+                    _ = self.content_digest, value.content_digest
+        except OSError as error:
+            logger.debug('Could not read ahead %s (%s)', self.path, error)
+
+    def forget_content(self):
+        """
+        The file has been modified,  drop anything we cached about the content
+        :return:
+        """
+        self._size = None
+        self._stat = None
+        self.__dict__.pop('partial_digest', None)
+        self.__dict__.pop('sampled_digest', None)
+        self.__dict__.pop('content_digest', None)
+
     @property
     def folder(self) -> Optional[FolderCT]:
         """
         Look up a cached folder for this element
         :return:
         """
-        key = self.path.parent.as_posix()
-        if key in output_folders:
-            return output_folders[key]
-        return None
+        return self.library.registry.get_folder(self.path.parent.as_posix())
 
     @property
     def is_small(self) -> bool:
@@ -137,50 +324,59 @@ class CleanerBase:
         """
         return False
 
+    @property
+    def perceptual_hash(self) -> Optional[int]:
+        """
+        Only pictures have a perceptual hash
+        :return:
+        """
+        return None
+
+    @property
+    def updates_metadata(self) -> bool:
+        """
+        Test if set_date will rewrite this file once it is relocated
+        :return:
+        """
+        return False
+
     @cached_property
     def registry_key(self) -> str:
         """
         Common key based on name,  cached for performance
         :return:
         """
-        target = self.path.stem.upper()
-        parsed = re.match('(.+)_[0-9]{1,2}$', target)
-        if parsed:
-            target = parsed.groups()[0]
-        return target
+        return registry_key(self.path)
 
     def register(self, base_folder: Path = None):
         """
         Register the existence of a file and update the folder count.
         :return:
         """
+        self.library.registry.add_file(self.registry_key, self)
+        if self.library.similar and self.perceptual_hash is not None:
+            self.library.similar.add(self.perceptual_hash, self)
 
-        if self.registry_key not in output_files:
-            output_files[self.registry_key] = []
-        output_files[self.registry_key].append(self)
+        if self.library.catalog and not self.library.planner:  # A planned file is catalogued once it is there
+            self.library.catalog.add_file(self.path, self.stat())
 
         if base_folder and not self.folder:
-            Folder(self.path.parent, base_folder, cache=True)
+            Folder(self.path.parent, base_folder, cache=True, library=self.library)
 
         if self.folder:
-            self.folder.count += 1
+            self.library.registry.count(self.folder, 1)
 
     def de_register(self):
         """
         Remove yourself from the list of registered FileClean objects
         """
-        if self.registry_key in output_files:
-            new_list = []
-            for value in output_files[self.registry_key]:
-                if not id(value) == id(self):
-                    new_list.append(value)
-                else:
-                    if self.folder:
-                        self.folder.count -= 1
-            if not new_list:
-                del output_files[self.registry_key]
-            else:
-                output_files[self.registry_key] = new_list
+        if self.library.similar:
+            self.library.similar.remove(self)
+        if self.library.registry.remove_file(self.registry_key, self):
+            if self.folder:
+                self.library.registry.count(self.folder, -1)
+            if self.library.catalog and not self.library.planner:
+                self.library.catalog.remove_file(self.path)
 
     def is_registered(self, by_file: bool = False, by_path: bool = False, new_path: Path = None) -> bool:
         """
@@ -192,7 +388,7 @@ class CleanerBase:
         """
         by_path = True if new_path else by_path
         if not by_path and not by_file:
-            return self.registry_key in output_files
+            return self.registry_key in self.library.registry.files
 
         return len(self.get_registered(by_file, by_path, new_path)) > 0
 
@@ -204,25 +400,20 @@ class CleanerBase:
         :param new_path:  Ensure a match on this other path
         :return:  object or None
         """
-        result = []
         by_path = True if new_path else by_path
 
-        if self.registry_key in output_files:
-            path_to_test = new_path if new_path else self.path
-            if path_to_test.is_file():
-                path_to_test = path_to_test.parent
-            for value in output_files[self.registry_key]:
-                if by_file and by_path:
-                    if self == value and value.path.parent == path_to_test:
-                        result.append(value)
-                elif by_path:
-                    if value.path.parent == path_to_test:
-                        result.append(value)
-                elif by_file:
-                    if self == value:
-                        result.append(value)
-                else:
+        if by_file:  # Exact copies under any name,  then anything with my name that compares equal (same picture)
+            result = self.library.registry.matches(self)
+            found = {id(value) for value in result}
+            for value in self.library.registry.files.get(self.registry_key, []):
+                if id(value) not in found and self == value:
                     result.append(value)
+        else:
+            result = list(self.library.registry.files.get(self.registry_key, []))
+
+        if by_path and result:
+            path_to_test = new_path if new_path else self.path.parent
+            result = [value for value in result if value.path.parent == path_to_test]
         return result
 
     # File manipulation
@@ -296,86 +487,17 @@ class CleanerBase:
 
         return path
 
-    # pylint: disable=too-many-arguments
-    def relocate_file(self, new_path: Path, base_folder: Path = None, remove: bool = False, rollover: bool = True,
-                      register: bool = False):
-        """
-        :param new_path: A string representation of the folder
-        :param base_folder: The root of the output folder
-        :param remove: A boolean (default: False) Once successful on the relocate,   remove the original
-        :param rollover: A boolean (default: True) rollover an existing file if it exists otherwise ignore
-        :param register: A boolean (default:False), register this value after the move
-        directory does not exist abort!
-        :return:
-        """
-        new_file = None
-        copied = False
-        if new_path:
-            if not new_path.exists():
-                os.makedirs(new_path)
-            new_file = new_path.joinpath(self.path.name)
-            if self.path == new_file:  # pragma: no cover
-                logger.debug('Will not copy to myself %s', new_file)
-                return
-            if new_file.exists():
-                if rollover:
-                    logger.debug('Rolling over %s', new_file)
-                    self.rollover_file(new_file)
-                else:
-                    logger.debug('Will not overwrite %s', new_file)
-                    copied = True
-
-            if not new_file.exists():
-                try:
-                    copyfile(str(self.path), new_file)
-                    copied = True
-                except PermissionError as error:  # pragma: no cover
-                    logger.error('Can not write to %s - %s', new_path, error)
-
-        if remove and copied:
-            try:
-                self.de_register()
-                os.unlink(self.path)
-            except OSError as error:   # pragma: no cover
-                logger.debug('%s could not be removed (%s)', self.path, error)
-
-        if copied:
-            self.path = new_file
-            self.set_date()
-
-        if register and new_file and copied:
-            self.register(base_folder=base_folder)
-
-    @staticmethod
-    def rollover_file(destination: Path):
-        """
-        Allow up to 20 copies of a file before removing the oldest
-        file.type
-        file_0.type
-        file_1.type
-        etc
-        :return:
-        """
-        if destination.exists():
-            for increment in reversed(range(20)):  # 19 -> 0
-                old_path = destination.parent.joinpath(f'{destination.stem}_{increment}{destination.suffix}')
-                if old_path.exists():
-                    new_path = destination.parent.joinpath(f'{destination.stem}_{increment + 1}{destination.suffix}')
-                    if new_path.exists():
-                        os.unlink(new_path)
-                    os.rename(old_path, new_path)
-            os.rename(destination, destination.parent.joinpath(f'{destination.stem}_0{destination.suffix}'))
-
     @classmethod
     def clear_caches(cls):
         """
-        Get rid of all that cheesy persistent class data
+        Get rid of all that cheesy persistent data,  the counters and the library of objects made without one
         :return:
         """
-        output_files.clear()
-        output_folders.clear()
+        DEFAULT_LIBRARY.clear()
+        stat_counts.update(made=0, saved=0)
+        move_counts.update(renamed=0, cloned=0, linked=0, bytes_avoided=0)
 
-    def set_date(self):  # pragma: no cover
+    def set_date(self, path: Optional[Path] = None):  # pragma: no cover
         """
         Just a stub,  nothing to see here - move along
         """
@@ -396,8 +518,9 @@ class Folder(CleanerBase):
         Anything,  that is not garbage or not a number/date is removed and the path portion is returned
     """
 
-    def __init__(self, path_entry: Path, base_entry: Path, internal: bool = False, cache: bool = True):
-        super().__init__(path_entry)
+    def __init__(self, path_entry: Path, base_entry: Path, internal: bool = False, cache: bool = True,
+                 library: Optional[Library] = None):
+        super().__init__(path_entry, library=library)
         self.internal = internal  # Bool to indicate this is an internal folder so no need to process it
 
         self.dates: Dict = {
@@ -414,8 +537,8 @@ class Folder(CleanerBase):
         key = self.path.as_posix()
         # May 3rd,  added and self.date to if.
         # if cache and key not in output_folders and self.date:  # Only cache output folders and they must have a date
-        if cache and key not in output_folders:
-            output_folders[key] = self
+        if cache:
+            self.library.registry.add_folder(key, self)
 
         if internal:
             self.description = ''  # Override description on internal folders
@@ -423,28 +546,25 @@ class Folder(CleanerBase):
         # print(f'{self.path} : {self.date} : {self.count} : {self.description} : {base_entry}')
 
     @classmethod
-    def is_internal(cls, path: Path) -> bool:
+    def is_internal(cls, path: Path, library: Optional[Library] = None) -> bool:
         """
         Check the cache to see if a FolderData instance exists and if it is an internal folder
         :param path:
+        :param library: Where to look,  DEFAULT_LIBRARY if not given
         :return:
         """
-        key = path.as_posix()
-        if key in output_folders and output_folders[key].internal:
-            return True
-        return False
+        folder = cls.get_folder(path, library)
+        return bool(folder and folder.internal)
 
     @classmethod
-    def get_folder(cls, path: Path) -> Union[FolderCT, None]:
+    def get_folder(cls, path: Path, library: Optional[Library] = None) -> Union[FolderCT, None]:
         """
         Parse the cache and return a Folder instance (if it exists)
         :param path:
+        :param library: Where to look,  DEFAULT_LIBRARY if not given
         :return:
         """
-        path_str = path.as_posix()
-        if path_str in output_folders:
-            return output_folders[path_str]
-        return None
+        return (library if library else DEFAULT_LIBRARY).registry.get_folder(path.as_posix())
 
     @property
     def date(self) -> Optional[datetime]:
@@ -541,7 +661,8 @@ class FileCleaner(CleanerBase):
         Test if it is a file and it's not 0
         :return:
         """
-        return self.path.is_file() and self.path.stat().st_size != 0
+        stat = self.stat()
+        return bool(stat) and stat_module.S_ISREG(stat.st_mode) and stat.st_size != 0
 
     @property
     def is_small(self):  # pragma: no cover
@@ -558,22 +679,28 @@ class FileCleaner(CleanerBase):
         :return:
         """
         if not self._date:
-            self._date = datetime.fromtimestamp(int(os.stat(self.path).st_mtime))
+            self._date = datetime.fromtimestamp(int(self.stat().st_mtime))
         return self._date
 
 
-class ImageCleaner(CleanerBase):
+class ImageCleaner(ImageMetadataMixin, CleanerBase):
     """
     A class to encapsulate the image file Path object that is going to be cleaned
     """
     CONVERSION_SUFFIX = ['.'
                          'HEIC', ]
 
-    def __init__(self, path_entry: Path):
-        super().__init__(path_entry)
+    def __init__(self, path_entry: Path, size: Optional[int] = None, stat: Optional[os.stat_result] = None,
+                 library: Optional[Library] = None):
+        super().__init__(path_entry, size=size, stat=stat, library=library)
 
         self._image = None
-        self._image_data = []
+        self._image_data: Optional[bytes] = None  # Fingerprint of the pixel histograms
+        self._perceptual_hash = None
+        self._dimensions: Optional[Tuple[int, int]] = None  # (width,  height) once the picture has been decoded
+        self._decoded = False  # Set once decode has been tried
+        self._date_probed = False  # Set when we already know the image has no metadata date
+        self._sidecar_date = False  # Set when the date came from our sidecar
 
     def __eq__(self, other: ImageCT):
         """
@@ -583,7 +710,7 @@ class ImageCleaner(CleanerBase):
         """
         result = super().__eq__(other)
         if not result and other.__class__.__name__ == self.__class__.__name__:
-            return self.image_data == other.image_data
+            return self.image_data is not None and self.image_data == other.image_data
         return result
 
     def __lt__(self, other):
@@ -608,16 +735,39 @@ class ImageCleaner(CleanerBase):
                 return self.date < other.date
         return False
 
+    @cached_property
+    def sampled_digest(self) -> bytes:
+        """
+        Big movies are compared on their size,  windows through the file and their duration (see sampled_digest) rather
+        than reading gigabytes of each
+        :return: empty for pictures and small movies
+        """
+        if self.path.suffix.lower() not in MOVIE_FILES or (self.size or 0) < SAMPLE_MINIMUM:
+            return b''
+        duration = movie_duration(self.content_path)
+        return sampled_digest(self.content_path, self.size, str(duration).encode() if duration else b'')
+
     @property
     def is_valid(self) -> bool:
         """
         Test if a file is valid (is a file and not 0
         :return:
         """
-        return self.path.is_file() and self.path.stat().st_size != 0
+        stat = self.stat()
+        return bool(stat) and stat_module.S_ISREG(stat.st_mode) and stat.st_size != 0
 
     @cached_property
     def is_small(self):
+        """
+        Cheapest first,  the file size then the dimensions from the headers (see probe_dimensions) and only then PIL
+        :return:
+        """
+        if self.size and self.size > SMALL_IMAGE_BYTES:
+            return False
+        if not self._dimensions:
+            self._dimensions = probe_dimensions(self.content_path)
+        if self._dimensions:
+            return self._dimensions[0] <= SMALL_IMAGE and self._dimensions[1] <= SMALL_IMAGE
         opened = False
         small = False
         if not self._image:
@@ -631,48 +781,47 @@ class ImageCleaner(CleanerBase):
         return small
 
     @property
-    def date(self) -> Optional[datetime]:
+    def dimensions(self) -> Optional[Tuple[int, int]]:
         """
-        return the cached date or go and try and fetch it
-        :return: datetime or None
+        :return: (width,  height) if is_small or decode has found them
         """
-        if not self._date:
-            self._date = self.get_date_from_image()
-            if not self._date:  # Short circuit to find a date
-                try:
-                    temp = self._date = FN_DATE.match(self.path.stem).groups()
-                    self._date = datetime(int(temp[0]), int(temp[1]), int(temp[2]))
-                except AttributeError:  #os.stat(self.path).st_size == os.stat(other.path).st_size
-                    pass
-                except ValueError:  # pragma: no cover
-                    pass
-                if not self._date:
-                    self._date = self.folder.date if self.folder else None
-            else:
-                self._metadate = True
-        return self._date
+        return self._dimensions
 
-    # Ensure we have a date for the existing image
-    def set_date(self):
-        # original_file: Path, new_date: Union[datetime, None]):  # pragma: no cover
+    def content_changed(self, stat: os.stat_result):
+        """
+        The pixels may have changed too,  see CleanerBase.content_changed
+        :param stat:
+        :return:
         """
-        If we have a date, and we did not get it from the original image,  set the 'Digitized' date.
+        self._image_data = self._perceptual_hash = self._dimensions = None
+        self._decoded = False
+        self.__dict__.pop('is_small', None)
+        super().content_changed(stat)
 
-        :return: None
+    def transfer(self, operation: Operation) -> Outcome:
         """
-        if not self._metadate and self.date:
+        A moved image takes its sidecar (ours or any other program's) with it
+        :param operation:
+        :return:
+        """
+        outcome = super().transfer(operation)
+        sidecar = sidecar_path(operation.source)
+        if outcome.removed and sidecar.exists():
             try:
-                exif_dict = piexif.load(str(self.path))
-
-                new_date = self.date.strftime("%Y:%m:%d %H:%M:%S")
-                exif_dict['Exif'][piexif.ExifIFD.DateTimeDigitized] = new_date
+                os.replace(sidecar, sidecar_path(operation.destination))
+            except OSError as error:  # pragma: no cover
+                logger.debug('Could not move %s (%s)', sidecar, error)
+        return outcome
 
-                # Save changes
-                exif_bytes = piexif.dump(exif_dict)
-                piexif.insert(exif_bytes, str(self.path))
-
-            except piexif.InvalidImageDataError:
-                pass  # This is to be expected
+    def read_comparisons(self):
+        """
+        Same named pictures are compared on their pixels too (see __eq__).   Only our own picture is decoded,  the
+        registered ones may be decoded for another decision at the same time.
+        :return:
+        """
+        super().read_comparisons()
+        if any(value is not self for value in self.library.registry.files.get(self.registry_key, [])):
+            self.load_image_data()
 
     def close_image(self):
         """
@@ -690,38 +839,61 @@ class ImageCleaner(CleanerBase):
         """
         if not self._image:
             try:
-                self._image = Image.open(self.path)
+                self._image = Image.open(self.content_path)
             except UnidentifiedImageError as error:
                 logger.debug('open_image UnidentifiedImageError %s - %s', self.path, error.strerror)
             except OSError as error:
                 logger.debug('open_image OSError %s - %s', self.path, error.strerror)
         return self._image
 
+    def decode(self):
+        """
+        Decode the picture once,  at reduced resolution (see reduced_image),  and derive everything that needs the
+        pixels from that one decode.   Only the results are kept,  these objects live for the whole run.
+        :return:
+        """
+        if self._decoded:
+            return
+        self._decoded = True
+        try:
+            image, self._dimensions = reduced_image(self.content_path)
+        except (UnidentifiedImageError, OSError, ValueError) as error:
+            logger.debug('decode failed %s - %s', self.path, error)
+            return
+        with image:
+            if self._image_data is None:
+                histogram = array('L', image.histogram())  # Every band,  one after the other
+                self._image_data = blake2b(histogram.tobytes(), digest_size=16).digest()
+            if self._perceptual_hash is None and self.path.suffix.lower() in PICTURE_FILES:
+                self._perceptual_hash = dhash(image)
+
     def load_image_data(self):
         """
-        Load the image data,  actual picture not metadata
+        Load the image data,  actual picture not metadata.   Only a 16 byte digest of the histograms is kept.
         :return:
         """
-        opened = False
-        if not self._image_data:
-            if not self._image:
-                self.open_image()
-                opened = True
-            if self._image:
-                try:
-                    for val in self._image.getdata().split():
-                        self._image_data.append(val.histogram())
-                except OSError:  # pragma: no cover
-                    logger.error('Warning - failed to read image: %s', self.path)
-                    self._image = None
-        if opened:
-            self.close_image()
+        if self._image_data is None:
+            self.decode()
+
+    @property
+    def perceptual_hash(self) -> Optional[int]:
+        """
+        dHash of the picture,  images that look the same have hashes a small Hamming distance apart
+        :return: 64 bit int or None if this is not a picture we can decode
+        """
+        if self._perceptual_hash is None and self.path.suffix.lower() in PICTURE_FILES:
+            self.decode()
+        return self._perceptual_hash
+
+    @perceptual_hash.setter
+    def perceptual_hash(self, value: Optional[int]):
+        self._perceptual_hash = value
 
     @property
-    def image_data(self):
+    def image_data(self) -> Optional[bytes]:
         """
         Load image date and return as an element
-        :return:
+        :return: The fingerprint or None if the image could not be read
         """
         self.load_image_data()
         return self._image_data
@@ -760,57 +932,10 @@ class ImageCleaner(CleanerBase):
                 new_name.unlink()
                 logger.debug('Cleaning up %s - It already exists', new_name)
 
-            exif_dict = None
-            heif_file = pyheif.read(original_name)
-            image = Image.frombytes(heif_file.mode, heif_file.size, heif_file.data, "raw",
-                                    heif_file.mode, heif_file.stride)
-            try:
-                for metadata in heif_file.metadata or []:
-                    if 'type' in metadata and metadata['type'] == 'Exif':  # pragma: no branch
-                        exif_dict = piexif.load(metadata['data'])
-                if exif_dict:
-                    exif_bytes = piexif.dump(exif_dict)
-                    image.save(new_name, format("JPEG"), exif=exif_bytes)
-                    if migrated_base:
-                        self.relocate_file(migrated_base, remove=remove, rollover=False)
-                    elif remove:
-                        original_name.unlink()
-                    return ImageCleaner(Path(new_name))
-            except AttributeError as error:
-                logger.error('Conversion error: %s - Reason %s is no metadata attribute', self.path, error)
+            if heic_to_jpeg(original_name, new_name):
+                if migrated_base:
+                    self.relocate_file(migrated_base, remove=remove, rollover=False)
+                elif remove:
+                    original_name.unlink()
+                return ImageCleaner(Path(new_name), library=self.library)
         return self
-
-    def get_date_from_image(self) -> Union[datetime, None]:  # pylint: disable=inconsistent-return-statements
-        """
-        Given an Image object,  attempt to extract the date it was take at
-        :return: datetime
-        """
-
-        image_date = None
-        try:
-            exif_dict = piexif.load(str(self.path))
-            if exif_dict:
-                try:
-                    image_date = exif_dict['Exif'][piexif.ExifIFD.DateTimeOriginal]
-                except KeyError:
-                    try:
-                        image_date = exif_dict['Exif'][piexif.ExifIFD.DateTimeDigitized]
-                    except KeyError:
-                        try:
-                            image_date = exif_dict['0th'][piexif.ImageIFD.DateTime]
-                        except KeyError:
-                            pass
-
-            if image_date:
-                try:
-                    date_value, _ = str(image_date, 'utf-8').split(' ')
-                    return datetime.strptime(date_value, '%Y:%m:%d')
-                except ValueError:  # pragma: no cover
-                    logger.debug('Corrupt date data %s', self.path)
-            else:
-                logger.debug('Could not find a date in %s', self.path)
-
-        except piexif.InvalidImageDataError:
-            logger.debug('Failed to load %s - Invalid JPEG/TIFF', self.path)
-        except FileNotFoundError:
-            logger.debug('Failed to load %s - File not Found', self.path)
@@ -0,0 +1,174 @@
+"""
+Content based lookups for registered files.   Files are bucketed by size,  only when two files share a size do we read
+them,  first the ends of the file (partial digest),  then for big movies windows through the file (sampled digest) and
+only if those match the whole file (full digest).
+"""
+import logging
+
+from hashlib import blake2b
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, TypeVar
+
+logger = logging.getLogger('Cleaner')
+
+PARTIAL_BLOCK = 64 * 1024  # Bytes read from each end of a file for the partial digest
+READ_BLOCK = 1024 * 1024
+SAMPLE_WINDOWS = 8  # Windows of READ_BLOCK bytes,  evenly spaced from the start to the end,  for the sampled digest
+SAMPLE_MINIMUM = 64 * 1024 * 1024  # Smaller files are cheap enough to read in full
+DIGEST_SIZE = 16
+
+CT = TypeVar("CT", bound="CleanerBase")  # pylint: disable=invalid-name
+
+
+def partial_digest(path: Path, size: int) -> bytes:
+    """
+    Hash the first and last PARTIAL_BLOCK bytes of a file,  small files are hashed completely
+    :param path:
+    :param size: The size of the file
+    :return: digest bytes
+    """
+    digest = blake2b(digest_size=DIGEST_SIZE)
+    with open(path, 'rb') as file:
+        digest.update(file.read(PARTIAL_BLOCK))
+        if size > 2 * PARTIAL_BLOCK:
+            file.seek(-PARTIAL_BLOCK, 2)
+        digest.update(file.read(PARTIAL_BLOCK))
+    return digest.digest()
+
+
+def full_digest(path: Path, size: int) -> bytes:
+    """
+    Hash the whole file,  if the partial digest already covered all of it,  just use that
+    :param path:
+    :param size: The size of the file
+    :return: digest bytes
+    """
+    if size <= 2 * PARTIAL_BLOCK:
+        return partial_digest(path, size)
+    digest = blake2b(digest_size=DIGEST_SIZE)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(READ_BLOCK), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def sampled_digest(path: Path, size: int, extra: bytes = b'') -> bytes:
+    """
+    Hash the size and SAMPLE_WINDOWS fixed windows of a file,  a handful of seeks rather than reading all of it.   Files
+    that differ only between the windows have the same sampled digest,  so this is only for files where that is
+    (nearly) impossible,  like compressed video.
+    :param path:
+    :param size: The size of the file
+    :param extra: Anything else that should match,  a movie's duration for instance
+    :return: digest bytes
+    """
+    digest = blake2b(size.to_bytes(8, 'big') + extra, digest_size=DIGEST_SIZE)
+    step = max(size - READ_BLOCK, 0) // (SAMPLE_WINDOWS - 1)
+    with open(path, 'rb') as file:
+        for window in range(SAMPLE_WINDOWS):
+            file.seek(window * step)
+            digest.update(file.read(READ_BLOCK))
+    return digest.digest()
+
+
+class ContentIndex:
+    """
+    Registered files keyed by content.   Digests are computed lazily,  only when a size collision needs them.
+    """
+    def __init__(self):
+        self.sizes: Dict[int, Dict[int, CT]] = {}  # size -> id(obj) -> obj
+        self._where: Dict[int, int] = {}  # id(obj) -> the size it was indexed under
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.sizes.values())
+
+    def clear(self):
+        """
+        Forget everything
+        :return:
+        """
+        self.sizes.clear()
+        self._where.clear()
+
+    def add(self, obj: CT):
+        """
+        Add a cleaner object to the index
+        :param obj:
+        :return:
+        """
+        size = obj.size
+        if size is not None and id(obj) not in self._where:
+            self.sizes.setdefault(size, {})[id(obj)] = obj
+            self._where[id(obj)] = size
+
+    def remove(self, obj: CT):
+        """
+        Remove a cleaner object from the index (if it is there)
+        :param obj:
+        :return:
+        """
+        size = self._where.pop(id(obj), None)
+        if size is not None:
+            bucket = self.sizes[size]
+            bucket.pop(id(obj), None)
+            if not bucket:
+                del self.sizes[size]
+
+    def reindex(self, obj: CT):
+        """
+        Move an indexed object to the bucket for its current size (it changed on disk)
+        :param obj:
+        :return:
+        """
+        if id(obj) in self._where:
+            self.remove(obj)
+            self.add(obj)
+
+    def candidates(self, obj: CT) -> List[CT]:
+        """
+        The indexed objects that could have the same content as obj,  the ones the same size
+        :param obj:
+        :return: A list of cleaner objects (obj itself is included if it is indexed)
+        """
+        size: Optional[int] = obj.size
+        return list(self.sizes.get(size, {}).values()) if size is not None else []
+
+    def matches(self, obj: CT) -> List[CT]:
+        """
+        Find all the indexed objects with exactly the same content as obj
+        :param obj:
+        :return: A list of cleaner objects (obj itself is included if it is indexed)
+        """
+        result = []
+        for value in self.candidates(obj):
+            if value is obj or (value.__class__ == obj.__class__ and obj.same_content(value)):
+                result.append(value)
+        return result
+
+    def duplicates(self) -> Iterator[List[CT]]:
+        """
+        Every group of indexed objects sharing the same content,  digests are only calculated for sizes that collide
+        :return: lists of two or more cleaner objects
+        """
+        for size, bucket in self.sizes.items():
+            if size == 0 or len(bucket) < 2:
+                continue
+            for candidates in self._group(list(bucket.values()), 'partial_digest'):
+                for sampled in self._group(candidates, 'sampled_digest'):
+                    yield from self._group(sampled, 'content_digest')  # Always,  the duplicates may be replaced
+
+    @staticmethod
+    def _group(objs: List[CT], digest: str) -> List[List[CT]]:
+        """
+        Split objects by one of their digests
+        :param objs:
+        :param digest: The name of the digest attribute
+        :return: The groups with more than one member
+        """
+        groups: Dict[bytes, List[CT]] = {}
+        for obj in objs:
+            try:
+                groups.setdefault(getattr(obj, digest), []).append(obj)
+            except OSError as error:
+                logger.error('Could not read %s (%s)', obj.path, error)
+        return [group for group in groups.values() if len(group) > 1]
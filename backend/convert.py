@@ -0,0 +1,67 @@
+"""
+Convert HEIC files to JPEG in worker processes.   Decoding a HEIC file is all CPU,  so a folder of them is converted
+in parallel before its files are decided on,  the JPEGs are then imported in place of the originals.
+"""
+import asyncio
+import logging
+
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# pylint: disable=import-error
+from backend.cleaner import heic_to_jpeg, ImageCleaner
+
+logger = logging.getLogger('Cleaner')
+
+
+def convert_file(path: str, new_name: str) -> bool:  # pragma: win
+    """
+    Runs in a worker process
+    :param path: The HEIC file
+    :param new_name: The JPEG to write
+    :return: True if it was converted
+    """
+    return heic_to_jpeg(Path(path), Path(new_name))
+
+
+def conversion_names(images: List[ImageCleaner], work_dir: Path) -> List[Path]:
+    """
+    Where to put each conversion,  they keep their names (which the decisions depend on) so files differing only by
+    the case of their suffix are put in sub folders
+    :param images:
+    :param work_dir:
+    :return: A JPEG path for each image
+    """
+    seen: Dict[str, int] = {}
+    names = []
+    for image in images:
+        stem = image.path.stem.lower()
+        folder = work_dir.joinpath(str(seen[stem])) if stem in seen else work_dir
+        seen[stem] = seen.get(stem, 0) + 1
+        names.append(folder.joinpath(f'{image.path.stem}.jpg'))
+    return names
+
+
+async def convert_images(executor: Executor, images: List[ImageCleaner],
+                         work_dir: Path) -> List[Tuple[ImageCleaner, ImageCleaner]]:
+    """
+    Convert a batch of HEIC files in parallel
+    :param executor: A process pool
+    :param images: The HEIC files
+    :param work_dir: Where to write the JPEGs
+    :return: (original,  conversion) for each file that was converted
+    """
+    loop = asyncio.get_running_loop()
+    names = conversion_names(images, work_dir)
+    for folder in {name.parent for name in names}:
+        folder.mkdir(parents=True, exist_ok=True)
+    futures = [loop.run_in_executor(executor, convert_file, str(image.content_path), str(name))
+               for image, name in zip(images, names)]
+    converted = []
+    for image, name, result in zip(images, names, await asyncio.gather(*futures, return_exceptions=True)):
+        if isinstance(result, BaseException):
+            logger.error('Conversion of %s failed - %s', image.path, result)
+        elif result:
+            converted.append((image, ImageCleaner(name, library=image.library)))
+    return converted
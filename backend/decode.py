@@ -0,0 +1,31 @@
+"""
+Decode pictures at reduced resolution.   Everything we work out from the pixels (fingerprints,  perceptual hashes)
+needs a few hundred pixels a side at most,  so there is no point paying for the full decode of a 48MP camera file.
+"""
+from pathlib import Path
+from typing import Tuple
+
+from PIL import Image
+
+REDUCED_SIZE = 256  # The short side of a reduced image is at least this and less than twice it (if the image is bigger)
+REDUCIBLE_MODES = ('L', 'RGB', 'RGBA', 'CMYK')  # Image.reduce does not handle palettes or 16 bit greys
+
+
+def reduced_image(path: Path) -> Tuple[Image.Image, Tuple[int, int]]:
+    """
+    Decode a picture to its canonical reduced RGB image.   A JPEG is decoded straight to 1/2,  1/4 or 1/8 scale (see
+    Image.draft),  anything else is decoded and then reduced by whole pixel blocks.
+    :param path:
+    :return: (The reduced image,  the (width,  height) of the full image)
+    :raises: UnidentifiedImageError or OSError if it is not a picture we can decode
+    """
+    with Image.open(path) as image:
+        size = image.size
+        image.draft('RGB', (REDUCED_SIZE, REDUCED_SIZE))
+        if image.mode not in REDUCIBLE_MODES:
+            image = image.convert('RGB')
+        factor = min(image.size) // REDUCED_SIZE
+        reduced = image.reduce(factor) if factor > 1 else image.copy()
+    if reduced.mode != 'RGB':
+        reduced = reduced.convert('RGB')
+    return reduced, size
@@ -0,0 +1,293 @@
+"""
+Apply an import plan with the file system work spread over worker threads
+"""
+import asyncio
+import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# pylint: disable=import-error
+from backend.registry import registry_key
+from backend.plan import Operation, Outcome
+
+logger = logging.getLogger('Cleaner')
+
+MB = 1024 * 1024
+
+
+class DeviceLoad:
+    """
+    How much data went through a device,  and over how long
+    """
+    def __init__(self, folder: Path):
+        self.folder = folder  # Somewhere on the device,  to put a name to it
+        self.bytes = 0
+        self.started: Optional[float] = None
+        self.ended: Optional[float] = None
+
+    def add(self, size: int, started: float, ended: float):
+        """
+        Account for one operation
+        :param size: bytes copied
+        :param started: time.monotonic() values
+        :param ended:
+        :return:
+        """
+        self.bytes += size
+        self.started = started if self.started is None else min(self.started, started)
+        self.ended = ended if self.ended is None else max(self.ended, ended)
+
+    @property
+    def seconds(self) -> float:
+        """
+        From the first operation starting to the last one ending
+        :return:
+        """
+        return self.ended - self.started if self.started is not None else 0.0
+
+    @property
+    def rate(self) -> float:
+        """
+        :return: MB/s
+        """
+        return self.bytes / MB / self.seconds if self.seconds else 0.0
+
+
+class Devices:
+    """
+    The devices operations use,  how many operations may use each at once and how much data went through them
+    """
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.loads: Dict[int, DeviceLoad] = {}
+        self._folders: Dict[Path, int] = {}  # Folder -> device,  each folder is only looked at once
+        self._limits: Dict[int, asyncio.Semaphore] = {}
+
+    def device(self, folder: Path) -> int:
+        """
+        Find the device of a folder,  one that does not exist yet will be made on its parent's device
+        :param folder:
+        :return: st_dev
+        """
+        if folder not in self._folders:
+            try:
+                self._folders[folder] = os.stat(folder).st_dev
+            except FileNotFoundError:
+                self._folders[folder] = self.device(folder.parent) if folder.parent != folder else 0
+        return self._folders[folder]
+
+    def add(self, folder: Path):
+        """
+        Get ready for operations using this folder
+        :param folder:
+        :return:
+        """
+        device = self.device(folder)
+        if device not in self._limits:
+            self._limits[device] = asyncio.Semaphore(self.workers)
+            self.loads[device] = DeviceLoad(folder)
+
+    def used_by(self, operation: Operation) -> List[int]:
+        """
+        :param operation:
+        :return: The devices an operation uses,  always in the same order so no two operations can deadlock
+        """
+        return sorted({self.device(operation.source.parent), self.device(operation.destination.parent)})
+
+    async def acquire(self, devices: List[int]):
+        """
+        Wait for a turn on each of these devices
+        :param devices: from used_by
+        :return:
+        """
+        for device in devices:
+            await self._limits[device].acquire()
+
+    def release(self, devices: List[int]):
+        """
+        :param devices: from used_by
+        :return:
+        """
+        for device in devices:
+            self._limits[device].release()
+
+
+class PlanExecutor:
+    """
+    Do the operations of a plan (see ImageClean.plan) on a pool of threads.
+
+    At most workers operations use a device (as source or destination) at once,  so a slow card reader does not hold
+    up the library disk and no disk is thrashed by more copies than it can stream.   An operation only waits for the
+    ones before it that touch the same file name,  a rollover has to finish before the next file of that name arrives
+    and a duplicate has to move out of the way before its replacement moves in.
+
+    The file system work is CleanerBase.transfer,  everything that touches the registry stays on the event loop.
+    Operations can be submitted as they are decided (see ImageClean.import_folder) or all at once with execute.
+    """
+    def __init__(self, workers: int = 2, backlog: int = 256):
+        self.devices = Devices(workers)
+        self.failed: List[Operation] = []  # The operations that did not happen
+        self._backlog = asyncio.Semaphore(backlog)  # Operations submitted but not yet done
+        self._last: Dict[str, asyncio.Future] = {}  # The latest operation on each file name
+        self._sizes: Dict[int, Set[asyncio.Future]] = {}  # The operations in progress on files of each size
+        self._tasks: Set[asyncio.Task] = set()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def failures(self) -> int:
+        """
+        :return: How many operations did not happen
+        """
+        return len(self.failed)
+
+    async def execute(self, operations: Iterable[Operation]):
+        """
+        Do the operations,  and wait for them all to finish
+        :param operations: in plan order
+        :return:
+        """
+        try:
+            for operation in operations:
+                await self.submit(operation)
+            await self.drain()
+        finally:
+            self.close()
+
+    async def submit(self, operation: Operation):
+        """
+        Queue an operation,  this waits if the backlog is full
+        :param operation: Operations must be submitted in plan order
+        :return:
+        """
+        await self._backlog.acquire()
+        loop = asyncio.get_running_loop()
+        if not self._pool:
+            self._pool = ThreadPoolExecutor(thread_name_prefix='transfer')  # The limits bound how many are busy
+        for folder in (operation.source.parent, operation.destination.parent):
+            self.devices.add(folder)
+        task = loop.create_task(self._execute(loop, operation, *self._order(loop, operation)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def wait_for(self, name: str, size: Optional[int]):
+        """
+        Wait for the operations on files a decision about this one could look at,  ones with the same name and ones
+        with the same size (they might have the same content)
+        :param name: registry key
+        :param size:
+        :return:
+        """
+        waits = set(self._sizes.get(size, set()))
+        if name in self._last:
+            waits.add(self._last[name])
+        if waits:
+            await asyncio.wait(waits)
+
+    async def drain(self):
+        """
+        Wait for everything submitted so far
+        :return:
+        """
+        if self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    def close(self):
+        """
+        Stop the worker threads,  submit starts them again
+        :return:
+        """
+        if self._pool:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _order(self, loop: asyncio.AbstractEventLoop,
+               operation: Operation) -> Tuple[List[asyncio.Future], asyncio.Future]:
+        """
+        Queue an operation behind the earlier ones that use the same file names
+        :param loop:
+        :param operation:
+        :return: (What to wait for,  what to complete once done)
+        """
+        keys = {registry_key(operation.source), registry_key(operation.destination)}
+        waits = [self._last[key] for key in keys if key in self._last]
+        done = loop.create_future()
+        for key in keys:
+            self._last[key] = done
+        size = operation.obj.size if operation.obj else None
+        self._sizes.setdefault(size, set()).add(done)
+        done.add_done_callback(partial(self._forget, keys, size))
+        return waits, done
+
+    def _forget(self, keys: Set[str], size: Optional[int], done: asyncio.Future):
+        for key in keys:
+            if self._last.get(key) is done:
+                del self._last[key]
+        self._sizes[size].discard(done)
+        if not self._sizes[size]:
+            del self._sizes[size]
+
+    async def _execute(self, loop: asyncio.AbstractEventLoop, operation: Operation, waits: List[asyncio.Future],
+                       done: asyncio.Future):
+        """
+        Do one operation once it is its turn and its devices are free
+        """
+        try:
+            if waits:
+                await asyncio.wait(waits)
+            devices = self.devices.used_by(operation)
+            await self.devices.acquire(devices)
+            try:
+                started = time.monotonic()
+                outcome = await loop.run_in_executor(self._pool, operation.obj.transfer, operation)
+                ended = time.monotonic()
+            finally:
+                self.devices.release(devices)
+            for device in devices:
+                self.devices.loads[device].add(outcome.written, started, ended)
+            if outcome.copied:
+                self.settle(operation, outcome)
+            else:  # transfer has already said why
+                self.fail(operation)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            # Whatever went wrong only this operation is lost,  the others (and the event loop) carry on
+            logger.error('Could not %s %s to %s (%s)', operation.action, operation.source, operation.destination,
+                         error)
+            self.fail(operation)
+        finally:
+            done.set_result(None)
+            self._backlog.release()
+
+    def fail(self, operation: Operation):
+        """
+        The registry has the object where the plan put it,  put it back where it really is
+        :param operation:
+        :return:
+        """
+        self.failed.append(operation)
+        operation.obj.revert(operation)
+
+    @staticmethod
+    def settle(operation: Operation, outcome: Outcome):
+        """
+        The registry already has the object where the plan put it,  it only has to stop reading from the old place
+        :param operation:
+        :param outcome:
+        :return:
+        """
+        obj = operation.obj
+        if outcome.copied and obj.content_path == operation.source:
+            obj.origin = None if operation.destination == obj.path else operation.destination
+            if not outcome.renamed:
+                obj.invalidate_stat()
+
+    def report(self) -> List[str]:
+        """
+        :return: A line per device,  with how fast data was copied through it
+        """
+        return [f'Device {device} ({load.folder}): {load.bytes / MB:.1f} MB in {load.seconds:.1f}s '
+                f'({load.rate:.1f} MB/s)' for device, load in sorted(self.devices.loads.items())]
@@ -0,0 +1,56 @@
+"""
+Extract the CPU heavy attributes of image files in worker processes.   Workers only read files,  they hand back small
+picklable results that are applied to the cleaner objects so all decisions stay in the main process.
+"""
+import asyncio
+import logging
+
+from concurrent.futures import Executor
+from functools import partial
+from pathlib import Path
+from typing import Dict, List
+
+# pylint: disable=import-error
+from backend.cleaner import ImageCleaner
+
+logger = logging.getLogger('Cleaner')
+
+
+def extract_metadata(path: str, small: bool = False, fingerprint: bool = False) -> Dict:
+    """
+    Runs in a worker process
+    :param path: The file to examine
+    :param small: Also check if it is a small image
+    :param fingerprint: Also calculate the pixel fingerprint
+    :return: A dictionary suitable for ImageCleaner.apply_metadata
+    """
+    image = ImageCleaner(Path(path))
+    result = {'date': image.get_date_from_image()}
+    if small:
+        result['small'] = image.is_small
+        if image.dimensions:
+            result['dimensions'] = image.dimensions
+    if fingerprint:
+        result['image_data'] = image.image_data
+        result['perceptual_hash'] = image.perceptual_hash  # Free,  it comes from the same decode
+    return result
+
+
+async def prefetch_metadata(executor: Executor, images: List[ImageCleaner], small: bool = False):
+    """
+    Extract the metadata for a batch of images in parallel and apply the results.   Anything that fails in a worker
+    is left alone,  it will be calculated (and fail again with the normal logging) in the main process.
+    :param executor: A process pool
+    :param images: The objects to update
+    :param small: Check for small images
+    :return:
+    """
+    loop = asyncio.get_running_loop()
+    futures = [loop.run_in_executor(executor, partial(extract_metadata, str(image.path), small=small,
+                                                      fingerprint=image.is_registered()))
+               for image in images]
+    for image, result in zip(images, await asyncio.gather(*futures, return_exceptions=True)):
+        if isinstance(result, BaseException):
+            logger.debug('Metadata extraction failed for %s - %s', image.path, result)
+        else:
+            image.apply_metadata(result)
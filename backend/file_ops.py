@@ -0,0 +1,192 @@
+"""
+Ways of putting a file into the library without copying its data.   A reflink (copy on write clone) is a real copy as
+far as anyone can tell,  a hard link is the very same file under a second name.   When the data does have to be copied,
+copy_file keeps it in the kernel.
+"""
+import errno
+import logging
+import os
+
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # pylint: disable=invalid-name
+
+logger = logging.getLogger('Cleaner')
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+COPY_BLOCK = 8 * 1024 * 1024  # Bytes per copy call
+PREALLOCATE_SIZE = 64 * 1024 * 1024  # Files this big (movies) have their space allocated before they are copied
+
+
+def reflink(source: Path, destination: Path) -> bool:
+    """
+    Clone a file,  only file systems like btrfs and xfs support this (and only on Linux)
+    :param source:
+    :param destination: This must not exist
+    :return: True if the clone was made
+    """
+    if not fcntl or not hasattr(fcntl, 'ioctl'):  # pragma: no cover
+        return False
+    try:
+        with open(source, 'rb') as source_file, open(destination, 'xb') as destination_file:
+            try:
+                fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+                return True
+            except OSError as error:
+                logger.debug('Can not clone %s (%s)', source, error)
+        os.unlink(destination)
+    except OSError as error:
+        logger.debug('Can not clone %s to %s (%s)', source, destination, error)
+    return False
+
+
+def hard_link(source: Path, destination: Path) -> bool:
+    """
+    Link a file,  anything changing one of them changes both
+    :param source:
+    :param destination: This must not exist
+    :return: True if the link was made
+    """
+    try:
+        os.link(source, destination)
+    except OSError as error:
+        logger.debug('Can not link %s to %s (%s)', source, destination, error)
+        return False
+    return True
+
+
+def replace_with_link(source: Path, destination: Path) -> Optional[str]:
+    """
+    Replace a file with a reflink (or failing that a hard link) to another file with the same content.   The link is
+    made beside destination and renamed over it,  so destination is never missing.
+    :param source: The file to keep
+    :param destination: The file to replace
+    :return: 'cloned',  'linked' or None if neither could be done
+    """
+    temp = destination.with_name(f'.{destination.name}.link')
+    if reflink(source, temp):
+        how = 'cloned'
+    elif hard_link(source, temp):
+        how = 'linked'
+    else:
+        return None
+    try:
+        os.replace(temp, destination)
+    except OSError as error:  # pragma: no cover
+        logger.error('Can not replace %s (%s)', destination, error)
+        os.unlink(temp)
+        return None
+    return how
+
+
+def _copy_file_range(source_fd: int, destination_fd: int, start: int, size: int, at: int) -> int:
+    offset = start
+    while offset < size:
+        copied = os.copy_file_range(source_fd, destination_fd, min(COPY_BLOCK, size - offset), offset,
+                                    at + offset - start)
+        if not copied:
+            break
+        offset += copied
+    return offset - start
+
+
+def _sendfile(source_fd: int, destination_fd: int, start: int, size: int, at: int) -> int:
+    os.lseek(destination_fd, at, os.SEEK_SET)
+    offset = start
+    while offset < size:
+        copied = os.sendfile(destination_fd, source_fd, offset, min(COPY_BLOCK, size - offset))
+        if not copied:
+            break
+        offset += copied
+    return offset - start
+
+
+def _read_write(source_fd: int, destination_fd: int, start: int, size: int,  # pylint: disable=unused-argument
+                at: int) -> int:
+    os.lseek(source_fd, start, os.SEEK_SET)
+    os.lseek(destination_fd, at, os.SEEK_SET)
+    offset = 0
+    while True:
+        block = os.read(source_fd, COPY_BLOCK)
+        if not block:
+            break
+        offset += _write(destination_fd, block)
+    return offset
+
+
+def _write(destination_fd: int, data: bytes) -> int:
+    block = memoryview(data)
+    while block:
+        block = block[os.write(destination_fd, block):]
+    return len(data)
+
+
+COPY_METHODS = [method for name, method in (('copy_file_range', _copy_file_range), ('sendfile', _sendfile))
+                if hasattr(os, name)] + [_read_write]  # Best first
+
+
+def copy_file(source: Path, destination: Path, head: bytes = b'', skip: int = 0) -> int:
+    """
+    Copy the data of a file without passing it through user space,  copy_file_range (which lets the file system
+    share or offload the copy) then sendfile,  with a plain read/write loop as the last resort.   Big files have their
+    space allocated up front so they are not fragmented.   Like shutil.copyfile only the data is copied.
+    :param source:
+    :param destination: This is replaced if it exists
+    :param head: Written in place of the first skip bytes of source,  to change a file's metadata as it is copied
+    :param skip:
+    :return: The number of bytes written
+    """
+    source_fd = os.open(source, os.O_RDONLY)
+    try:
+        destination_fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            size = os.fstat(source_fd).st_size
+            wanted = max(size - skip, 0)
+            if len(head) + wanted >= PREALLOCATE_SIZE and hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(destination_fd, 0, len(head) + wanted)
+                except OSError as error:  # pragma: no cover
+                    logger.debug('Can not preallocate %s (%s)', destination, error)
+            _write(destination_fd, head)
+            copied = _copy_data(source_fd, destination_fd, skip, size, source) + len(head)
+            os.ftruncate(destination_fd, copied)  # The preallocated size is only a guess if the source is changing
+        except BaseException:
+            os.close(destination_fd)
+            os.unlink(destination)  # Never leave part of a file behind
+            raise
+        os.close(destination_fd)
+    finally:
+        os.close(source_fd)
+    return copied
+
+
+def _copy_data(source_fd: int, destination_fd: int, start: int, size: int, source: Path) -> int:
+    """
+    Try each of the COPY_METHODS until one copies all of the data,  to where the destination is positioned
+    :param source_fd:
+    :param destination_fd:
+    :param start: Where to start in the source
+    :param size: Of the source
+    :param source: For the messages
+    :return: The number of bytes copied
+    :raises: OSError if no method copies them all,  the source was cut short while we copied it for instance
+    """
+    wanted, at = max(size - start, 0), os.lseek(destination_fd, 0, os.SEEK_CUR)
+    for method in COPY_METHODS:
+        try:
+            copied = method(source_fd, destination_fd, start, size, at)
+        except OSError as error:  # Not supported between these file systems,  try the next way
+            if method is _read_write:
+                raise
+            logger.debug('Can not copy %s with %s (%s)', source, method.__name__, error)
+            continue
+        if copied == wanted:
+            return copied
+        if method is _read_write:
+            raise OSError(errno.EIO, f'Copied {copied} of {wanted} bytes,  it changed while it was copied', str(source))
+        logger.debug('Short copy of %s with %s (%d of %d bytes)', source, method.__name__, copied, wanted)
+    return 0  # pragma: no cover  (_read_write is always last)
@@ -2,20 +2,34 @@
 Run the actual image cleaning
 """
 import asyncio
-
+import json
 import logging
 import os
 import pickle
+import shutil
 import sys
 import tempfile
 # import traceback
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Union, Dict, TypeVar
+from typing import AsyncIterator, Iterator, List, Optional, Union, Dict, Tuple, TypeVar
 
 sys.path.append('.')
 # pylint: disable=import-error wrong-import-position
-from backend.cleaner import ImageCleaner, FileCleaner, Folder, make_cleaner_object, PICTURE_FILES, MOVIE_FILES
+from backend.catalog import Catalog
+from backend.content_index import ContentIndex
+from backend.convert import convert_images
+from backend.executor import PlanExecutor
+from backend.extract import prefetch_metadata
+from backend.file_ops import replace_with_link
+from backend.journal import Journal
+from backend.plan import Operation, Simulation
+from backend.registry import Library
+from backend.similarity import BKTree
+from backend.walker import FolderScan, scan_folder, stat_entry, walk
+from backend.cleaner import ImageCleaner, FileCleaner, Folder, CleanerBase, make_cleaner_object, \
+    move_counts, stat_counts, PICTURE_FILES, MOVIE_FILES
 
 logger = logging.getLogger('Cleaner')  # pylint: disable=invalid-name
 
@@ -29,10 +43,39 @@ EXACT: int = 0
 GREATER: int = 1
 LESSER: int = 2
 
+# What import_file decided,  these are kept in the import manifest
+INVALID: str = 'invalid'
+IGNORED: str = 'ignored'
+PRESENT: str = 'present'
+DUPLICATE: str = 'duplicate'
+NEAR_DUPLICATE: str = 'near_duplicate'
+IMPORTED: str = 'imported'
+LEFT_IN_PLACE = [INVALID, IGNORED, PRESENT]  # These never move the input file
+
 WARNING_FOLDER_SIZE = 100  # Used when auditing directories,  move then 100 members is a Yellow flag
 MAXIMUM_FOLDER_SIZE = 50  # Date based folder,  more than MAX,  create a child
+PREFETCH_BATCH = 16  # Files per worker handed to the metadata pool at a time
 
 DF = TypeVar("DF", bound="Folder")  # pylint: disable=invalid-name
+Source = Tuple[ImageCleaner, Path, Optional[os.stat_result], bool]  # A converted file (original,  path,  stat,  kept)
+
+ARGUMENTS = {'verbose': 'verbose',  # process_args argument -> ImageClean attribute
+             'do_convert': 'do_convert',
+             'convert_workers': 'convert_workers',
+             'work_folder': 'work_folder',
+             'input': 'input_folder',
+             'output': 'output_folder',
+             'keep_originals': 'keep_original_files',
+             'link_files': 'link_files',
+             'sidecar_dates': 'sidecar_dates',
+             'verify_movies': 'verify_movies',
+             'consolidate': 'consolidate',
+             'plan': 'plan_only',
+             'check_small': 'check_for_small',
+             'similarity': 'similarity',
+             'workers': 'workers',
+             'io_workers': 'io_workers',
+             'in_flight': 'in_flight'}  # 'check_description' (check_for_folders) is not settable yet
 
 
 class ImageClean:  # pylint: disable=too-many-instance-attributes
@@ -45,13 +88,26 @@ class ImageClean:  # pylint: disable=too-many-instance-attributes
         if not self.run_path.exists():
             os.makedirs(self.run_path, mode=511)
         self.conf_file = self.run_path.joinpath('config.pickle')
+        self.catalog_file = self.run_path.joinpath('catalog.db')
+        self.journal_file = self.run_path.joinpath('journal.jsonl')
 
         # Default option
         self.verbose = False
         self.do_convert = False
+        self.convert_workers = 0  # Processes converting HEIC files,  0 for one per CPU
+        self.work_folder: Optional[Path] = None  # Where conversions are written (a tmpfs is ideal),  None for $TMPDIR
         self.keep_original_files = True
+        self.link_files = False  # When set,  kept originals are reflinked or hard linked into the output not copied
+        self.sidecar_dates = False  # When set,  dates we work out go in XMP sidecars and images are never rewritten
+        self.verify_movies = False  # When set,  big movies are compared in full not just on their sampled digest
+        self.consolidate = False  # When set,  exact copies in the output share one physical file
+        self.plan_only = False  # When set,  run writes the import plan (NDJSON) to stdout rather than importing
         self.check_for_small = False
         self.check_for_folders = True  # When set,  check for descriptive folder names, else just use dates.
+        self.similarity = 0  # When set,  pictures within this perceptual hash distance are considered duplicates
+        self.workers = 1  # More than one,  and metadata is extracted in a pool of this many processes
+        self.io_workers = 0  # When set,  the import is planned and then done with this many copies per device at once
+        self.in_flight = 8  # Files of a folder being read or relocated at once
 
         # Default values
         self.input_folder = self.output_folder = Path.home()
@@ -59,12 +115,7 @@ class ImageClean:  # pylint: disable=too-many-instance-attributes
         self.force_keep = False  # With R/O directories we can not ever try and remove anything
 
         if restore:  # Used by UI
-            try:
-                with open(self.conf_file, 'rb') as file:
-                    temp = pickle.load(file)
-                    self.process_args(temp)
-            except FileNotFoundError:
-                logger.debug('Restore attempt of %s failed', self.conf_file)
+            self.restore_config()
         else:  # Used by cmdline
             self.process_args(kwargs)
 
@@ -74,9 +125,18 @@ class ImageClean:  # pylint: disable=too-many-instance-attributes
         self.no_date_base = f'{self.app_name}_NoDate'
         self.small_base = f'{self.app_name}_Small'
 
+        self.library = Library()  # What our cleaner objects share,  see setup
+        self.registry = self.library.registry  # Our library
         self.folders: Dict[str, DF] = {}  # This is used to store output folders - one to one map to folder object
         self.movie_list = []  # We need to track these so we can clean up
-        self.working_folder = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.skipped = 0  # Input files that had not changed since an earlier run imported them
+        self.catalog = None
+        self.journal = None
+        self.executor = None
+        self.converter = None  # Process pool for HEIC conversions
+        self.transfers: Optional[PlanExecutor] = None  # While importing,  relocations are done in the background
+        self.working_folder = tempfile.TemporaryDirectory(dir=self.work_folder)  # pylint: disable=consider-using-with
+        self.conversions = 0  # Folders converted,  each gets its own folder in working_folder
 
     def process_args(self, kwargs: dict):
         """
@@ -84,25 +144,22 @@ class ImageClean:  # pylint: disable=too-many-instance-attributes
         :param kwargs:
         :return:
         """
-        for key in kwargs:
-            if key == 'verbose':
-                self.verbose = kwargs[key]
-            elif key == 'do_convert':
-                self.do_convert = kwargs[key]
-            elif key == 'input':
-                self.input_folder = kwargs[key]
-            elif key == 'output':
-                self.output_folder = kwargs[key]
-            elif key == 'keep_originals':
-                self.keep_original_files = kwargs[key]
-            elif key == 'check_small':
-                self.check_for_small = kwargs[key]
-            # elif key == 'check_description':
-            #    self.check_for_folders = kwargs[key]
+        for key, value in kwargs.items():
+            if key in ARGUMENTS:
+                setattr(self, ARGUMENTS[key], value)
             else:  # pragma: no cover
-                error_str = 'Argument:%s is being skipped failed', key
-                logger.debug(error_str)
-                # assert False, error_str
+                logger.debug('Argument:%s is being skipped', key)
+
+    def restore_config(self):
+        """
+        Pick up the arguments saved by save_config
+        :return:
+        """
+        try:
+            with open(self.conf_file, 'rb') as file:
+                self.process_args(pickle.load(file))
+        except FileNotFoundError:
+            logger.debug('Restore attempt of %s failed', self.conf_file)
 
     def save_config(self):  # pragma: no cover
         """
@@ -111,10 +168,20 @@ class ImageClean:  # pylint: disable=too-many-instance-attributes
         """
         config = {'verbose': self.verbose,
                   'do_convert': self.do_convert,
+                  'convert_workers': self.convert_workers,
+                  'work_folder': self.work_folder,
                   'input': self.input_folder,
                   'output': self.output_folder,
                   'keep_originals': self.keep_original_files,
+                  'link_files': self.link_files,
+                  'sidecar_dates': self.sidecar_dates,
+                  'verify_movies': self.verify_movies,
+                  'consolidate': self.consolidate,
                   'check_small': self.check_for_small,
+                  'similarity': self.similarity,
+                  'workers': self.workers,
+                  'io_workers': self.io_workers,
+                  'in_flight': self.in_flight,
                   'check_description': self.check_for_folders
                   }
         with open(self.conf_file, 'wb') as conf_file:
@@ -128,8 +195,8 @@ class ImageClean:  # pylint: disable=too-many-instance-attributes
         :param text: something to display when verbose is true
         :return:  None
         """
-        if self.verbose:
-            print(text)
+        if self.verbose:  # With --plan the plan has stdout to itself
+            print(text, file=sys.stderr if self.plan_only else sys.stdout)
 
     def increment_progress(self):
         """
@@ -150,15 +217,30 @@ class ImageClean:  # pylint: disable=too-many-instance-attributes
             self.force_keep = True  # pragma: no cover
 
         # Register our internal folders
-        Folder(self.output_folder, self.output_folder, internal=True)
-        Folder(self.output_folder.joinpath(self.no_date_base), self.output_folder, internal=True)
-        Folder(self.output_folder.joinpath(self.small_base), self.output_folder, internal=True)
-        Folder(self.output_folder.joinpath(self.migration_base), self.output_folder, internal=True)
-        Folder(self.output_folder.joinpath(self.duplicate_base), self.output_folder, internal=True)
-        Folder(self.output_folder.joinpath(self.movies_base), self.output_folder, internal=True)
+        for base in ('', self.no_date_base, self.small_base, self.migration_base, self.duplicate_base,
+                     self.movies_base):
+            Folder(self.output_folder.joinpath(base), self.output_folder, internal=True, library=self.library)
+
+        if not self.plan_only:  # A plan never touches a file,  not even to recover
+            self.journal = Journal(self.journal_file)
+            self._recover()
+            self.journal.start(self.input_folder, self.output_folder)
 
         logger.debug('Registration is Starting')
+        self.catalog = Catalog(self.catalog_file, self.output_folder)
         self._register_files(self.output_folder)
+        if self.similarity:
+            self.library.similar = self._index_pictures()
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        if self.do_convert and not self.plan_only and not self.io_workers:  # Only import_folder converts
+            self.converter = ProcessPoolExecutor(max_workers=self.convert_workers or None)
+        self.catalog.commit()
+        self.library.catalog = self.catalog  # From now on,  keep it in step with our changes
+        self.library.link_files = self.link_files
+        self.library.sidecar_dates = self.sidecar_dates
+        self.library.verify_movies = self.verify_movies
+        self.library.journal = self.journal
         logger.debug('Registration is completed')
 
     def teardown(self):
@@ -169,6 +251,24 @@ class ImageClean:  # pylint: disable=too-many-instance-attributes
         if self.working_folder:
             self.working_folder.cleanup()
             self.working_folder = None
+        self.library.similar = None
+        self.library.link_files = False
+        self.library.sidecar_dates = False
+        self.library.verify_movies = False
+        if self.journal:
+            self.library.journal = None
+            self.journal.close()
+            self.journal = None
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+        if self.converter:
+            self.converter.shutdown()
+            self.converter = None
+        if self.catalog:
+            self.library.catalog = None
+            self.catalog.close()
+            self.catalog = None
 
     async def run(self):
         """
@@ -176,9 +276,28 @@ class ImageClean:  # pylint: disable=too-many-instance-attributes
         """
 
         self.setup()
+        if self.plan_only:
+            for operation in self.plan(self.input_folder):
+                sys.stdout.write(f'{operation.to_json()}\n')
+            self.teardown()
+            return
+
         # Start it up.
         self.print('Starting Imports.')
-        await self.import_folder(self.input_folder)
+        if self.io_workers:
+            await self.apply_plan(self.input_folder)
+        else:
+            await self.import_folder(self.input_folder)
+        self.journal.finish()  # Nothing to resume
+        if self.skipped:
+            self.print(f'Skipped {self.skipped} files already imported by an earlier run')
+        self.print(f'File status calls: {stat_counts["made"]} made,  {stat_counts["saved"]} saved by caching')
+        self.print(f'Moved {move_counts["renamed"]} files by renaming,  cloned {move_counts["cloned"]},  linked '
+                   f'{move_counts["linked"]},  {move_counts["bytes_avoided"]} bytes did not need copying')
+        if self.consolidate:
+            self.print('Consolidating duplicates.')
+            files, reclaimed = self.consolidate_duplicates()
+            self.print(f'  {files} duplicate files now share their data,  {reclaimed} bytes reclaimed')
         self.teardown()
 
         # Clean up
@@ -190,120 +309,480 @@ class ImageClean:  # pylint: disable=too-many-instance-attributes
             self._audit_folders(self.input_folder)
         self._audit_folders(self.output_folder)
 
+    @property
+    def settings(self) -> str:
+        """
+        Summary of the options that change what import_file decides,  for the import manifest
+        :return:
+        """
+        removing = not (self.keep_original_files or self.force_keep)  # Kept files are still there to be removed
+        return json.dumps([self.output_folder.as_posix(), self.check_for_small, self.check_for_folders, self.similarity,
+                           self.do_convert, removing])
+
+    def _recover(self):
+        """
+        Clean up after an interrupted run.   A relocate that left both files behind is rolled back (the copy may be
+        incomplete and the original is still there),  an unfinished rollover is finished.
+        :return:
+        """
+        for ident in sorted(self.journal.pending):
+            record = self.journal.pending[ident]
+            if record['op'] == 'relocate':
+                source, target = Path(record['source']), Path(record['target'])
+                if source.exists() and target.exists():
+                    self.print(f'Recovering: removing the incomplete copy {target}')
+                    os.unlink(target)
+            elif record['op'] == 'rollover':
+                destination = Path(record['path'])
+                if destination.exists():
+                    self.print(f'Recovering: finishing the rollover of {destination}')
+                    CleanerBase.rollover_file(destination, self.library)
+
     def _register_files(self, folder: Path, parent_folder: Folder = None):
         """
         Take an inventory of all the existing files/folders.  This allows us to easily detected duplicate files.
+        Folders that have not changed since the last run are loaded from the catalog,  the rest are listed and
+        stored back into the catalog.
         :return:
         """
-        this_folder = Folder.get_folder(folder)
+        this_folder = Folder.get_folder(folder, self.library)
         if not this_folder:
-            this_folder = Folder(folder, self.output_folder, cache=True)
+            this_folder = Folder(folder, self.output_folder, cache=True, library=self.library)
 
         if parent_folder:
             parent_folder.children.append(this_folder)
 
-        for entry in folder.iterdir():
-            if entry.is_dir():
-                self._register_files(entry, this_folder)
-            else:
-                make_cleaner_object(entry).register()
+        stats = {}
+        mtime_ns = os.stat(folder).st_mtime_ns
+        if self.catalog.is_current(folder, mtime_ns):
+            folders, files = self.catalog.load_folder(folder)
+        else:
+            scan = scan_folder(folder)
+            folders = [Path(entry.path) for entry in scan.folders]
+            stats = {Path(entry.path): stat_entry(entry) for entry in scan.files}
+            files = self.catalog.store_folder(folder, mtime_ns, folders, list(stats.items()))
+
+        for entry in folders:
+            self._register_files(entry, this_folder)
+        for entry in files:
+            value = make_cleaner_object(entry.path, size=entry.size, stat=stats.get(entry.path), library=self.library)
+            if entry.path not in stats:  # From the catalog,  check it has not been edited in place when it is stat'ed
+                value.stamp = (entry.mtime_ns, entry.inode)
+            value.register()
+
+    def _index_pictures(self) -> BKTree:
+        """
+        Build the perceptual hash index of the registered pictures,  hashes are kept in the catalog between runs
+        :return: the index
+        """
+        tree = BKTree()
+        for values in list(self.registry.files.values()):
+            for value in values:
+                stat = value.stat() if value.path.suffix.lower() in PICTURE_FILES else None
+                if stat:  # Only trust a stored hash while the file is unchanged
+                    stored = self.catalog.perceptual_hash(value.path, stat)
+                    if stored is not None:
+                        value.perceptual_hash = stored
+                    elif value.perceptual_hash is not None:
+                        self.catalog.set_perceptual_hash(value.path, value.perceptual_hash, stat)
+                    if value.perceptual_hash is not None:
+                        tree.add(value.perceptual_hash, value)
+        return tree
+
+    def near_duplicates(self, entry: Union[FileCleaner, ImageCleaner]) -> list:
+        """
+        Find registered pictures that look like this one,  closest first
+        :param entry:
+        :return: list of cleaner objects
+        """
+        if not (self.similarity and self.library.similar and entry.perceptual_hash is not None):
+            return []
+        return [value for _, value in self.library.similar.search(entry.perceptual_hash, self.similarity)
+                if value is not entry]
+
+    def consolidate_duplicates(self) -> Tuple[int, int]:
+        """
+        Keep one physical copy of each distinct file in the output,  every other copy (registered or in the duplicates
+        folder) is replaced by a reflink or hard link to it.   This is done in one pass over a content index so only
+        files that share a size are ever read.
+        :return: (files replaced,  bytes reclaimed)
+        """
+        index = ContentIndex()
+        known = set()
+        for values in self.registry.files.values():
+            for value in values:
+                index.add(value)
+                known.add(value.path)
+        duplicates = self.output_folder.joinpath(self.duplicate_base)
+        if duplicates.is_dir():  # Usually registered already,  but not if they arrived during this run
+            for scan in walk(duplicates):
+                for entry in scan.files:
+                    if Path(entry.path) not in known:
+                        index.add(make_cleaner_object(Path(entry.path), stat=stat_entry(entry), library=self.library))
+
+        files = reclaimed = 0
+        for group in index.duplicates():
+            group = [value for value in group if value.stat()]
+            if not group:  # pragma: no cover
+                continue
+            # Rather keep a library file than a duplicate,  and one that is already linked the most
+            keeper = min(group, key=lambda value: (duplicates in value.path.parents, -value.stat().st_nlink))
+            for value in group:
+                stat, keeper_stat = value.stat(), keeper.stat()
+                if value.is_same_file(keeper) or stat.st_dev != keeper_stat.st_dev:
+                    continue
+                if replace_with_link(keeper.path, value.path):
+                    files += 1
+                    reclaimed += stat.st_size if stat.st_nlink == 1 else 0  # Otherwise another name still has it
+                    value.invalidate_stat()
+                    if self.library.catalog:
+                        self.library.catalog.add_file(value.path)
+        return files, reclaimed
 
     def _audit_folders(self, path: Path):
         """
-        Look for large and empty folders
+        Look for large and empty folders,  children are audited before their parents so emptied parents go too
         :param path:
         :return:
         """
-        for entry in path.iterdir():
-            if entry.is_dir():
-                self._audit_folders(entry)
-                size = len(os.listdir(entry))
-                if size == 0:
-                    self.print(f'  Removing empty folder {entry}')
-                    os.rmdir(entry)
-                elif size > WARNING_FOLDER_SIZE:
-                    self.print(f'  VERY large folder ({size}) found {entry}')
+        removed: Dict[Path, int] = {}  # Sub-folders removed since the folder was listed
+        for scan in walk(path, top_down=False):
+            if scan.path == path:
+                continue
+            size = scan.count - removed.get(scan.path, 0)
+            if size == 0:
+                self.print(f'  Removing empty folder {scan.path}')
+                os.rmdir(scan.path)
+                removed[scan.path.parent] = removed.get(scan.path.parent, 0) + 1
+            elif size > WARNING_FOLDER_SIZE:
+                self.print(f'  VERY large folder ({size}) found {scan.path}')
+
+    async def import_file(self, entry: Union[FileCleaner, ImageCleaner], folder: Folder) -> str:
+        """
+        Import one file,  see decide.   While a folder is being imported the relocations are only simulated here and
+        handed to the transfer queue,  so the next file can be decided while this one is copied.
 
-    async def import_file(self, entry: Union[FileCleaner, ImageCleaner], folder: Folder):
+        param entry: Cleaner object, File or Image
+        :return: What was decided (INVALID, IGNORED, PRESENT, DUPLICATE, NEAR_DUPLICATE or IMPORTED)
+        """
+        self.increment_progress()
+        if not self.transfers:
+            await asyncio.sleep(0)  # Allow other sub-processes to interrupt us
+            return self.decide(entry, folder)[0]
+
+        await self.transfers.wait_for(entry.registry_key, entry.size)  # Settle anything we might look at
+        decision, operations = self.decide(entry, folder)
+        for operation in operations:
+            await self.transfers.submit(operation)
+        return decision
+
+    def read_ahead(self, entry: Union[FileCleaner, ImageCleaner]):
+        """
+        Read what decide will want to know about a file (it is cached in the objects),  including the digests and
+        pixels it is compared on (see read_comparisons).   This runs on a worker thread,  it only reads files so it can
+        be done ahead of the decisions.
+        :param entry:
+        :return:
+        """
+        if not entry.is_valid:
+            return
+        entry.read_comparisons()
+        if not isinstance(entry, ImageCleaner):
+            return
+        _ = entry.date
+        if self.check_for_small:
+            _ = entry.is_small
+        if self.similarity and self.library.similar:
+            _ = entry.perceptual_hash
+
+    def decide(self, entry: Union[FileCleaner, ImageCleaner], folder: Folder) -> Tuple[str, List[Operation]]:
         """
         Extract image date
         Calculate new destination folder
         Test Duplicate status
 
+        The relocations are done as they are decided,  unless a planner is attached in which case they are simulated.
+
         param entry: Cleaner object, File or Image
+        :return: (What was decided,  the relocations)
         """
 
         # if entry.path.name == '151-5181_IMG.JPG':
         #    pass
 
-        self.increment_progress()
-        await asyncio.sleep(0)  # Allow other sub-processes to interrupt us
         if not entry.is_valid:
             self.print(f'.... File {entry.path} is invalid.')
-            return
-
-        decorator = Path()
-        suffix = entry.path.suffix.lower()
-        if suffix not in PICTURE_FILES:
-            if suffix in MOVIE_FILES:
-                self.movie_list.append(entry.registry_key)
-                decorator = Path(self.movies_base)
-            else:
-                self.print(f'.... Ignoring non image file {entry.path}')
-                return
+            return INVALID, []
 
-        if self.check_for_small and entry.is_small:
-            decorator = self.small_base  # Assumption is that movies can not be small
+        decorator = self._decorator(entry)
+        if decorator is None:
+            self.print(f'.... Ignoring non image file {entry.path}')
+            return IGNORED, []
 
         # Folder base is calculated to be the proper location for this entry
         folder_base = entry.folder_base2(input_folder=folder, no_date_base=Path(self.no_date_base))
         relo_path = self.output_folder.joinpath(decorator).joinpath(folder_base)
 
         rollover = False
+        operations: List[Operation] = []
+
+        def relocate(obj: Union[FileCleaner, ImageCleaner], new_path: Path, **kwargs):
+            operation = obj.relocate_file(new_path, **kwargs)
+            if operation:
+                operations.append(operation)
 
         # We have entry.path,  relo_path,  existing.path
         if entry.is_registered(by_file=True, by_path=True) and entry.path.parent == relo_path:
-            return  # This is in fact me.
+            return PRESENT, []  # This is in fact me.
         logger.debug('  Importing File:%s', entry)
         if entry.is_registered(by_file=True, new_path=relo_path):  # This is a copy of me,  I am a duplicate
             dup_folder = self.output_folder.joinpath(self.duplicate_base).joinpath(decorator).joinpath(folder_base)
-            entry.relocate_file(dup_folder, register=False, rollover=False, remove=self.remove_file(entry))
-            return
+            relocate(entry, dup_folder, register=False, rollover=False, remove=self.remove_file(entry),
+                     decision=DUPLICATE)
+            return DUPLICATE, operations
         if entry.is_registered(by_file=True):  # A copy of me lives elsewhere.    Let's examine it
-            for existing in entry.get_registered(by_file=True):
-                if (not existing.folder) or (existing.folder and (not existing.folder.description)):
-                    if existing.path.stat().st_ino != entry.path.stat().st_ino:  # Prevent moving myself to duplicate
-                        base = existing.folder_base2(no_date_base=Path(self.no_date_base))
-                        dup_folder = self.output_folder.joinpath(self.duplicate_base).joinpath(decorator).joinpath(base)
-                        existing.de_register()
-                        existing.relocate_file(dup_folder, register=False, rollover=False, remove=True)
-                # else this copy is in descriptive folder so leave it be.
+            operations.extend(self._demote_copies(entry, decorator))
+        elif self.near_duplicates(entry):  # A re-encoded or resized copy of me is already in the library
+            dup_folder = self.output_folder.joinpath(self.duplicate_base).joinpath(decorator).joinpath(folder_base)
+            relocate(entry, dup_folder, register=False, rollover=False, remove=self.remove_file(entry),
+                     decision=NEAR_DUPLICATE)
+            return NEAR_DUPLICATE, operations
         elif entry.is_registered(new_path=relo_path):  # This is the same path, different file
             rollover = True
         # else, i new or a file with the same base name living elsewhere
-        entry.relocate_file(relo_path, base_folder=self.output_folder, register=True, rollover=rollover,
-                            remove=self.remove_file(entry))
+        relocate(entry, relo_path, base_folder=self.output_folder, register=True, rollover=rollover,
+                 remove=self.remove_file(entry), decision=IMPORTED)
+        return IMPORTED, operations
+
+    def _decorator(self, entry: Union[FileCleaner, ImageCleaner]) -> Optional[Path]:
+        """
+        Movies and (when we check for them) small pictures are kept apart from the rest of the library
+        :param entry:
+        :return: The folder under the output this entry belongs in,  None if it is not a file we import
+        """
+        suffix = entry.path.suffix.lower()
+        if suffix not in PICTURE_FILES and suffix not in MOVIE_FILES:
+            return None
+        decorator = Path()
+        if suffix in MOVIE_FILES:
+            self.movie_list.append(entry.registry_key)
+            decorator = Path(self.movies_base)
+        if self.check_for_small and entry.is_small:
+            decorator = Path(self.small_base)  # Assumption is that movies can not be small
+        return decorator
+
+    def _demote_copies(self, entry: Union[FileCleaner, ImageCleaner], decorator: Path) -> List[Operation]:
+        """
+        Copies of entry that live in dated (not descriptive) folders are moved to the duplicates,  entry replaces them
+        :param entry:
+        :param decorator: see _decorator
+        :return: The relocations
+        """
+        operations = []
+        for existing in entry.get_registered(by_file=True):
+            if (not existing.folder) or (existing.folder and (not existing.folder.description)):
+                if not existing.is_same_file(entry):  # Prevent moving myself to duplicate
+                    base = existing.folder_base2(no_date_base=Path(self.no_date_base))
+                    dup_folder = self.output_folder.joinpath(self.duplicate_base).joinpath(decorator).joinpath(base)
+                    existing.de_register()
+                    operation = existing.relocate_file(dup_folder, register=False, rollover=False, remove=True,
+                                                       decision=DUPLICATE)
+                    if operation:
+                        operations.append(operation)
+            # else this copy is in descriptive folder so leave it be.
+        return operations
 
     async def import_folder(self, folder: Path):
         """
-        Provided with a folder to import,  recursively process this moving files to output
+        Provided with a folder to import,  recursively process this moving files to output.
+
+        Within a folder up to in_flight files are in progress at once.   The files are read on worker threads ahead of
+        the decisions,  and the relocations are done in the background (see PlanExecutor).   Decisions are still made
+        one at a time in folder order since each depends on what the ones before it registered,  and a decision waits
+        for any relocation of a file it could compare itself with.
         :param folder:
         :return:
         """
-        self.print(f'Scanning Folder: {folder}')
-        this_folder = Folder(folder, self.input_folder, cache=False)
-        if folder == self.output_folder.joinpath(self.no_date_base):
-            this_folder.description = ''  # This is a special case where we are reimporting ourselves
+        self.transfers = PlanExecutor(workers=self.in_flight, backlog=self.in_flight * 4)
+        try:
+            with ThreadPoolExecutor(max_workers=self.in_flight, thread_name_prefix='read') as readers:
+                for scan, this_folder, files in self._scan_input(folder):
+                    self.library.planner = Simulation()  # What the disk will look like once the transfers are done
+                    originals: Dict[int, Source] = {}  # Conversion -> the HEIC file it came from
+                    work = None
+                    if self.converter:
+                        files, originals, work = await self.convert_folder(files)
+                    await self._prefetch_folder(files)
+
+                    manifest = []  # Only written once the transfers of the file have succeeded
+                    async for entry in self._read_files(readers, files):
+                        self.print(f'. File: {entry.path}')
+                        original, path, stat, keep = originals.get(id(entry)) or \
+                            (entry, entry.path, entry.stat(), not self.remove_file(entry))  # About the input file
+                        decision = await self.import_file(entry, this_folder)
+                        if stat and (keep or decision in LEFT_IN_PLACE):  # The input file is still there
+                            manifest.append((path, stat, decision, (id(original), id(entry))))
+                    await self.transfers.drain()
+                    self._record_manifest(manifest)
+                    if work:
+                        shutil.rmtree(work, ignore_errors=True)
+                    self.catalog.commit()
+                    if self.journal:
+                        self.journal.folder_done(scan.path)
+        finally:
+            self.library.planner = None
+            self.transfers.close()
+            self.transfers = None
+
+    async def _prefetch_folder(self, files: List[Union[FileCleaner, ImageCleaner]]):
+        """
+        Let the metadata pool (if there is one) do the heavy lifting for the images of a folder,  the decisions are
+        still made one at a time
+        :param files: The files of the folder
+        :return:
+        """
+        if self.executor:
+            images = [entry for entry in files if isinstance(entry, ImageCleaner)]
+            for start in range(0, len(images), self.workers * PREFETCH_BATCH):
+                await prefetch_metadata(self.executor, images[start:start + self.workers * PREFETCH_BATCH],
+                                        small=self.check_for_small)
+
+    async def _read_files(self, readers: ThreadPoolExecutor, files: List[Union[FileCleaner, ImageCleaner]]) -> \
+            AsyncIterator[Union[FileCleaner, ImageCleaner]]:
+        """
+        The files of a folder in order,  each once read_ahead is done with it.   Up to in_flight files are read at once.
+        :param readers: The threads to read on
+        :param files: The files of the folder
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        reads: Dict[int, asyncio.Future] = {}
+        for index, entry in enumerate(files):
+            for ahead in range(index, min(index + self.in_flight, len(files))):
+                if ahead not in reads:
+                    reads[ahead] = loop.run_in_executor(readers, self.read_ahead, files[ahead])
+            await reads.pop(index)
+            yield entry
+
+    def _record_manifest(self, manifest: List[Tuple[Path, os.stat_result, str, Tuple[int, int]]]):
+        """
+        Record the input files of a folder that stay where they are,  once their transfers are done
+        :param manifest: (path,  stat,  decision,  the objects (by id) whose operations have to have succeeded)
+        :return:
+        """
+        failed = {id(operation.obj) for operation in self.transfers.failed}
+        for path, stat, decision, objects in manifest:
+            if not failed.intersection(objects):  # Failures are tried again next time
+                self.catalog.record_import(path, stat, self.settings, decision)
 
-        for entry in folder.iterdir():
-            if entry.is_dir():
-                if Folder.is_internal(entry) and (not entry == self.input_folder.joinpath(self.no_date_base)):
-                    self.print(f'Skipping folder {entry}')  # We always process no_date_base
+    async def convert_folder(self, files: List[Union[FileCleaner, ImageCleaner]]) -> \
+            Tuple[List[Union[FileCleaner, ImageCleaner]], Dict[int, Source], Optional[Path]]:
+        """
+        Convert the HEIC files of a folder to JPEG in the conversion pool (see backend.convert).   The originals are
+        archived in migration_base (moved unless they are being kept) under the folder they came from and the
+        conversions are imported in their place.
+        :param files: The files of the folder
+        :return: (The files to import,  conversion (by id) -> its Source,  the folder the conversions are in)
+        """
+        heic = [entry for entry in files if isinstance(entry, ImageCleaner) and entry.is_valid and
+                entry.path.suffix.upper() in ImageCleaner.CONVERSION_SUFFIX]
+        if not heic:
+            return files, {}, None
+        self.conversions += 1
+        work = Path(self.working_folder.name).joinpath(str(self.conversions))
+        converted = dict((id(original), conversion) for original, conversion in
+                         await convert_images(self.converter, heic, work))
+        originals = {}
+        result = []
+        for entry in files:
+            conversion = converted.get(id(entry))
+            if conversion:
+                self.print(f'.. Converted {entry.path}')
+                originals[id(conversion)] = (entry, entry.path, entry.stat(), not self.remove_file(entry))
+                try:  # Keep the input folders,  so same named files in different folders do not meet
+                    base = entry.path.parent.relative_to(self.input_folder)
+                except ValueError:  # pragma: no cover
+                    base = Path()
+                operation = entry.relocate_file(self.output_folder.joinpath(self.migration_base).joinpath(base),
+                                                remove=self.remove_file(entry))
+                if operation and self.transfers:
+                    await self.transfers.submit(operation)
+            result.append(conversion or entry)
+        return result, originals, work
+
+    async def apply_plan(self, folder: Path):
+        """
+        Import a folder by planning all of it first and then doing the operations concurrently (see PlanExecutor).
+        Every decision sees the library as the operations before it would leave it,  without waiting for them.   The
+        journal still covers each operation,  but the import manifest and completed folders are not recorded.
+        :param folder:
+        :return:
+        """
+        operations = list(self.plan(folder))
+        self.print(f'Applying {len(operations)} operations.')
+        executor = PlanExecutor(workers=self.io_workers)
+        await executor.execute(operations)
+        self.catalog.commit()
+        for line in executor.report():
+            self.print(f'  {line}')
+        if executor.failures:
+            self.print(f'  {executor.failures} operations failed,  see the log')
+
+    def plan(self, folder: Path) -> Iterator[Operation]:
+        """
+        Work out everything importing folder would do,  without changing a file.   Operations are yielded as they are
+        decided,  each decision takes the ones before it into account.   setup must have been called,  and since the
+        registry is left as if the plan had been done,  a fresh setup is needed before a real import.
+        :param folder:
+        :return: The operations,  in the order they would be done
+        """
+        catalog, journal = self.library.catalog, self.library.journal
+        self.library.catalog = self.library.journal = None  # Nothing is really happening
+        self.library.planner = Simulation()
+        try:
+            for _, this_folder, files in self._scan_input(folder):
+                for entry in files:
+                    yield from self.decide(entry, this_folder)[1]
+        finally:
+            self.library.planner = None
+            self.library.catalog, self.library.journal = catalog, journal
+
+    def _scan_input(self, folder: Path) -> Iterator[Tuple[FolderScan, Folder, List[Union[FileCleaner, ImageCleaner]]]]:
+        """
+        Walk the input,  skipping what has already been imported
+        :param folder:
+        :return: (The folder listing,  the Folder,  the files that need importing)
+        """
+        for scan in walk(folder, prune=self._skip_folder):
+            if self.journal and self.journal.is_done(scan.path):
+                self.print(f'Already imported: {scan.path}')
+                continue
+            self.print(f'Scanning Folder: {scan.path}')
+            this_folder = Folder(scan.path, self.input_folder, cache=False, library=self.library)
+            if scan.path == self.output_folder.joinpath(self.no_date_base):
+                this_folder.description = ''  # This is a special case where we are reimporting ourselves
+
+            files = []
+            for entry in scan.files:
+                path, stat = Path(entry.path), stat_entry(entry)
+                if stat and self.catalog.import_decision(path, stat, self.settings):  # Unchanged since the last run
+                    self.increment_progress()
+                    self.skipped += 1
                 else:
-                    await self.import_folder(entry)
-            else:
-                self.print(f'. File: {entry}')
-                await self.import_file(make_cleaner_object(entry), this_folder)
+                    files.append(make_cleaner_object(path, stat=stat, library=self.library))
+            yield scan, this_folder, files
+
+    def _skip_folder(self, entry: os.DirEntry) -> bool:
+        """
+        Internal folders are not imported,  except for no_date_base which we always process
+        :param entry:
+        :return: True to skip
+        """
+        path = Path(entry.path)
+        if Folder.is_internal(path, self.library) and path != self.input_folder.joinpath(self.no_date_base):
+            self.print(f'Skipping folder {path}')
+            return True
+        return False
 
     def remove_file(self, obj: Union[FileCleaner, ImageCleaner] = None) -> bool:
         """
@@ -0,0 +1,144 @@
+"""
+Append only journal of the file operations of a run,  so an interrupted run can be cleaned up and resumed
+"""
+import json
+import logging
+import os
+import threading
+
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger('Cleaner')
+
+
+class Journal:
+    """
+    One JSON record per line.   An operation is written as an intent before it touches the disk and as done once it
+    has finished,  any intent without a done was interrupted.   Input folders are recorded once all their files have
+    been imported,  so a resumed run (same input and output) can skip them.
+
+    Records are flushed as they are written,  that survives the process being killed (but not the power going out).
+    Operations can be journaled from several threads at once.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.header: Optional[Dict] = None  # The run the existing journal belongs to
+        self.pending: Dict[int, Dict] = {}  # Interrupted operations, by id
+        self.completed: Set[str] = set()  # Input folders that were completely imported
+        self._next_id = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """
+        Read what an earlier run left behind
+        :return:
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:  # The last line may be incomplete
+                logger.debug('Skipping a damaged journal record %s', line)
+                continue
+            if record['op'] == 'run':
+                self.header = record
+            elif record['op'] == 'folder':
+                self.completed.add(record['path'])
+            elif record['op'] == 'done':
+                self.pending.pop(record['id'], None)
+            else:
+                self.pending[record['id']] = record
+            self._next_id = max(self._next_id, record.get('id', 0) + 1)
+
+    def start(self, input_folder: Path, output_folder: Path):
+        """
+        Begin journaling a run.   Any pending operations must have been dealt with by now.   If this is not the same
+        run as the one in the journal,  the completed folders are forgotten.
+        :param input_folder:
+        :param output_folder:
+        :return:
+        """
+        header = {'op': 'run', 'input': input_folder.as_posix(), 'output': output_folder.as_posix()}
+        if self.header != header:
+            self.completed.clear()
+        self.header = header
+        self.pending.clear()
+
+        temp = self.path.with_name(f'{self.path.name}.new')  # Compact what we are keeping into a fresh journal
+        with open(temp, 'w', encoding='utf-8') as file:
+            for record in [header] + [{'op': 'folder', 'path': path} for path in sorted(self.completed)]:
+                file.write(f'{json.dumps(record)}\n')
+        os.replace(temp, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+
+    def _write(self, record: Dict):
+        with self._lock:
+            if self._file:
+                self._file.write(f'{json.dumps(record)}\n')
+                self._file.flush()
+
+    def intent(self, operation: str, **values) -> int:
+        """
+        Record an operation we are about to do
+        :param operation: what it is,  relocate or rollover
+        :param values: what it needs to be rolled back or replayed,  must be JSON friendly
+        :return: The id to pass to done
+        """
+        with self._lock:
+            ident = self._next_id
+            self._next_id += 1
+        self._write({'op': operation, 'id': ident, **values})
+        return ident
+
+    def done(self, ident: int):
+        """
+        Record that an operation has finished
+        :param ident: from intent
+        :return:
+        """
+        self._write({'op': 'done', 'id': ident})
+
+    def folder_done(self, folder: Path):
+        """
+        Record that all the files of an input folder have been imported
+        :param folder:
+        :return:
+        """
+        self.completed.add(folder.as_posix())
+        self._write({'op': 'folder', 'path': folder.as_posix()})
+
+    def is_done(self, folder: Path) -> bool:
+        """
+        :param folder:
+        :return: True if an earlier attempt at this run imported this folder
+        """
+        return folder.as_posix() in self.completed
+
+    def close(self):
+        """
+        Stop journaling,  the journal is left behind for the next run
+        :return:
+        """
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        """
+        The run completed,  there is nothing to resume
+        :return:
+        """
+        self.close()
+        self.completed.clear()
+        self.header = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
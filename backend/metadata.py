@@ -0,0 +1,808 @@
+"""
+Read the EXIF dates (and the pixel dimensions) from the start of a JPEG or TIFF file,  rather than having piexif read
+and parse all of it.   Only the segment headers and the EXIF data itself are read,  usually a single small read.   HEIF
+pictures and QuickTime/MP4 movies are read the same way,  by skipping from box header to box header.
+
+ImageMetadataMixin puts these to work for ImageCleaner,  finding the date of an image and writing it back.
+"""
+import logging
+import os
+import re
+
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from xml.etree import ElementTree
+
+import piexif
+
+# pylint: disable=import-error
+from backend.file_ops import copy_file
+
+logger = logging.getLogger('Cleaner')
+
+HEADER_READ = 16 * 1024  # The first read,  enough for the EXIF of nearly every camera
+MAX_IFD_ENTRIES = 1024  # More than this and the file is not what it claims to be
+MAX_SEGMENTS = 64  # JPEG segments to look through before giving up on finding the frame header
+
+JPEG_START = b'\xff\xd8'
+PNG_START = b'\x89PNG\r\n\x1a\n'
+BMP_START = b'BM'
+HEIF_BRANDS = {b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1', b'avif'}
+MAX_BOXES = 256  # ISOBMFF boxes to look through,  per level
+MOVIE_BOXES = {b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot'}  # How a QuickTime file without an ftyp starts
+
+EXIF_FILES = ['.jpg', '.jpeg']  # The files set_date can update
+FN_DATE = re.compile(r'^([1-2]\d{3})([0-1]\d)([0-3]\d)_\d{6}')  # Phone style names,  20210927_010203.jpg
+MOVIE_EPOCH = 2082844800  # QuickTime and MP4 times are seconds since 1904
+MOVIE_DAY = b'\xa9day'  # The recording date in udta (QuickTime) or an ilst (MP4)
+MOVIE_DATE_KEY = b'com.apple.quicktime.creationdate'  # Where phones put it,  in the meta keys
+MOVIE_FORMATS = (('%Y-%m-%dT%H:%M:%S', 19), ('%Y-%m-%d', 10))  # 2021-10-07T14:27:20+0100 or just the day
+TIFF_STARTS = {b'II*\x00': 'little', b'MM\x00*': 'big'}
+EXIF_HEADER = b'Exif\x00\x00'
+EXIF_DATE = '%Y:%m:%d %H:%M:%S'
+APP0, APP1 = 0xE0, 0xE1
+START_OF_SCAN = 0xDA
+END_OF_IMAGE = 0xD9
+STANDALONE = {0x01} | set(range(0xD0, 0xD8))  # Markers without a length
+START_OF_FRAME = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}  # Frame headers,  not DHT/JPG/DAC
+
+ASCII, SHORT, LONG = 2, 3, 4
+EMPTY_EXIF = ('0th', 'Exif', 'GPS', 'Interop', '1st')  # What piexif.load gives for a JPEG without EXIF
+ZEROTH_TAGS = {piexif.ImageIFD.DateTime, piexif.ImageIFD.ImageWidth, piexif.ImageIFD.ImageLength}
+EXIF_TAGS = {piexif.ExifIFD.DateTimeOriginal, piexif.ExifIFD.DateTimeDigitized, piexif.ExifIFD.PixelXDimension,
+             piexif.ExifIFD.PixelYDimension}
+
+
+SIDECAR_SUFFIX = '.xmp'
+SIDECAR_DATES = ['{http://ns.adobe.com/exif/1.0/}DateTimeOriginal', '{http://ns.adobe.com/xap/1.0/}CreateDate',
+                 '{http://ns.adobe.com/exif/1.0/}DateTimeDigitized', '{http://ns.adobe.com/photoshop/1.0/}DateCreated']
+SIDECAR = """<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/">
+ <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+  <rdf:Description rdf:about="" xmlns:xmp="http://ns.adobe.com/xap/1.0/" xmlns:exif="http://ns.adobe.com/exif/1.0/"
+   xmp:CreateDate="{date}" exif:DateTimeDigitized="{date}"/>
+ </rdf:RDF>
+</x:xmpmeta>
+<?xpacket end="w"?>
+"""
+
+
+class HeaderError(ValueError):
+    """
+    The file is not laid out the way we expect,  let piexif have a go
+    """
+
+
+class _Reader:
+    """
+    Random access to the start of a file,  reads are served from what has been read so far when they can be
+    """
+    def __init__(self, file: BinaryIO, base: int = 0):
+        self.file = file
+        self.base = base  # Offsets are relative to this,  TIFF offsets inside a JPEG are relative to the TIFF header
+        self.buffer = file.read(HEADER_READ)
+
+    def at(self, base: int) -> '_Reader':
+        """
+        :param base: file offset
+        :return: A reader sharing our buffer,  with offsets relative to base
+        """
+        reader = _Reader.__new__(_Reader)
+        reader.file, reader.base, reader.buffer = self.file, base, self.buffer
+        return reader
+
+    def read(self, offset: int, count: int) -> bytes:
+        """
+        :param offset: relative to base
+        :param count:
+        :return: exactly count bytes
+        """
+        start = self.base + offset
+        if start + count > len(self.buffer) and start <= len(self.buffer) + HEADER_READ:  # Just read a bit more
+            self.file.seek(len(self.buffer))
+            self.buffer += self.file.read(start + count - len(self.buffer) + HEADER_READ)
+        if start + count <= len(self.buffer):
+            data = self.buffer[start:start + count]
+        else:  # A long way off,  read just what is needed
+            self.file.seek(start)
+            data = self.file.read(count)
+        if len(data) != count or offset < 0:
+            raise HeaderError(f'Short read at {start}')
+        return data
+
+
+def _read_ifd(reader: _Reader, offset: int, order: str, wanted: set) -> Dict[int, object]:
+    """
+    Read the tags we want from one IFD
+    :param reader:
+    :param offset: of the IFD
+    :param order: byte order
+    :param wanted: tag numbers
+    :return: tag -> bytes (ASCII,  without the trailing NUL) or int (SHORT/LONG)
+    """
+    count = int.from_bytes(reader.read(offset, 2), order)
+    if count > MAX_IFD_ENTRIES:
+        raise HeaderError(f'{count} IFD entries')
+    entries = reader.read(offset + 2, count * 12)
+    values = {}
+    for start in range(0, count * 12, 12):
+        tag = int.from_bytes(entries[start:start + 2], order)
+        if tag not in wanted:
+            continue
+        kind = int.from_bytes(entries[start + 2:start + 4], order)
+        length = int.from_bytes(entries[start + 4:start + 8], order)
+        field = entries[start + 8:start + 12]
+        if kind == ASCII:
+            data = field[:length] if length <= 4 else reader.read(int.from_bytes(field, order), length)
+            values[tag] = data[:-1] if data.endswith(b'\x00') else data
+        elif kind == SHORT:
+            values[tag] = int.from_bytes(field[:2], order)
+        elif kind == LONG:
+            values[tag] = int.from_bytes(field, order)
+    return values
+
+
+def _read_tiff(reader: _Reader) -> Dict:
+    """
+    :param reader: based at the TIFF header
+    :return: piexif style dictionary of what we found
+    """
+    header = reader.read(0, 8)
+    order = TIFF_STARTS.get(header[:4])
+    if not order:
+        raise HeaderError('Not a TIFF header')
+    zeroth = _read_ifd(reader, int.from_bytes(header[4:8], order), order, ZEROTH_TAGS | {piexif.ImageIFD.ExifTag})
+    exif_offset = zeroth.pop(piexif.ImageIFD.ExifTag, None)
+    exif = _read_ifd(reader, exif_offset, order, EXIF_TAGS) if exif_offset else {}
+    result = {'0th': zeroth, 'Exif': exif}
+    if piexif.ImageIFD.ImageWidth in zeroth and piexif.ImageIFD.ImageLength in zeroth:
+        result['dimensions'] = (zeroth[piexif.ImageIFD.ImageWidth], zeroth[piexif.ImageIFD.ImageLength])
+    return result
+
+
+def _read_jpeg(reader: _Reader) -> Dict:
+    """
+    Walk the segments up to the frame header,  parsing the EXIF APP1 segment on the way
+    :param reader:
+    :return: piexif style dictionary of what we found
+    """
+    result = {'0th': {}, 'Exif': {}}
+    offset = 2
+    for _ in range(MAX_SEGMENTS):
+        header = reader.read(offset, 4)
+        if header[0] != 0xFF:
+            raise HeaderError(f'No marker at {offset}')
+        marker = header[1]
+        if marker == 0xFF:  # Fill byte
+            offset += 1
+            continue
+        if marker in STANDALONE:
+            offset += 2
+            continue
+        if marker in (START_OF_SCAN, END_OF_IMAGE):
+            break
+        length = int.from_bytes(header[2:4], 'big')
+        if marker == APP1 and length > 8 and reader.read(offset + 4, 6) == EXIF_HEADER:
+            result.update(_read_tiff(reader.at(reader.base + offset + 10)))
+        elif marker in START_OF_FRAME:
+            frame = reader.read(offset + 5, 4)
+            result['dimensions'] = (int.from_bytes(frame[2:4], 'big'), int.from_bytes(frame[0:2], 'big'))
+            break
+        offset += 2 + length
+    return result
+
+
+def read_exif(path: Path) -> Optional[Dict]:
+    """
+    Read the dates and dimensions from the headers of a JPEG,  TIFF or HEIF (HEIC) file,  or the dates of a QuickTime
+    or MP4 movie
+    :param path:
+    :return: A dictionary laid out like piexif.load's ('0th' and 'Exif' with only the date and dimension tags), plus
+    'dimensions' (width, height) if they were found.   None if this is not a file we can read this way.
+    """
+    with open(path, 'rb') as file:
+        reader = _Reader(file)
+        try:
+            if reader.buffer.startswith(JPEG_START):
+                return _read_jpeg(reader)
+            if reader.buffer[:4] in TIFF_STARTS:
+                return _read_tiff(reader)
+            if _is_heif(reader.buffer):
+                return _read_heif(reader)
+            if _is_movie(reader.buffer):
+                return _read_movie(reader)
+        except HeaderError as error:
+            logger.debug('Could not read the headers of %s (%s)', path, error)
+    return None
+
+
+def load_exif(path: Path) -> Dict:
+    """
+    read_exif,  falling back on piexif for anything it can not read
+    :param path:
+    :return: piexif style dictionary
+    """
+    exif_dict = read_exif(path)
+    return exif_dict if exif_dict is not None else piexif.load(str(path))
+
+
+def _boxes(reader: _Reader, start: int, end: Optional[int]) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Walk the ISOBMFF boxes between two offsets
+    :param reader:
+    :param start:
+    :param end: None for the end of the file
+    :return: (type,  offset of the contents,  size of the contents)
+    """
+    offset = start
+    for _ in range(MAX_BOXES):
+        if end is not None and offset + 8 > end:
+            return
+        try:
+            header = reader.read(offset, 8)
+        except HeaderError:
+            return  # The end of the file
+        size, kind, skip = int.from_bytes(header[:4], 'big'), header[4:8], 8
+        if size == 1:  # 64 bit size
+            size, skip = int.from_bytes(reader.read(offset + 8, 8), 'big'), 16
+        elif size == 0:  # To the end
+            size = (end - offset) if end is not None else 1 << 62
+        if size < skip:
+            raise HeaderError(f'Box {kind} at {offset} is {size} bytes')
+        yield kind, offset + skip, size - skip
+        offset += size
+
+
+def _child(reader: _Reader, start: int, end: Optional[int], kind: bytes,
+           full: bool = False) -> Optional[Tuple[int, int]]:
+    """
+    Find a box inside another
+    :param reader:
+    :param start: The contents of the parent
+    :param end: The end of the parent,  None for the top level
+    :param kind: The box type wanted
+    :param full: The parent is a FullBox,  its contents start with a version and flags
+    :return: (start,  end) of the contents or None
+    """
+    for child, offset, length in _boxes(reader, start + (4 if full else 0), end):
+        if child == kind:
+            return offset, offset + length
+    return None
+
+
+class _HeifItems:  # pylint: disable=too-few-public-methods
+    """
+    What the meta box of a HEIF file (HEIC) says about its items,  enough to find the Exif item and the size of the
+    primary image without decoding anything.
+    """
+    def __init__(self, reader: _Reader):
+        self.reader = reader
+        self.primary: Optional[int] = None  # pitm
+        self.types: Dict[int, bytes] = {}  # item -> type,  iinf/infe
+        self.locations: Dict[int, List[Tuple[int, int]]] = {}  # item -> (file offset,  length) extents,  iloc
+        self.properties: List[Tuple[bytes, int, int]] = []  # iprp/ipco,  (type,  start,  end) in index order
+        self.associations: Dict[int, List[int]] = {}  # item -> property indexes (from 1),  iprp/ipma
+
+        meta = _child(reader, 0, None, b'meta')
+        if not meta:
+            raise HeaderError('No meta box')
+        idat = None
+        boxes = list(_boxes(reader, meta[0] + 4, meta[1]))
+        for kind, offset, length in boxes:
+            if kind == b'idat':
+                idat = offset
+        for kind, offset, length in boxes:
+            if kind == b'pitm':
+                version = reader.read(offset, 1)[0]
+                self.primary = int.from_bytes(reader.read(offset + 4, 2 if version == 0 else 4), 'big')
+            elif kind == b'iinf':
+                self._read_iinf(offset, offset + length)
+            elif kind == b'iloc':
+                self._read_iloc(offset, idat)
+            elif kind == b'iprp':
+                self._read_iprp(offset, offset + length)
+
+    def _read_iinf(self, start: int, end: int):
+        version = self.reader.read(start, 1)[0]
+        for kind, offset, _ in _boxes(self.reader, start + (6 if version == 0 else 8), end):
+            if kind == b'infe' and self.reader.read(offset, 1)[0] >= 2:  # Only version 2+ entries have a type
+                id_size = 2 if self.reader.read(offset, 1)[0] == 2 else 4
+                entry = self.reader.read(offset + 4, id_size + 6)
+                self.types[int.from_bytes(entry[:id_size], 'big')] = entry[id_size + 2:id_size + 6]
+
+    def _read_iloc(self, start: int, idat: Optional[int]):
+        def number(size: int) -> int:
+            nonlocal offset
+            offset += size
+            return int.from_bytes(self.reader.read(offset - size, size), 'big') if size else 0
+
+        offset = start
+        version = number(1)
+        offset += 3  # Flags
+        sizes = number(2)
+        offset_size, length_size, base_size, index_size = sizes >> 12, (sizes >> 8) & 15, (sizes >> 4) & 15, sizes & 15
+        index_size = index_size if version in (1, 2) else 0
+        for _ in range(number(2 if version < 2 else 4)):
+            item = number(2 if version < 2 else 4)
+            method = number(2) & 15 if version in (1, 2) else 0
+            offset += 2  # Data reference,  always this file
+            base = number(base_size)
+            extents = []
+            for _ in range(number(2)):
+                number(index_size)
+                extents.append((base + number(offset_size), number(length_size)))
+            if method == 0:
+                self.locations[item] = extents
+            elif method == 1 and idat is not None:  # In the idat box
+                self.locations[item] = [(idat + extent, length) for extent, length in extents]
+
+    def _read_iprp(self, start: int, end: int):
+        ipco = _child(self.reader, start, end, b'ipco')
+        if ipco:
+            self.properties = [(kind, offset, offset + length) for kind, offset, length in _boxes(self.reader, *ipco)]
+        ipma = _child(self.reader, start, end, b'ipma')
+        if not ipma:
+            return
+        header = self.reader.read(ipma[0], 8)
+        version, wide, offset = header[0], header[3] & 1, ipma[0] + 8
+        for _ in range(int.from_bytes(header[4:8], 'big')):
+            id_size = 2 if version < 1 else 4
+            item = int.from_bytes(self.reader.read(offset, id_size), 'big')
+            count = self.reader.read(offset + id_size, 1)[0]
+            offset += id_size + 1
+            data = self.reader.read(offset, count * (2 if wide else 1))
+            offset += len(data)
+            self.associations[item] = [int.from_bytes(data[index:index + 2], 'big') & 0x7FFF if wide else
+                                       data[index] & 0x7F for index in range(0, len(data), 2 if wide else 1)]
+
+    def read_item(self, item: int) -> bytes:
+        """
+        :param item:
+        :return: The data of an item
+        """
+        return b''.join(self.reader.read(offset, length) for offset, length in self.locations.get(item, []))
+
+    def exif(self) -> Optional[int]:
+        """
+        :return: The file offset of the TIFF header of the Exif item,  if there is one
+        """
+        for item, kind in self.types.items():
+            if kind == b'Exif' and len(self.locations.get(item, [])) == 1:
+                offset, _ = self.locations[item][0]
+                return offset + 4 + int.from_bytes(self.reader.read(offset, 4), 'big')  # Skip any Exif\0\0
+        return None
+
+    def dimensions(self) -> Optional[Tuple[int, int]]:
+        """
+        :return: The image spatial extent (ispe) of the primary item,  or failing that the biggest one
+        """
+        sizes = []
+        for index, (kind, offset, end) in enumerate(self.properties, start=1):
+            if kind == b'ispe' and end - offset >= 12:
+                data = self.reader.read(offset + 4, 8)  # After the version and flags
+                size = (int.from_bytes(data[:4], 'big'), int.from_bytes(data[4:], 'big'))
+                if index in self.associations.get(self.primary, []):
+                    return size
+                sizes.append(size)
+        return max(sizes, key=lambda size: size[0] * size[1]) if sizes else None
+
+
+def _read_heif(reader: _Reader) -> Dict:
+    """
+    :param reader:
+    :return: piexif style dictionary of what we found in the Exif item and the properties
+    """
+    items = _HeifItems(reader)
+    exif = items.exif()
+    result = _read_tiff(reader.at(exif)) if exif is not None else {'0th': {}, 'Exif': {}}
+    size = items.dimensions()
+    if size:
+        result['dimensions'] = size
+    return result
+
+
+def _is_heif(start: bytes) -> bool:
+    return start[4:8] == b'ftyp' and start[8:12] in HEIF_BRANDS
+
+
+def _is_movie(start: bytes) -> bool:
+    return (start[4:8] == b'ftyp' and not _is_heif(start)) or start[4:8] in MOVIE_BOXES
+
+
+def _movie_date(text: bytes) -> Optional[bytes]:
+    """
+    :param text: An ISO 8601 date as the camera wrote it
+    :return: The date in EXIF form,  in the time zone it was recorded in
+    """
+    value = text.decode('utf-8', errors='replace').strip('\x00 ')
+    for pattern, length in MOVIE_FORMATS:
+        try:
+            return datetime.strptime(value[:length], pattern).strftime(EXIF_DATE).encode()
+        except ValueError:
+            pass
+    return None
+
+
+def _read_movie_meta(reader: _Reader, start: int, end: int) -> Optional[bytes]:
+    """
+    The recording date from a meta box,  either Apple's creationdate key or an iTunes style \xa9day item
+    :param reader:
+    :param start:
+    :param end:
+    :return: The text of the date
+    """
+    if reader.read(start, 4) == b'\x00\x00\x00\x00':
+        start += 4  # Version and flags,  meta is a FullBox in MP4 files but not in QuickTime ones
+    ilst = _child(reader, start, end, b'ilst')
+    if not ilst:
+        return None
+    names = {}
+    keys = _child(reader, start, end, b'keys')
+    if keys:
+        offset = keys[0] + 8
+        for index in range(1, min(int.from_bytes(reader.read(keys[0] + 4, 4), 'big'), MAX_BOXES) + 1):
+            size = int.from_bytes(reader.read(offset, 4), 'big')
+            if size < 8 or offset + size > keys[1]:
+                break
+            names[index.to_bytes(4, 'big')] = reader.read(offset + 8, size - 8)  # After the size and namespace
+            offset += size
+    for kind, offset, length in _boxes(reader, *ilst):
+        if kind == MOVIE_DAY or names.get(kind) == MOVIE_DATE_KEY:
+            data = _child(reader, offset, offset + length, b'data')
+            if data and data[1] - data[0] > 8:  # After the type and locale
+                return reader.read(data[0] + 8, min(data[1] - data[0] - 8, 64))
+    return None
+
+
+def _read_movie(reader: _Reader) -> Dict:
+    """
+    The dates of a QuickTime (.mov) or MP4 movie,  found by skipping from box header to box header so only a few small
+    reads are needed however big the movie is.   The recording date (from the meta keys or udta) is local time and goes
+    in DateTimeOriginal,  the mvhd creation time is UTC and goes in DateTime.
+    :param reader:
+    :return: piexif style dictionary,  plus 'duration' in seconds if the mvhd has one
+    """
+    result: Dict = {'0th': {}, 'Exif': {}}
+    moov = _child(reader, 0, None, b'moov')
+    if not moov:
+        return result
+    mvhd = _child(reader, *moov, b'mvhd')
+    if mvhd:
+        wide = reader.read(mvhd[0], 1)[0] == 1
+        seconds = int.from_bytes(reader.read(mvhd[0] + 4, 8 if wide else 4), 'big')
+        timing = reader.read(mvhd[0] + (20 if wide else 12), 12 if wide else 8)  # After the modification time
+        timescale, duration = int.from_bytes(timing[:4], 'big'), int.from_bytes(timing[4:], 'big')
+        if timescale:
+            result['duration'] = duration / timescale
+        if seconds > MOVIE_EPOCH:  # Cameras that do not know the time write 0
+            try:
+                created = datetime.fromtimestamp(seconds - MOVIE_EPOCH).strftime(EXIF_DATE).encode()
+                result['0th'][piexif.ImageIFD.DateTime] = created
+            except (OverflowError, OSError, ValueError):  # pragma: no cover
+                pass
+    text = None
+    meta = _child(reader, *moov, b'meta')
+    if meta:
+        text = _read_movie_meta(reader, *meta)
+    udta = _child(reader, *moov, b'udta')
+    if udta and not text:
+        day = _child(reader, *udta, MOVIE_DAY)
+        if day and day[1] - day[0] > 4:  # After the length and language
+            text = reader.read(day[0] + 4, min(day[1] - day[0] - 4, 64))
+        meta = _child(reader, *udta, b'meta')
+        if meta and not text:
+            text = _read_movie_meta(reader, *meta)
+    recorded = _movie_date(text) if text else None
+    if recorded:
+        result['Exif'][piexif.ExifIFD.DateTimeOriginal] = recorded
+    return result
+
+
+def movie_duration(path: Path) -> Optional[float]:
+    """
+    :param path: A QuickTime or MP4 movie
+    :return: Its duration in seconds from the mvhd box,  None if we can not tell
+    """
+    exif_dict = read_exif(path)
+    return exif_dict.get('duration') if exif_dict else None
+
+
+def probe_dimensions(path: Path) -> Optional[Tuple[int, int]]:
+    """
+    The size of a picture from its headers alone (JPEG frame header,  PNG IHDR,  BMP header,  TIFF IFD or HEIF ispe)
+    :param path:
+    :return: (width,  height) or None if this is not a picture we can read this way
+    """
+    try:
+        with open(path, 'rb') as file:
+            reader = _Reader(file)
+            start = reader.buffer[:16]
+            if start.startswith(JPEG_START):
+                return _read_jpeg(reader).get('dimensions')
+            if start.startswith(PNG_START) and start[12:16] == b'IHDR':
+                header = reader.read(16, 8)
+                return int.from_bytes(header[:4], 'big'), int.from_bytes(header[4:], 'big')
+            if start[:4] in TIFF_STARTS:
+                return _read_tiff(reader).get('dimensions')
+            if start.startswith(BMP_START) and len(reader.buffer) >= 26:
+                header = reader.read(18, 8)
+                return (int.from_bytes(header[:4], 'little', signed=True),
+                        abs(int.from_bytes(header[4:], 'little', signed=True)))  # Negative for top down
+            if _is_heif(start):
+                return _HeifItems(reader).dimensions()
+    except HeaderError as error:
+        logger.debug('Could not read the size of %s (%s)', path, error)
+    return None
+
+
+def _segments(reader: _Reader) -> List[Tuple[int, int, int]]:
+    """
+    :param reader:
+    :return: (marker,  offset,  size) of the JPEG segments before the image data,  as piexif splits them
+    """
+    segments = []
+    offset = 2
+    while len(segments) < MAX_SEGMENTS:
+        header = reader.read(offset, 4)
+        if header[0] != 0xFF or header[1] in (START_OF_SCAN, END_OF_IMAGE):
+            break
+        size = 2 + int.from_bytes(header[2:4], 'big')
+        segments.append((header[1], offset, size))
+        offset += size
+    return segments
+
+
+def exif_header(path: Path, change: Callable[[Dict], None]) -> Tuple[bytes, int]:
+    """
+    Change the EXIF of a JPEG without reading the rest of it.   The new file is the header returned followed by the
+    source from the offset returned,  laid out just as piexif.insert would have it.
+    :param path: JPEG
+    :param change: Called with the piexif dictionary of the file,  to change it
+    :return: (header,  offset)
+    """
+    with open(path, 'rb') as file:
+        reader = _Reader(file)
+        if not reader.buffer.startswith(JPEG_START):
+            raise piexif.InvalidImageDataError(f'{path} is not a JPEG')
+        try:
+            segments = _segments(reader)
+            exif_segments = [index for index, (marker, offset, size) in enumerate(segments)
+                             if marker == APP1 and size > 10 and reader.read(offset + 4, 6) == EXIF_HEADER]
+            if exif_segments:
+                _, offset, size = segments[exif_segments[0]]
+                exif_dict = piexif.load(reader.read(offset + 4, size - 4))
+            else:
+                exif_dict = {key: {} for key in EMPTY_EXIF}
+                exif_dict['thumbnail'] = None
+        except HeaderError as error:
+            raise piexif.InvalidImageDataError(f'{path} is not a complete JPEG ({error})') from error
+
+    change(exif_dict)
+    exif = piexif.dump(exif_dict)
+    new_segment = b'\xff\xe1' + (len(exif) + 2).to_bytes(2, 'big') + exif
+
+    # The segments piexif.merge_segments replaces (it also drops a JFIF APP0 segment)
+    first = segments[0][0] if segments else None
+    if first == APP0 and 1 in exif_segments:
+        replaced = 2
+    elif first == APP0 or 0 in exif_segments:
+        replaced = 1
+    else:
+        replaced = 0
+    _, offset, size = segments[replaced - 1] if replaced else (None, 0, 2)
+    return JPEG_START + new_segment, offset + size
+
+
+def dimensions(exif_dict: Dict) -> Optional[Tuple[int, int]]:
+    """
+    :param exif_dict: from load_exif
+    :return: (width, height) from the frame header,  or failing that the tags
+    """
+    if exif_dict.get('dimensions'):
+        return exif_dict['dimensions']
+    exif, zeroth = exif_dict.get('Exif', {}), exif_dict.get('0th', {})
+    for width, height, values in ((piexif.ExifIFD.PixelXDimension, piexif.ExifIFD.PixelYDimension, exif),
+                                  (piexif.ImageIFD.ImageWidth, piexif.ImageIFD.ImageLength, zeroth)):
+        if width in values and height in values:
+            return values[width], values[height]
+    return None
+
+
+def sidecar_path(path: Path) -> Path:
+    """
+    :param path: An image
+    :return: Its XMP sidecar,  image.jpg -> image.jpg.xmp so images differing only by type do not share one
+    """
+    return path.with_name(f'{path.name}{SIDECAR_SUFFIX}')
+
+
+def read_sidecar(path: Path) -> Optional[datetime]:
+    """
+    Read the date from the XMP sidecar of an image,  the first of the usual date properties that is set
+    :param path: The image
+    :return: datetime or None if there is no sidecar or it has no date
+    """
+    try:
+        root = ElementTree.parse(sidecar_path(path)).getroot()
+    except FileNotFoundError:
+        return None
+    except ElementTree.ParseError as error:
+        logger.debug('Can not read the sidecar of %s (%s)', path, error)
+        return None
+    for name in SIDECAR_DATES:
+        for element in root.iter():
+            value = element.get(name) or (element.text if element.tag == name else None)
+            if value and value.strip():
+                try:
+                    return datetime.fromisoformat(value.strip()[:19])
+                except ValueError:
+                    logger.debug('Corrupt sidecar date %s in %s', value, path)
+    return None
+
+
+def write_sidecar(path: Path, date: datetime):
+    """
+    Record the date of an image in an XMP sidecar,  so the image itself is never rewritten
+    :param path: The image
+    :param date:
+    :return:
+    """
+    sidecar = sidecar_path(path)
+    temp = sidecar.with_name(f'.{sidecar.name}.new')
+    temp.write_text(SIDECAR.format(date=date.strftime('%Y-%m-%dT%H:%M:%S')), encoding='utf-8')
+    os.replace(temp, sidecar)
+
+
+class ImageMetadataMixin:
+    """
+    Working out the date of an image and putting it back in its metadata (or a sidecar),  for ImageCleaner
+    """
+    @property
+    def date(self) -> Optional[datetime]:
+        """
+        return the cached date or go and try and fetch it
+        :return: datetime or None
+        """
+        if not self._date and self.library.sidecar_dates:
+            self._date = read_sidecar(self.content_path)
+            self._metadate = self._sidecar_date = bool(self._date)
+        if not self._date:
+            self._date = None if self._date_probed else self.get_date_from_image()
+            if not self._date:  # Short circuit to find a date
+                try:
+                    temp = self._date = FN_DATE.match(self.path.stem).groups()
+                    self._date = datetime(int(temp[0]), int(temp[1]), int(temp[2]))
+                except AttributeError:  #os.stat(self.path).st_size == os.stat(other.path).st_size
+                    pass
+                except ValueError:  # pragma: no cover
+                    pass
+                if not self._date:
+                    self._date = self.folder.date if self.folder else None
+            else:
+                self._metadate = True
+        return self._date
+
+    def apply_metadata(self, values: Dict):
+        """
+        Take the results of an extraction done elsewhere (see backend.extract)
+        :param values: date, and optionally small,  dimensions,  image_data and perceptual_hash
+        :return:
+        """
+        sidecar = read_sidecar(self.content_path) if self.library.sidecar_dates and not self._date else None
+        if sidecar:  # As in date,  the sidecar wins over the image's own date
+            self._date = sidecar
+            self._metadate = self._sidecar_date = True
+        elif values['date']:
+            self._date = values['date']
+            self._metadate = True
+        else:
+            self._date_probed = True
+        if 'small' in values:
+            self.__dict__['is_small'] = values['small']  # Prime the cached_property
+        if values.get('dimensions') and not self._dimensions:
+            self._dimensions = values['dimensions']
+        if values.get('image_data') is not None:
+            self._image_data = values['image_data']
+        if values.get('perceptual_hash') is not None:
+            self._perceptual_hash = values['perceptual_hash']
+
+    @property
+    def updates_metadata(self) -> bool:
+        """
+        Only JPEG files that have a date from somewhere other than their own metadata are rewritten,  and then only if
+        the dates are not kept in sidecars
+        :return:
+        """
+        return (not self.library.sidecar_dates and self.path.suffix.lower() in EXIF_FILES and bool(self.date)
+                and not self._metadate)
+
+    def date_exif(self, exif_dict: Dict):
+        """
+        Set the 'Digitized' date of a piexif dictionary to our date
+        :param exif_dict:
+        :return:
+        """
+        exif_dict['Exif'][piexif.ExifIFD.DateTimeDigitized] = self.date.strftime("%Y:%m:%d %H:%M:%S")
+
+    def copy_content(self, source: Path, new_file: Path) -> Tuple[int, bool]:
+        """
+        A JPEG that set_date would rewrite gets its new EXIF as it is copied,  so the data is only read and written once
+        :param source:
+        :param new_file:
+        :return: (bytes written,  True if the date was set)
+        """
+        if self.updates_metadata:
+            try:
+                head, skip = exif_header(source, self.date_exif)
+            except (piexif.InvalidImageDataError, ValueError) as error:
+                logger.debug('Can not set the date of %s as it is copied (%s)', source, error)
+            else:
+                written = copy_file(source, new_file, head, skip)
+                self.forget_content()
+                return written, True
+        return super().copy_content(source, new_file)
+
+    # Ensure we have a date for the existing image
+    def set_date(self, path: Optional[Path] = None):
+        # original_file: Path, new_date: Union[datetime, None]):  # pragma: no cover
+        """
+        If we have a date, and we did not get it from the original image,  set the 'Digitized' date.   With
+        sidecar_dates it goes in the image's XMP sidecar instead and the image is left alone.
+
+        :param path: The copy to update,  if it is not (yet) our path
+        :return: None
+        """
+        path = path if path else self.path
+        if self.library.sidecar_dates:
+            if (not self._metadate or self._sidecar_date) and self.date:
+                write_sidecar(path, self.date)
+        elif not self._metadate and self.date:
+            try:
+                exif_dict = piexif.load(str(path))
+                self.date_exif(exif_dict)
+
+                # Save changes,  to a new file so we never write through a hard link to someone else's file
+                exif_bytes = piexif.dump(exif_dict)
+                new_file = path.with_name(f'.{path.name}.exif')
+                piexif.insert(exif_bytes, str(path), str(new_file))
+                os.replace(new_file, path)
+                self.forget_content()
+
+            except piexif.InvalidImageDataError:
+                pass  # This is to be expected
+
+    def get_date_from_image(self) -> Union[datetime, None]:  # pylint: disable=inconsistent-return-statements
+        """
+        Given an Image object,  attempt to extract the date it was take at
+        :return: datetime
+        """
+
+        image_date = None
+        try:
+            exif_dict = load_exif(self.content_path)
+            if exif_dict:
+                try:
+                    image_date = exif_dict['Exif'][piexif.ExifIFD.DateTimeOriginal]
+                except KeyError:
+                    try:
+                        image_date = exif_dict['Exif'][piexif.ExifIFD.DateTimeDigitized]
+                    except KeyError:
+                        try:
+                            image_date = exif_dict['0th'][piexif.ImageIFD.DateTime]
+                        except KeyError:
+                            pass
+
+            if image_date:
+                try:
+                    date_value, _ = str(image_date, 'utf-8').split(' ')
+                    return datetime.strptime(date_value, '%Y:%m:%d')
+                except ValueError:  # pragma: no cover
+                    logger.debug('Corrupt date data %s', self.path)
+            else:
+                logger.debug('Could not find a date in %s', self.path)
+
+        except piexif.InvalidImageDataError:
+            logger.debug('Failed to load %s - Invalid JPEG/TIFF', self.path)
+        except FileNotFoundError:
+            logger.debug('Failed to load %s - File not Found', self.path)
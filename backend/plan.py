@@ -0,0 +1,106 @@
+"""
+Import plans.   Deciding where each file goes is kept apart from moving it,  so the whole plan can be previewed,
+saved or applied in batches.
+"""
+import json
+
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Set
+
+MOVE = 'move'  # Write the destination,  then remove the source
+COPY = 'copy'  # Write the destination,  keep the source
+REMOVE = 'remove'  # The destination already exists and is kept,  remove the source
+KEEP = 'keep'  # The destination already exists and is kept,  so is the source
+
+
+class Operation(NamedTuple):
+    """
+    One relocation of a file
+    """
+    action: str  # MOVE, COPY, REMOVE or KEEP
+    source: Path
+    destination: Path  # The new file (not its folder)
+    rollover: bool = False  # The destination exists,  roll it over before writing
+    register: bool = False  # Register the file once it is at the destination
+    base_folder: Optional[Path] = None  # The output folder,  needed to register
+    decision: str = ''  # Why,  see ImageClean.import_file
+    obj: Any = None  # The cleaner object being relocated,  it is not part of the plan file
+
+    @property
+    def writes(self) -> bool:
+        """
+        :return: True if the destination is written
+        """
+        return self.action in (MOVE, COPY)
+
+    @property
+    def removes(self) -> bool:
+        """
+        :return: True if the source is removed
+        """
+        return self.action in (MOVE, REMOVE)
+
+    def to_dict(self) -> Dict:
+        """
+        :return: JSON friendly version
+        """
+        return {'action': self.action, 'source': self.source.as_posix(), 'destination': self.destination.as_posix(),
+                'rollover': self.rollover, 'register': self.register, 'decision': self.decision}
+
+    def to_json(self) -> str:
+        """
+        :return: One line of an NDJSON plan
+        """
+        return json.dumps(self.to_dict())
+
+
+class Outcome(NamedTuple):
+    """
+    What doing an operation really did
+    """
+    copied: bool = False  # The destination holds the content
+    renamed: bool = False  # It got there by a rename,  so it is still the same file
+    removed: bool = False  # The source has gone
+    written: int = 0  # Bytes of data that had to be copied
+
+
+class Simulation:
+    """
+    What the file system would look like if the operations planned so far had been done
+    """
+    def __init__(self):
+        self.created: Set[Path] = set()
+        self.removed: Set[Path] = set()
+
+    def exists(self, path: Path) -> bool:
+        """
+        :param path:
+        :return: True if the file would exist
+        """
+        if path in self.created:
+            return True
+        return path not in self.removed and path.exists()
+
+    def apply(self, operation: Operation):
+        """
+        Pretend to do an operation
+        :param operation:
+        :return:
+        """
+        if operation.writes:
+            self.created.add(operation.destination)
+            self.removed.discard(operation.destination)
+        if operation.removes:
+            self.removed.add(operation.source)
+            self.created.discard(operation.source)
+
+    def revert(self, operation: Operation):
+        """
+        Forget an operation that was applied but could not be done
+        :param operation:
+        :return:
+        """
+        if operation.writes:
+            self.created.discard(operation.destination)
+        if operation.removes:
+            self.removed.discard(operation.source)
@@ -0,0 +1,261 @@
+"""
+The registry of a library,  the files and folders of the output keyed by name and the files again keyed by content
+"""
+import re
+import threading
+
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, TypeVar
+
+# pylint: disable=import-error
+from backend.catalog import Catalog
+from backend.content_index import ContentIndex
+from backend.journal import Journal
+from backend.plan import Simulation
+from backend.similarity import BKTree
+
+CT = TypeVar("CT", bound="CleanerBase")  # pylint: disable=invalid-name
+FolderCT = TypeVar("FolderCT", bound="Folder")  # pylint: disable=invalid-name
+
+SHARDS = 16  # Locks for the files,  threads working on different names rarely share one
+
+
+def registry_key(path: Path) -> str:
+    """
+    Files are registered by name,  ignoring case and any rollover suffix (_0 .. _99)
+    :param path:
+    :return:
+    """
+    target = path.stem.upper()
+    parsed = re.match('(.+)_[0-9]{1,2}$', target)
+    if parsed:
+        target = parsed.groups()[0]
+    return target
+
+
+class FileBucket:
+    """
+    The registered files sharing a name (see registry_key),  in the order they were registered.   They are kept by id
+    so adding or removing one does not depend on how many there are.
+    """
+    def __init__(self):
+        self._members: Dict[int, CT] = {}
+
+    def append(self, obj: CT):
+        """
+        Add a file
+        :param obj:
+        :return:
+        """
+        self._members[id(obj)] = obj
+
+    def remove(self, obj: CT) -> bool:
+        """
+        Remove a file
+        :param obj:
+        :return: True if it was here
+        """
+        return self._members.pop(id(obj), None) is not None
+
+    def __contains__(self, obj: CT) -> bool:
+        return id(obj) in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def __iter__(self) -> Iterator[CT]:
+        return iter(list(self._members.values()))  # A snapshot,  another thread may change us while it is used
+
+    def __getitem__(self, index: int) -> CT:
+        return list(self._members.values())[index]
+
+    def __repr__(self) -> str:
+        return f'FileBucket({list(self._members.values())})'
+
+
+class FileMap(Mapping):
+    """
+    Registry key -> FileBucket.   The keys are spread over shards,  each with its own lock,  so threads registering
+    different names do not wait on each other.   Reading is not locked,  a dictionary lookup is atomic.
+    """
+    def __init__(self, shards: int = SHARDS):
+        self._shards: List[Dict[str, FileBucket]] = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def _shard(self, key: str) -> int:
+        return hash(key) % len(self._shards)
+
+    def __getitem__(self, key: str) -> FileBucket:
+        return self._shards[self._shard(key)][key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._shards[self._shard(key)]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def __iter__(self) -> Iterator[str]:
+        for shard in self._shards:
+            yield from list(shard)
+
+    def add(self, key: str, obj: CT):
+        """
+        Register a file under a name
+        :param key:
+        :param obj:
+        :return:
+        """
+        index = self._shard(key)
+        with self._locks[index]:
+            self._shards[index].setdefault(key, FileBucket()).append(obj)
+
+    def remove(self, key: str, obj: CT) -> bool:
+        """
+        Forget a file,  and the name once nothing else has it
+        :param key:
+        :param obj:
+        :return: True if it was registered under this name
+        """
+        index = self._shard(key)
+        with self._locks[index]:
+            bucket = self._shards[index].get(key)
+            if bucket is None or not bucket.remove(obj):
+                return False
+            if not bucket:
+                del self._shards[index][key]
+            return True
+
+    def clear(self):
+        """
+        Forget everything
+        :return:
+        """
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.clear()
+
+
+class Registry:
+    """
+    Everything known about the output of one library (see Library).   It is safe to change from several threads.
+    """
+    def __init__(self, shards: int = SHARDS):
+        self.files = FileMap(shards)
+        self.folders: Dict[str, FolderCT] = {}  # Path (posix) -> Folder
+        self.index = ContentIndex()
+        self._folder_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+
+    def add_file(self, key: str, obj: CT):
+        """
+        Register a file
+        :param key: Its registry key
+        :param obj:
+        :return:
+        """
+        self.files.add(key, obj)
+        with self._index_lock:
+            self.index.add(obj)
+
+    def remove_file(self, key: str, obj: CT) -> bool:
+        """
+        Forget a file
+        :param key: Its registry key
+        :param obj:
+        :return: True if it was registered
+        """
+        with self._index_lock:
+            self.index.remove(obj)
+        return self.files.remove(key, obj)
+
+    def reindex(self, obj: CT):
+        """
+        A registered file has changed size,  see ContentIndex.reindex
+        :param obj:
+        :return:
+        """
+        with self._index_lock:
+            self.index.reindex(obj)
+
+    def matches(self, obj: CT) -> List[CT]:
+        """
+        The registered files with the same content,  see ContentIndex.matches
+        :param obj:
+        :return:
+        """
+        return self.index.matches(obj)
+
+    def candidates(self, obj: CT) -> List[CT]:
+        """
+        The registered files that could have the same content,  see ContentIndex.candidates
+        :param obj:
+        :return:
+        """
+        return self.index.candidates(obj)
+
+    def add_folder(self, key: str, folder: FolderCT) -> FolderCT:
+        """
+        Cache a folder,  unless there already is one for this path
+        :param key: Path (posix)
+        :param folder:
+        :return: The folder that is cached
+        """
+        with self._folder_lock:
+            return self.folders.setdefault(key, folder)
+
+    def get_folder(self, key: str) -> Optional[FolderCT]:
+        """
+        :param key: Path (posix)
+        :return: The cached folder or None
+        """
+        return self.folders.get(key)
+
+    def count(self, folder: FolderCT, change: int):
+        """
+        Update how many registered files a folder has
+        :param folder:
+        :param change: +1 or -1
+        :return:
+        """
+        with self._folder_lock:
+            folder.count += change
+
+    def clear(self):
+        """
+        Forget everything
+        :return:
+        """
+        self.files.clear()
+        with self._folder_lock:
+            self.folders.clear()
+        with self._index_lock:
+            self.index.clear()
+
+
+class Library:  # pylint: disable=too-many-instance-attributes, too-few-public-methods
+    """
+    What the cleaner objects of one library share.   ImageClean owns one and hands it to every object it makes (see
+    make_cleaner_object),  so two of them can work side by side.   Objects made without one share DEFAULT_LIBRARY.
+    """
+    def __init__(self):
+        self.registry = Registry()  # Where files and folders are registered
+        self.catalog: Optional[Catalog] = None  # When attached,  the persistent catalog is kept in step with registry
+        self.similar: Optional[BKTree] = None  # When attached,  registered pictures are indexed by perceptual hash
+        self.link_files = False  # When set,  copies are reflinks or hard links if the file system allows it
+        self.journal: Optional[Journal] = None  # When attached,  file operations are journaled so crashes are recovered
+        self.planner: Optional[Simulation] = None  # When attached,  relocations are simulated (see ImageClean.plan)
+        self.sidecar_dates = False  # When set,  dates we work out go in XMP sidecars,  images are not rewritten
+        self.verify_movies = False  # When set,  big movies that match on their sampled digest are also compared in full
+
+    def clear(self):
+        """
+        Forget everything,  and detach everything
+        :return:
+        """
+        self.registry.clear()
+        self.catalog = self.similar = self.journal = self.planner = None
+        self.link_files = self.sidecar_dates = self.verify_movies = False
+
+
+DEFAULT_LIBRARY = Library()  # For objects that are not part of an import (tests and tools)
@@ -0,0 +1,102 @@
+"""
+Near duplicate detection.   Images are reduced to a 64 bit difference hash (dHash) and kept in a BK-tree so we can find
+every image within a Hamming distance without comparing against the whole library.
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from PIL import Image
+
+HASH_SIZE = 8  # 8x8 comparisons -> 64 bit hash
+DRAFT_SIZE = (64, 64)  # The decode size we ask JPEG for,  plenty for a 9x8 thumbnail
+
+
+def dhash(image: Image.Image) -> int:
+    """
+    Difference hash,  each bit is set if a pixel is brighter than its right hand neighbour in a 9x8 grey thumbnail
+    :param image: An open PIL image
+    :return: 64 bit int
+    """
+    image.draft('L', DRAFT_SIZE)  # Only JPEG honours this,  but it saves decoding the full image
+    thumbnail = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = thumbnail.tobytes()  # One byte a pixel
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            offset = row * (HASH_SIZE + 1) + column
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+
+def hamming(first: int, second: int) -> int:
+    """
+    :return: The number of bits that differ
+    """
+    return bin(first ^ second).count('1')
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance.   Each node keeps its children keyed by their distance from it,  the
+    triangle inequality then lets a search skip any child whose distance is outside (d - limit, d + limit).
+
+    Removal is lazy,  only the live items are remembered and anything else is filtered from search results.
+    """
+    def __init__(self):
+        self.root: Optional[Tuple[int, List[Any], Dict[int, Any]]] = None  # (hash, items, children)
+        self.live: Set[int] = set()
+
+    def __len__(self):
+        return len(self.live)
+
+    def add(self, value: int, item: Any):
+        """
+        Add an item with its hash
+        :param value: the hash
+        :param item: whatever we want back from search
+        :return:
+        """
+        self.live.add(id(item))
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            if distance not in node[2]:
+                node[2][distance] = (value, [item], {})
+                return
+            node = node[2][distance]
+
+    def remove(self, item: Any):
+        """
+        Forget an item
+        :param item:
+        :return:
+        """
+        self.live.discard(id(item))
+
+    def search(self, value: int, limit: int) -> List[Tuple[int, Any]]:
+        """
+        Find everything within limit of value
+        :param value: the hash to look for
+        :param limit: the maximum Hamming distance
+        :return: list of (distance, item) closest first
+        """
+        result = []
+        seen = set()
+        candidates = [self.root] if self.root else []
+        while candidates:
+            node = candidates.pop()
+            distance = hamming(value, node[0])
+            if distance <= limit:
+                for item in node[1]:
+                    if id(item) in self.live and id(item) not in seen:
+                        seen.add(id(item))
+                        result.append((distance, item))
+            for child_distance, child in node[2].items():
+                if distance - limit <= child_distance <= distance + limit:
+                    candidates.append(child)
+        return sorted(result, key=lambda value: value[0])
@@ -0,0 +1,35 @@
+"""
+setUp and tearDown shared by the test cases that work in a temporary folder
+"""
+# pylint: disable=missing-function-docstring
+import os
+import tempfile
+
+from pathlib import Path
+
+# pylint: disable=import-error
+from backend.cleaner import CleanerBase
+
+
+class TempFolderMixin:
+    """
+    Put this ahead of the TestCase class.   Each test gets an empty folder (base),  with Output (output_folder) made in
+    it when make_output is set and Input (input_folder) left for the test to fill.   The caches of the objects made
+    without a library are cleared before and after each test.
+    """
+    make_output = False
+
+    def setUp(self):  # pylint: disable=invalid-name
+        super().setUp()
+        self.temp_base = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.base = Path(self.temp_base.name)
+        self.output_folder = self.base.joinpath('Output')
+        self.input_folder = self.base.joinpath('Input')
+        if self.make_output:
+            os.mkdir(self.output_folder)
+        CleanerBase.clear_caches()
+
+    def tearDown(self):  # pylint: disable=invalid-name
+        self.temp_base.cleanup()
+        CleanerBase.clear_caches()
+        super().tearDown()
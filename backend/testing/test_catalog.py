@@ -0,0 +1,185 @@
+"""
+Test Cases for the persistent catalog
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+# pylint: disable=import-error
+from backend.catalog import Catalog
+from backend.cleaner import CleanerBase
+from backend.image_clean import ImageClean
+from backend.testing.base import TempFolderMixin
+from Utilities.test_utilities import create_file, create_image_file, DATE_SPEC, DIR_SPEC
+
+
+def age_folders(path: Path, seconds: int = 3600):
+    """
+    Push the mtime of every folder back,  so the catalog can trust them
+    """
+    old_time = os.stat(path).st_mtime - seconds
+    for base, _, _ in os.walk(path):
+        os.utime(base, (old_time, old_time))
+
+
+class CatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.temp_base = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.root = Path(self.temp_base.name).joinpath('Output')
+        os.mkdir(self.root)
+        self.catalog = Catalog(Path(self.temp_base.name).joinpath('catalog.db'), self.root)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.temp_base.cleanup()
+        super().tearDown()
+
+    def test_contains(self):
+        self.assertTrue(self.catalog.contains(self.root))
+        self.assertTrue(self.catalog.contains(self.root.joinpath('a').joinpath('b.jpg')))
+        self.assertFalse(self.catalog.contains(Path(f'{self.root}Other').joinpath('b.jpg')))
+        self.assertFalse(self.catalog.contains(self.root.parent))
+
+    def test_store_and_load(self):
+        sub = self.root.joinpath('sub')
+        file1 = create_file(self.root.joinpath('a.file'))
+        create_file(sub.joinpath('b.file'))
+        age_folders(self.root)
+        mtime_ns = os.stat(self.root).st_mtime_ns
+
+        self.assertFalse(self.catalog.is_current(self.root, mtime_ns), 'Never listed')
+        stored = self.catalog.store_folder(self.root, mtime_ns, [sub], [(file1, None)])
+        self.assertTrue(self.catalog.is_current(self.root, mtime_ns))
+        self.assertFalse(self.catalog.is_current(self.root, mtime_ns + 1), 'Folder has changed')
+        self.assertEqual(self.catalog.load_folder(self.root), ([sub], stored))
+        self.assertEqual(stored[0].path, file1)
+        self.assertEqual(stored[0].size, os.stat(file1).st_size)
+
+    def test_racy_folder(self):
+        mtime_ns = os.stat(self.root).st_mtime_ns
+        self.catalog.store_folder(self.root, mtime_ns, [], [])
+        self.assertFalse(self.catalog.is_current(self.root, mtime_ns), 'Changed too close to the listing')
+
+    def test_forget(self):
+        sub = self.root.joinpath('sub')
+        file1 = create_file(sub.joinpath('b.file'))
+        self.catalog.store_folder(self.root, 1, [sub], [])
+        self.catalog.store_folder(sub, 1, [], [(file1, os.stat(file1))])
+
+        self.catalog.store_folder(self.root, 2, [], [])  # sub has gone away
+        self.assertEqual(self.catalog.load_folder(sub), ([], []))
+        self.assertEqual(self.catalog.load_folder(self.root), ([], []))
+
+    def test_file_updates(self):
+        file1 = create_file(self.root.joinpath('a.file'))
+        file2 = self.root.joinpath('b.file')
+        self.catalog.add_file(file1)
+        self.catalog.add_file(file2)  # Does not exist
+        self.catalog.add_file(self.root.parent.joinpath('outside.file'))
+        self.assertEqual([value.path for value in self.catalog.load_folder(self.root)[1]], [file1])
+
+        os.rename(file1, file2)
+        self.catalog.rename_file(file1, file2)
+        self.assertEqual([value.path for value in self.catalog.load_folder(self.root)[1]], [file2])
+        self.catalog.remove_file(file2)
+        self.assertEqual(self.catalog.load_folder(self.root), ([], []))
+
+    def test_import_manifest(self):
+        file1 = create_file(self.root.parent.joinpath('Input').joinpath('a.file'))
+        stat = os.stat(file1)
+        self.assertIsNone(self.catalog.import_decision(file1, stat, 'settings'), 'Never seen')
+        self.catalog.record_import(file1, stat, 'settings', 'duplicate')
+        self.assertEqual(self.catalog.import_decision(file1, stat, 'settings'), 'duplicate')
+        self.assertIsNone(self.catalog.import_decision(file1, stat, 'other settings'))
+        self.assertIsNone(self.catalog.import_decision(file1.parent.joinpath('moved.file'), stat, 'settings'))
+
+        os.utime(file1, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        self.assertIsNone(self.catalog.import_decision(file1, os.stat(file1), 'settings'), 'Changed')
+
+    def test_perceptual_hash(self):
+        file1 = create_file(self.root.joinpath('a.file'))
+        self.catalog.add_file(file1)
+        stat = os.stat(file1)
+        self.assertIsNone(self.catalog.perceptual_hash(file1, stat), 'Never hashed')
+        self.catalog.set_perceptual_hash(file1, 1234, stat)
+        self.assertEqual(self.catalog.perceptual_hash(file1, stat), 1234)
+        os.utime(file1, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        self.assertIsNone(self.catalog.perceptual_hash(file1, os.stat(file1)), 'Edited since')
+
+    def test_schema_upgrade(self):
+        db_path = Path(self.temp_base.name).joinpath('old.db')
+        old = Catalog(db_path, self.root)
+        old.connection.execute('PRAGMA user_version = 0')
+        old.close()
+        with self.assertLogs('Cleaner', level='DEBUG') as logs:
+            Catalog(db_path, self.root).close()
+            self.assertTrue(logs.output[0].startswith('DEBUG:Cleaner:Catalog'))
+
+
+class CatalogRegistrationTest(TempFolderMixin, unittest.TestCase):
+
+    make_output = True
+
+    @patch('pathlib.Path.home')
+    def test_warm_start(self, home):
+        home.return_value = Path(self.temp_base.name)
+        image = create_image_file(self.output_folder.joinpath(DIR_SPEC).joinpath('one.jpg'), DATE_SPEC)
+        age_folders(self.output_folder)
+
+        app = ImageClean('test_app', output=self.output_folder, input=self.output_folder)
+        app.setup()
+        self.assertIs(app.library.catalog, app.catalog, 'Attached once registered')
+        app.teardown()
+        self.assertIsNone(app.library.catalog)
+        self.assertIn('ONE', app.registry.files)
+
+        CleanerBase.clear_caches()
+        app = ImageClean('test_app', output=self.output_folder, input=self.output_folder)
+        with patch('backend.image_clean.scan_folder') as scan_folder:
+            app.setup()
+            scan_folder.assert_not_called()
+        app.teardown()
+        self.assertEqual(app.registry.files['ONE'][0].path, image, 'Loaded from the catalog')
+
+        CleanerBase.clear_caches()
+        os.unlink(image)
+        app = ImageClean('test_app', output=self.output_folder, input=self.output_folder)
+        app.setup()
+        app.teardown()
+        self.assertNotIn('ONE', app.registry.files, 'The changed folder was listed again')
+
+    @patch('pathlib.Path.home')
+    def test_edited_in_place(self, home):
+        home.return_value = Path(self.temp_base.name)
+        image = create_image_file(self.output_folder.joinpath(DIR_SPEC).joinpath('one.jpg'), DATE_SPEC)
+        age_folders(self.output_folder)
+        app = ImageClean('test_app', output=self.output_folder, input=self.output_folder)
+        app.setup()
+        app.teardown()
+
+        stat = os.stat(image)
+        with open(image, 'ab') as file:  # The folder keeps its mtime
+            file.write(b'more')
+        os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        CleanerBase.clear_caches()
+        app = ImageClean('test_app', output=self.output_folder, input=self.output_folder)
+        app.setup()
+        value = app.registry.files['ONE'][0]
+        self.assertEqual(value.size, stat.st_size, 'What the catalog said')
+        with self.assertLogs('Cleaner', level='DEBUG'):
+            value.stat()
+        self.assertEqual(value.size, stat.st_size + 4, 'Checked on the first stat')
+        self.assertEqual(app.registry.index.matches(value), [value], 'In the bucket for its new size')
+        self.assertEqual(app.catalog.load_folder(image.parent)[1][0].size, stat.st_size + 4)
+        app.teardown()
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
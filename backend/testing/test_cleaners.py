@@ -26,7 +26,9 @@ import piexif
 
 # pylint: disable=import-error
 from backend.cleaner import ImageCleaner, CleanerBase, FileCleaner, \
-    make_cleaner_object, output_files, PICTURE_FILES, MOVIE_FILES
+    make_cleaner_object, move_counts, stat_counts, PICTURE_FILES, MOVIE_FILES
+from backend.metadata import read_sidecar, sidecar_path
+from backend.registry import DEFAULT_LIBRARY
 from Utilities.test_utilities import copy_file, create_file, create_image_file, set_date, count_files, DATE_SPEC
 
 
@@ -167,6 +169,17 @@ class ImageCleanerTests(Cleaners):
             self.assertEqual(logs.output[0], f'DEBUG:Cleaner:Could not find a date in {self.jpg_obj.path}')
             self.assertIsNone(date_value, 'Image time should be None')
 
+    def test_date_movie(self):
+        def box(kind: bytes, data: bytes) -> bytes:
+            return (len(data) + 8).to_bytes(4, 'big') + kind + data
+
+        movie = self.input_folder.joinpath('movie.mov')
+        movie.write_bytes(box(b'ftyp', b'qt  \x00\x00\x00\x00qt  ') + box(b'mdat', bytes(1000)) + box(
+            b'moov', box(b'udta', box(b'\xa9day', b'\x00\x14\x15\xc71961-09-27T10:00:00Z'))))
+        with patch('piexif.load') as piexif_load:
+            self.assertEqual(ImageCleaner(movie).get_date_from_image(), DATE_SPEC, 'From the udta,  not piexif')
+            piexif_load.assert_not_called()
+
     def test_date_date(self):
         image_time = datetime.now() - timedelta(days=1)
         set_date(self.jpg_obj.path, image_time)
@@ -194,9 +207,35 @@ class ImageCleanerTests(Cleaners):
 
     def test_image_data(self):
         # pylint: disable=protected-access
-        self.assertListEqual(self.jpg_obj._image_data, [], "Image data should be empty")
+        self.assertIsNone(self.jpg_obj._image_data, "Image data should be empty")
         _ = self.jpg_obj.image_data
-        self.assertNotEqual(self.jpg_obj._image_data, [], "Image data has been cached")
+        self.assertEqual(len(self.jpg_obj._image_data), 16, "Image data has been cached as a digest")
+
+    def test_image_data_unreadable(self):
+        file1 = ImageCleaner(create_file(self.input_folder.joinpath('a.jpg'), data='not an image'))
+        file2 = ImageCleaner(create_file(self.input_folder.joinpath('b.jpg'), data='not an image either'))
+        self.assertIsNone(file1.image_data)
+        self.assertFalse(file1 == file2, 'Nothing to compare is not the same')
+
+    def test_stat_cache(self):
+        CleanerBase.clear_caches()
+        clone = ImageCleaner(copy_file(self.jpg_obj.path, self.input_folder), stat=os.stat(self.jpg_obj.path))
+        self.assertTrue(clone.is_same_file(self.jpg_obj), 'Seeded with the wrong stat on purpose')
+        clone.invalidate_stat()
+        self.assertFalse(clone.is_same_file(self.jpg_obj))
+        self.assertTrue(clone.is_valid)
+        self.assertTrue(clone == self.jpg_obj)
+        self.assertEqual(stat_counts['made'], 2, 'Each file is stat-ed once')
+        self.assertGreater(stat_counts['saved'], 0)
+        CleanerBase.clear_caches()
+        self.assertEqual(stat_counts, {'made': 0, 'saved': 0})
+
+    def test_stat_cache_missing(self):
+        missing = ImageCleaner(self.input_folder.joinpath('missing.jpg'))
+        self.assertIsNone(missing.stat())
+        self.assertFalse(missing.is_valid)
+        with self.assertLogs('Cleaner', level='ERROR'):
+            self.assertFalse(missing == self.jpg_obj)
 
     def test_image_compare(self):
         """
@@ -265,12 +304,23 @@ class ImageCleanerTests(Cleaners):
         self.assertFalse(self.jpg_obj.is_small)
         self.assertTrue(self.small_obj.is_small)
 
+    def test_is_small_from_headers(self):
+        small = ImageCleaner(self.small_obj.path)
+        with patch.object(ImageCleaner, 'open_image') as open_image:
+            self.assertTrue(small.is_small)
+            self.assertFalse(self.heic_obj.is_small, 'HEIC too')
+            open_image.assert_not_called()
+        self.assertEqual(small.dimensions, (360, 360))
+        with patch('backend.cleaner.probe_dimensions') as probe, patch('backend.cleaner.SMALL_IMAGE_BYTES', 10):
+            self.assertFalse(ImageCleaner(self.small_obj.path).is_small)
+            probe.assert_not_called()
+
     def test_registrations_1(self):
         # Test 1 -> simple registration and de-registration
         self.jpg_obj.clear_caches()
         self.assertListEqual(self.jpg_obj.get_registered(), [], 'Get all reg.  should have 0 elements')
 
-        self.assertEqual(output_files, {}, 'Nothing registered')
+        self.assertEqual(DEFAULT_LIBRARY.registry.files, {}, 'Nothing registered')
         self.assertFalse(self.jpg_obj.is_registered())
         self.jpg_obj.register()
         self.assertEqual(self.jpg_obj.get_registered()[0], self.jpg_obj, 'Get all reg.  should have 1 elements')
@@ -280,7 +330,7 @@ class ImageCleanerTests(Cleaners):
         self.jpg_obj.register()
 
         self.jpg_obj.de_register()
-        self.assertEqual(len(output_files), 0, 'Nothing registered')
+        self.assertEqual(len(DEFAULT_LIBRARY.registry.files), 0, 'Nothing registered')
         self.assertFalse(self.jpg_obj.is_registered())
 
         # test2 multiple copies
@@ -294,7 +344,7 @@ class ImageCleanerTests(Cleaners):
 
         self.jpg_obj.register()
         new_obj.register()
-        self.assertEqual(len(output_files), 1, 'Hash should only have one element')
+        self.assertEqual(len(DEFAULT_LIBRARY.registry.files), 1, 'Hash should only have one element')
 
         self.assertTrue(self.jpg_obj.is_registered())
         self.assertTrue(new_obj.is_registered())
@@ -310,8 +360,8 @@ class ImageCleanerTests(Cleaners):
 
         # test3  - De-register one of the copies
         new_obj.de_register()
-        self.assertEqual(len(output_files), 1, 'Hash should only have one element')
-        self.assertEqual(len(output_files[new_obj.registry_key]), 1, 'One elements (same key')
+        self.assertEqual(len(DEFAULT_LIBRARY.registry.files), 1, 'Hash should only have one element')
+        self.assertEqual(len(DEFAULT_LIBRARY.registry.files[new_obj.registry_key]), 1, 'One elements (same key')
 
         # test4 - Lookup with various path options
         self.assertTrue(new_obj.is_registered(), 'Test True by name')
@@ -330,6 +380,98 @@ class ImageCleanerTests(Cleaners):
         self.assertTrue(self.jpg_obj.path.exists(), 'A lot of work for a unlink')
         self.assertFalse(self.jpg_obj.is_registered(), 'Do to None - got nothing to register')
 
+    def test_relocate_by_rename(self):
+        CleanerBase.clear_caches()
+        inode = os.stat(self.jpg_obj.path).st_ino
+        size = os.stat(self.jpg_obj.path).st_size
+        self.jpg_obj.relocate_file(self.output_folder, remove=True)
+        self.assertEqual(self.jpg_obj.path, self.output_folder.joinpath('jpeg_image.jpg'))
+        self.assertEqual(os.stat(self.jpg_obj.path).st_ino, inode, 'Renamed not copied')
+        self.assertEqual(move_counts['renamed'], 1)
+        self.assertEqual(move_counts['bytes_avoided'], size)
+
+    def test_relocate_keep_original_copies(self):
+        CleanerBase.clear_caches()
+        original = self.jpg_obj.path
+        self.jpg_obj.relocate_file(self.output_folder, remove=False)
+        self.assertTrue(original.exists(), 'The original is kept')
+        self.assertNotEqual(os.stat(self.jpg_obj.path).st_ino, os.stat(original).st_ino)
+        self.assertEqual(move_counts['renamed'], 0)
+
+    def test_relocate_by_linking(self):
+        CleanerBase.clear_caches()
+        DEFAULT_LIBRARY.link_files = True
+        original = self.jpg_obj.path
+        self.jpg_obj.relocate_file(self.output_folder, remove=False)
+        self.assertTrue(original.exists(), 'The original is kept')
+        self.assertEqual(move_counts['cloned'] + move_counts['linked'], 1)
+        self.assertEqual(move_counts['bytes_avoided'], os.stat(original).st_size)
+        CleanerBase.clear_caches()
+
+    def test_relocate_by_linking_updates(self):
+        CleanerBase.clear_caches()
+        DEFAULT_LIBRARY.link_files = True
+        image = ImageCleaner(create_image_file(self.input_folder.joinpath('20200101_010101.jpg'), None))
+        original = image.path.read_bytes()
+        self.assertTrue(image.updates_metadata, 'The date is from the name')
+        image.relocate_file(self.output_folder, remove=False)
+        self.assertEqual(move_counts['linked'], 0, 'Never hard link a file we are going to change')
+        self.assertEqual(self.input_folder.joinpath('20200101_010101.jpg').read_bytes(), original)
+        self.assertNotEqual(image.path.read_bytes(), original, 'The copy has the date')
+        CleanerBase.clear_caches()
+
+    def test_relocate_sets_date_while_copying(self):
+        CleanerBase.clear_caches()
+        image = ImageCleaner(create_image_file(self.input_folder.joinpath('20200101_010101.jpg'), None))
+        expected = self.run_base.joinpath('expected.jpg')
+        exif_dict = piexif.load(str(image.path))
+        image.date_exif(exif_dict)
+        piexif.insert(piexif.dump(exif_dict), str(image.path), str(expected))
+        with patch('piexif.insert') as insert:
+            image.relocate_file(self.output_folder, remove=False)
+            insert.assert_not_called()
+        self.assertEqual(image.path.read_bytes(), expected.read_bytes(), 'Just as set_date would have it')
+        CleanerBase.clear_caches()
+
+    def test_relocate_with_sidecar_dates(self):
+        CleanerBase.clear_caches()
+        DEFAULT_LIBRARY.sidecar_dates = True
+        DEFAULT_LIBRARY.link_files = True
+        image = ImageCleaner(create_image_file(self.input_folder.joinpath('20200101_010101.jpg'), None))
+        original = image.path.read_bytes()
+        self.assertFalse(image.updates_metadata, 'The date goes in the sidecar')
+        image.relocate_file(self.output_folder, remove=False)
+        self.assertEqual(move_counts['cloned'] + move_counts['linked'], 1, 'So the image can be linked')
+        self.assertEqual(image.path.read_bytes(), original)
+        self.assertEqual(read_sidecar(image.path), datetime(2020, 1, 1))
+
+        DEFAULT_LIBRARY.link_files = False
+        again = ImageCleaner(image.path)
+        with patch('backend.metadata.load_exif') as exif:
+            self.assertEqual(again.date, datetime(2020, 1, 1))
+            exif.assert_not_called()
+        moved = self.output_folder.joinpath('moved')
+        again.relocate_file(moved, remove=True)
+        self.assertFalse(sidecar_path(image.path).exists(), 'The sidecar moved with the image')
+        self.assertEqual(read_sidecar(again.path), datetime(2020, 1, 1))
+
+        ImageCleaner(create_image_file(self.input_folder.joinpath('20200101_010101.jpg'), None)).relocate_file(
+            moved, rollover=True)
+        self.assertEqual(read_sidecar(moved.joinpath('20200101_010101_0.jpg')), datetime(2020, 1, 1),
+                         'Rolled over with its image')
+        CleanerBase.clear_caches()
+
+    def test_relocate_across_devices(self):
+        CleanerBase.clear_caches()
+        original = self.jpg_obj.path
+        values = list(os.stat(original))
+        values[2] += 1  # st_dev,  pretend we live on another file system
+        image = ImageCleaner(original, stat=os.stat_result(values))
+        image.relocate_file(self.output_folder, remove=True)
+        self.assertFalse(original.exists(), 'Copied and then removed')
+        self.assertTrue(image.path.exists())
+        self.assertEqual(move_counts['renamed'], 0)
+
     def test_relocate_with_registration_and_remove(self):
 
         self.assertTrue(self.jpg_obj.path.exists(), 'File Exists')
@@ -367,6 +509,14 @@ class ImageCleanerTests(Cleaners):
         image_file.rollover_file(self.output_folder.joinpath(image_file.path.name))
         self.assertEqual(count_files(self.output_folder, basic_name), 21, 'Still 21')
 
+    def test_rollover_forgets_stat(self):
+        destination = ImageCleaner(copy_file(self.jpg_obj.path, self.output_folder))
+        destination.register()
+        self.assertIsNotNone(destination.stat())
+        destination.rollover_file(destination.path)
+        self.assertIsNone(destination.stat(), 'The file under this path has moved')
+        destination.de_register()
+
     def test_rollover_does_not_exist(self):
         """
         Try to roll over a file that does not exist,   quietly does nothing
@@ -484,7 +634,7 @@ class ImageCleanerTests(Cleaners):
                 error_value = f'ERROR:Cleaner:Can not write to {new_dir}'
                 self.assertTrue(logs.output[len(logs.output) - 2].startswith(error_value), 'R/O remove')
 
-    @patch('piexif.load')
+    @patch('backend.metadata.load_exif')
     def test_invalid_date(self,  my_exif_dict):
         my_exif_dict.return_value = {}
         self.assertIsNone(self.jpg_obj.date)
@@ -561,6 +711,18 @@ class ImageCleanerTests(Cleaners):
             error_value = f'DEBUG:Cleaner:open_image UnidentifiedImageError {file1.path}'
             self.assertTrue(logs.output[len(logs.output) - 1].startswith(error_value), 'non-image')
 
+    def test_read_comparisons(self):
+        # pylint: disable=protected-access
+        registered = ImageCleaner(create_image_file(self.output_folder.joinpath('same.jpg'), DATE_SPEC))
+        registered.register()
+        entry = ImageCleaner(create_image_file(self.input_folder.joinpath('same.jpg'), DATE_SPEC, text='other'))
+        other = ImageCleaner(create_image_file(self.input_folder.joinpath('other.jpg'), DATE_SPEC, text='other'))
+        entry.read_comparisons()
+        other.read_comparisons()
+        self.assertIsNotNone(entry._image_data, 'Compared with the registered picture of the same name')
+        self.assertIsNone(registered._image_data, 'Only our own picture is decoded')
+        self.assertIsNone(other._image_data)
+
 
 class FileTests(Cleaners):
     """
@@ -595,6 +757,23 @@ class FileTests(Cleaners):
         self.assertTrue(newer > older)
         self.assertTrue(older < newer)
 
+    def test_read_comparisons(self):
+        registered = FileCleaner(create_file(self.output_folder.joinpath('a.file'), data='File Contents1'))
+        registered.register()
+        same = FileCleaner(create_file(self.input_folder.joinpath('b.file'), data='File Contents1'))
+        different = FileCleaner(create_file(self.input_folder.joinpath('c.file'), data='File Contents2'))
+        unique = FileCleaner(create_file(self.input_folder.joinpath('d.file'), data='Longer File Contents'))
+        for entry in (same, different, unique):
+            entry.read_comparisons()
+        self.assertIn('content_digest', same.__dict__, 'Read ahead of the comparison')
+        self.assertIn('content_digest', registered.__dict__)
+        self.assertIn('partial_digest', different.__dict__)
+        self.assertNotIn('content_digest', different.__dict__, 'Told apart by the partial digest')
+        self.assertNotIn('partial_digest', unique.__dict__, 'No file is the same size')
+        with patch('backend.cleaner.partial_digest', side_effect=OSError('gone')), \
+                self.assertLogs('Cleaner', level='DEBUG'):
+            FileCleaner(create_file(self.input_folder.joinpath('e.file'), data='File Contents3')).read_comparisons()
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -0,0 +1,148 @@
+"""
+Test Cases for the content index
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import os
+import unittest
+
+from unittest.mock import patch
+
+# pylint: disable=import-error
+from backend.cleaner import FileCleaner, ImageCleaner
+from backend.content_index import ContentIndex, PARTIAL_BLOCK, full_digest, partial_digest, sampled_digest
+from backend.registry import DEFAULT_LIBRARY
+from backend.testing.base import TempFolderMixin
+from Utilities.test_utilities import copy_file, create_file, create_image_file
+
+
+class DigestTest(TempFolderMixin, unittest.TestCase):
+
+    def test_small_file(self):
+        small = create_file(self.base.joinpath('small.file'), data='small')
+        size = os.stat(small).st_size
+        self.assertEqual(partial_digest(small, size), full_digest(small, size), 'Partial covers the whole file')
+
+    def test_large_files(self):
+        data = 'x' * (3 * PARTIAL_BLOCK)
+        middle = 'x' * PARTIAL_BLOCK + 'y' + 'x' * (2 * PARTIAL_BLOCK - 1)
+        file1 = create_file(self.base.joinpath('one.file'), data=data)
+        file2 = create_file(self.base.joinpath('two.file'), data=middle)
+        size = os.stat(file1).st_size
+
+        self.assertEqual(partial_digest(file1, size), partial_digest(file2, size), 'Only the middle differs')
+        self.assertNotEqual(full_digest(file1, size), full_digest(file2, size))
+
+        obj1 = FileCleaner(file1)
+        obj2 = FileCleaner(file2)
+        self.assertFalse(obj1.same_content(obj2))
+        self.assertIn('content_digest', obj1.__dict__, 'Full digest was needed')
+        obj1.forget_content()
+        self.assertNotIn('content_digest', obj1.__dict__)
+
+    @patch('backend.content_index.READ_BLOCK', 1024)
+    def test_sampled_digest(self):
+        data = bytearray(os.urandom(200000))
+        file1 = self.base.joinpath('one.mov')
+        file1.write_bytes(data)
+        data[70000] ^= 1  # Between the windows (and not at the ends)
+        file2 = self.base.joinpath('two.mov')
+        file2.write_bytes(data)
+        data[0] ^= 1  # In the first one
+        file3 = self.base.joinpath('three.mov')
+        file3.write_bytes(data)
+
+        self.assertEqual(sampled_digest(file1, len(data)), sampled_digest(file2, len(data)))
+        self.assertNotEqual(sampled_digest(file1, len(data)), sampled_digest(file3, len(data)))
+        self.assertNotEqual(sampled_digest(file1, len(data)), sampled_digest(file1, len(data), b'12.5'), 'Duration')
+
+        with patch('backend.cleaner.SAMPLE_MINIMUM', 100000):
+            obj1, obj2 = ImageCleaner(file1), ImageCleaner(file2)
+            self.assertTrue(obj1.same_content(obj2), 'Taken to be the same')
+            self.assertNotIn('content_digest', obj1.__dict__, 'Without reading all of it')
+            DEFAULT_LIBRARY.verify_movies = True
+            try:
+                self.assertFalse(obj1.same_content(obj2), 'Unless asked to check')
+            finally:
+                DEFAULT_LIBRARY.verify_movies = False
+
+            index = ContentIndex()
+            index.add(obj1)
+            index.add(obj2)
+            self.assertEqual(list(index.duplicates()), [], 'Duplicates are always compared in full')
+
+        self.assertEqual(FileCleaner(file1).sampled_digest, b'', 'Only movies are sampled')
+        self.assertEqual(ImageCleaner(file1).sampled_digest, b'', 'And only big ones')
+
+
+class ContentIndexTest(TempFolderMixin, unittest.TestCase):
+
+    def test_add_remove(self):
+        index = ContentIndex()
+        obj = FileCleaner(create_file(self.base.joinpath('a.file')))
+        index.add(obj)
+        index.add(obj)
+        self.assertEqual(len(index), 1, 'Only indexed once')
+        index.add(FileCleaner(self.base.joinpath('missing.file')))
+        self.assertEqual(len(index), 1, 'Nothing to index')
+        index.remove(obj)
+        index.remove(obj)
+        self.assertEqual(len(index), 0)
+
+    def test_matches(self):
+        index = ContentIndex()
+        original = FileCleaner(create_file(self.base.joinpath('a.file'), data='same'))
+        renamed = FileCleaner(create_file(self.base.joinpath('b.file'), data='same'))
+        different = FileCleaner(create_file(self.base.joinpath('c.file'), data='diff'))
+        image = ImageCleaner(create_file(self.base.joinpath('d.jpg'), data='same'))
+        for obj in (original, different, image):
+            index.add(obj)
+
+        self.assertListEqual(index.matches(renamed), [original], 'Same bytes,  same class')
+        self.assertListEqual(index.matches(original), [original])
+        self.assertListEqual(index.matches(FileCleaner(self.base.joinpath('missing.file'))), [])
+
+    def test_duplicates(self):
+        index = ContentIndex()
+        original = FileCleaner(create_file(self.base.joinpath('a.file'), data='same'))
+        renamed = FileCleaner(create_file(self.base.joinpath('b.file'), data='same'))
+        different = FileCleaner(create_file(self.base.joinpath('c.file'), data='diff'))
+        alone = FileCleaner(create_file(self.base.joinpath('d.file'), data='longer'))
+        for obj in (original, renamed, different, alone):
+            index.add(obj)
+        self.assertEqual(list(index.duplicates()), [[original, renamed]])
+        self.assertNotIn('partial_digest', alone.__dict__, 'Nothing else that size,  never read')
+
+    def test_vanished_file(self):
+        index = ContentIndex()
+        original = FileCleaner(create_file(self.base.joinpath('a.file'), data='same'))
+        index.add(original)
+        os.unlink(original.path)
+        with self.assertLogs('Cleaner', level='ERROR'):
+            self.assertListEqual(index.matches(FileCleaner(create_file(self.base.joinpath('b.file'), data='same'))),
+                                 [])
+
+    def test_renamed_copy_is_registered(self):
+        image = ImageCleaner(create_image_file(self.base.joinpath('original.jpg'), None))
+        image.register()
+        renamed = ImageCleaner(copy_file(image.path, self.base, new_name='renamed.jpg'))
+        self.assertFalse(renamed.is_registered(), 'Different names')
+        self.assertTrue(renamed.is_registered(by_file=True), 'Same content')
+        self.assertEqual(renamed.get_registered(by_file=True), [image])
+        self.assertEqual(renamed.get_registered(by_file=True, new_path=self.base.joinpath('other')), [])
+
+        image.de_register()
+        self.assertEqual(len(DEFAULT_LIBRARY.registry.index), 0)
+        self.assertFalse(renamed.is_registered(by_file=True))
+
+    def test_same_size_not_read_twice(self):
+        image = ImageCleaner(create_image_file(self.base.joinpath('original.jpg'), None))
+        copy = ImageCleaner(copy_file(image.path, self.base.joinpath('copy')))
+        with patch('backend.cleaner.partial_digest', wraps=partial_digest) as digest:
+            for _ in range(3):
+                self.assertTrue(image.same_content(copy))
+            self.assertEqual(digest.call_count, 2, 'Digests are cached')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Test Cases for the HEIC conversion stage
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import tempfile
+import unittest
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# pylint: disable=import-error
+from backend.cleaner import CleanerBase, ImageCleaner
+from backend.convert import conversion_names, convert_images
+from Utilities.test_utilities import copy_file, create_file
+
+HEIC = Path(__file__).parent.joinpath('data').joinpath('heic_image.HEIC')
+
+
+class ConvertTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.temp_base = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.base = Path(self.temp_base.name)
+        self.work = self.base.joinpath('work')
+
+    def tearDown(self):
+        self.temp_base.cleanup()
+        CleanerBase.clear_caches()
+        super().tearDown()
+
+    def test_conversion_names(self):
+        images = [ImageCleaner(self.base.joinpath(name)) for name in ('a.heic', 'b.HEIC', 'A.HEIC', 'a.HEIF')]
+        self.assertEqual(conversion_names(images, self.work),
+                         [self.work.joinpath('a.jpg'), self.work.joinpath('b.jpg'),
+                          self.work.joinpath('1').joinpath('A.jpg'), self.work.joinpath('2').joinpath('a.jpg')])
+
+    async def test_convert_images(self):
+        first = ImageCleaner(copy_file(HEIC, self.base.joinpath('one'), new_name='image.heic'))
+        second = ImageCleaner(copy_file(HEIC, self.base.joinpath('two'), new_name='image.HEIC'))
+        broken = ImageCleaner(create_file(self.base.joinpath('broken.heic')))
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            with self.assertLogs('Cleaner', level='ERROR'):
+                converted = await convert_images(executor, [first, second, broken], self.work)
+        self.assertEqual([original for original, _ in converted], [first, second], 'Not the broken one')
+        for original, conversion in converted:
+            self.assertTrue(original.path.exists(), 'Originals are left alone')
+            self.assertEqual(conversion.path.suffix, '.jpg')
+            self.assertEqual(conversion.date, first.date)
+        self.assertEqual(converted[0][1], converted[1][1], 'The same picture')
+        self.assertNotEqual(converted[0][1].path, converted[1][1].path)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Test Cases for the reduced resolution decode
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import unittest
+
+from unittest.mock import patch
+
+from PIL import Image, UnidentifiedImageError
+
+# pylint: disable=import-error
+from backend.cleaner import ImageCleaner
+from backend.decode import reduced_image, REDUCED_SIZE
+from backend.testing.base import TempFolderMixin
+from Utilities.test_utilities import create_file, create_image_file
+
+
+class DecodeTest(TempFolderMixin, unittest.TestCase):
+
+    def test_jpeg_draft(self):
+        path = self.base.joinpath('big.jpg')
+        Image.new('RGB', (4000, 3000), 'blue').save(path)
+        image, size = reduced_image(path)
+        self.assertEqual(size, (4000, 3000))
+        self.assertEqual(image.size, (500, 375), 'Decoded at 1/8 scale')
+        self.assertEqual(image.mode, 'RGB')
+
+    def test_reduce(self):
+        path = self.base.joinpath('big.png')
+        Image.new('P', (2000, 1200)).save(path)
+        image, size = reduced_image(path)
+        self.assertEqual(size, (2000, 1200))
+        self.assertEqual(image.size, (500, 300), 'Reduced by 4x4 blocks')
+        self.assertEqual(image.mode, 'RGB')
+
+    def test_small(self):
+        image, size = reduced_image(create_image_file(self.base.joinpath('small.jpg'), None, small=True))
+        self.assertEqual(size, (360, 360))
+        self.assertGreaterEqual(min(image.size), REDUCED_SIZE)
+
+    def test_not_an_image(self):
+        with self.assertRaises(UnidentifiedImageError):
+            reduced_image(create_file(self.base.joinpath('text.jpg')))
+
+    def test_one_decode(self):
+        image = ImageCleaner(create_image_file(self.base.joinpath('image.jpg'), None, small=True))
+        with patch('backend.cleaner.reduced_image', wraps=reduced_image) as decode:
+            self.assertEqual(len(image.image_data), 16)
+            self.assertIsNotNone(image.perceptual_hash)
+            self.assertTrue(image.is_small)
+            self.assertEqual(decode.call_count, 1, 'Everything from the same decode')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Test Cases for the concurrent plan executor
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import errno
+import os
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+# pylint: disable=import-error
+from backend.cleaner import CleanerBase, FileCleaner
+from backend.executor import PlanExecutor
+from backend.image_clean import ImageClean
+from backend.plan import COPY, Operation, Simulation
+from backend.registry import DEFAULT_LIBRARY
+from backend.testing.base import TempFolderMixin
+from Utilities.test_utilities import copy_file, create_file, create_image_file, DATE_SPEC
+
+
+def snapshot(path: Path):
+    return sorted((Path(base).relative_to(path), tuple(sorted(files))) for base, _, files in os.walk(path))
+
+
+class PlanExecutorTest(TempFolderMixin, unittest.IsolatedAsyncioTestCase):
+
+    async def test_same_name_is_ordered(self):
+        first = FileCleaner(create_file(self.base.joinpath('one').joinpath('same.file'), data='first'))
+        second = FileCleaner(create_file(self.base.joinpath('two').joinpath('same.file'), data='second'))
+        other = FileCleaner(create_file(self.base.joinpath('two').joinpath('other.file'), data='other'))
+        destination = self.base.joinpath('out').joinpath('same.file')
+        operations = [Operation(COPY, first.path, destination, obj=first),
+                      Operation(COPY, other.path, destination.with_name('other.file'), obj=other),
+                      Operation(COPY, second.path, destination, rollover=True, obj=second)]
+
+        executor = PlanExecutor(workers=4)
+        await executor.execute(operations)
+        self.assertEqual(destination.read_text(encoding='utf-8'), 'second')
+        self.assertEqual(destination.with_name('same_0.file').read_text(encoding='utf-8'), 'first',
+                         'Rolled over,  not overwritten')
+        self.assertEqual(destination.with_name('other.file').read_text(encoding='utf-8'), 'other')
+        self.assertEqual(executor.failures, 0)
+
+        report = executor.report()
+        self.assertEqual(len(report), 1, 'All on one device')
+        self.assertTrue(report[0].endswith('MB/s)'))
+
+    async def test_wait_for(self):
+        obj = FileCleaner(create_file(self.base.joinpath('in').joinpath('a.file'), data='data'))
+        destination = self.base.joinpath('out').joinpath('a.file')
+        executor = PlanExecutor()
+        await executor.submit(Operation(COPY, obj.path, destination, obj=obj))
+        await executor.wait_for('OTHER', 1)
+        await executor.wait_for('A', None)
+        self.assertTrue(destination.exists(), 'Waited for the same name')
+        await executor.drain()
+        executor.close()
+
+    async def test_settle(self):
+        obj = FileCleaner(create_file(self.base.joinpath('in').joinpath('a.file'), data='data'))
+        destination = self.base.joinpath('out').joinpath('a.file')
+        obj.origin, obj.path = obj.path, destination  # As a plan leaves it
+        await PlanExecutor().execute([Operation(COPY, obj.origin, destination, obj=obj)])
+        self.assertIsNone(obj.origin)
+        self.assertEqual(obj.content_path, destination)
+        self.assertEqual(obj.size, 4)
+
+    async def test_failure(self):
+        obj = FileCleaner(self.base.joinpath('missing.file'))
+        executor = PlanExecutor()
+        with self.assertLogs('Cleaner', level='ERROR'):
+            await executor.execute([Operation(COPY, obj.path, self.base.joinpath('out').joinpath('missing.file'),
+                                              obj=obj)])
+        self.assertEqual(executor.failures, 1)
+        self.assertEqual([operation.obj for operation in executor.failed], [obj])
+
+    async def test_unexpected_failure(self):
+        obj = FileCleaner(create_file(self.base.joinpath('in').joinpath('a.file'), data='data'))
+        destination = self.base.joinpath('out').joinpath('a.file')
+        executor = PlanExecutor()
+        with patch.object(FileCleaner, 'transfer', side_effect=ValueError('not an OSError')), \
+                self.assertLogs('Cleaner', level='ERROR'):
+            await executor.execute([Operation(COPY, obj.path, destination, obj=obj)])
+        self.assertEqual(executor.failures, 1)
+        self.assertEqual([operation.obj for operation in executor.failed], [obj])
+        self.assertEqual(obj.content_path, obj.path, 'Still reading from where it is')
+
+    async def test_failure_reverted(self):
+        obj = FileCleaner(create_file(self.base.joinpath('in').joinpath('a.file'), data='data'))
+        source = obj.path
+        DEFAULT_LIBRARY.planner = Simulation()
+        operation = obj.relocate_file(self.base.joinpath('out'), register=True)
+        self.assertTrue(obj.is_registered())
+        with patch('backend.transfer.copy_file', side_effect=OSError(errno.ENOSPC, 'No space left on device')), \
+                self.assertLogs('Cleaner', level='ERROR'):
+            await PlanExecutor().execute([operation])
+        self.assertEqual(obj.path, source, 'Back where it really is')
+        self.assertIsNone(obj.origin)
+        self.assertFalse(obj.is_registered(), 'Never imported')
+        self.assertFalse(DEFAULT_LIBRARY.planner.exists(operation.destination))
+
+
+class ConcurrentImportTest(TempFolderMixin, unittest.IsolatedAsyncioTestCase):
+
+    def make_tree(self, name: str):
+        base = Path(self.temp_base.name).joinpath(name)
+        input_folder, output_folder = base.joinpath('Input'), base.joinpath('Output')
+        os.makedirs(output_folder)
+        first = create_image_file(input_folder.joinpath('a').joinpath('first.jpg'), DATE_SPEC)
+        copy_file(first, first.parent, new_name='again.jpg')  # Same content
+        create_image_file(input_folder.joinpath('b').joinpath('other.jpg'), DATE_SPEC)
+        create_image_file(input_folder.joinpath('undated.jpg'), None)
+        create_file(input_folder.joinpath('notes.txt'))
+        return input_folder, output_folder
+
+    @patch('pathlib.Path.home')
+    async def test_matches_serial_import(self, home):
+        home.return_value = Path(self.temp_base.name)
+        results = []
+        for run, options in enumerate([{'in_flight': 1}, {'in_flight': 8}, {'io_workers': 3}]):
+            CleanerBase.clear_caches()
+            input_folder, output_folder = self.make_tree(f'run{run}')
+            cleaner = ImageClean('test_app', input=input_folder, output=output_folder, keep_originals=False,
+                                 **options)
+            await cleaner.run()
+            self.assertIsNone(cleaner.transfers)
+            results.append((snapshot(input_folder), snapshot(output_folder), sorted(cleaner.registry.files)))
+        self.assertEqual(results[0], results[1], 'Files in flight do not change the result')
+        self.assertEqual(results[0], results[2], 'Neither does planning first')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
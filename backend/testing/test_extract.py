@@ -0,0 +1,107 @@
+"""
+Test Cases for the metadata extraction pool
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import os
+import unittest
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from unittest.mock import patch
+
+# pylint: disable=import-error
+from backend.cleaner import ImageCleaner
+from backend.extract import extract_metadata, prefetch_metadata
+from backend.image_clean import ImageClean
+from backend.metadata import write_sidecar
+from backend.testing.base import TempFolderMixin
+from Utilities.test_utilities import create_file, create_image_file, DATE_SPEC, DIR_SPEC
+
+
+class ExtractTest(TempFolderMixin, unittest.IsolatedAsyncioTestCase):
+
+    def test_extract(self):
+        dated = create_image_file(self.base.joinpath('dated.jpg'), DATE_SPEC, small=True)
+        self.assertEqual(extract_metadata(str(dated)), {'date': DATE_SPEC})
+        result = extract_metadata(str(dated), small=True, fingerprint=True)
+        self.assertTrue(result['small'])
+        self.assertEqual(result['image_data'], ImageCleaner(dated).image_data)
+
+    def test_apply(self):
+        # pylint: disable=protected-access
+        undated = ImageCleaner(create_image_file(self.base.joinpath('undated.jpg'), None))
+        undated.apply_metadata({'date': None, 'small': True})
+        self.assertTrue(undated.is_small, 'Primed,  not calculated')
+        with patch.object(ImageCleaner, 'get_date_from_image') as get_date:
+            self.assertIsNone(undated.date)
+            get_date.assert_not_called()
+
+        dated = ImageCleaner(create_image_file(self.base.joinpath('dated.jpg'), None))
+        dated.apply_metadata({'date': DATE_SPEC, 'image_data': b'fingerprint'})
+        self.assertEqual(dated.date, DATE_SPEC)
+        self.assertTrue(dated._metadate)
+        self.assertEqual(dated.image_data, b'fingerprint')
+
+    async def test_prefetch(self):
+        images = [ImageCleaner(create_image_file(self.base.joinpath(f'{index}.jpg'), DATE_SPEC))
+                  for index in range(4)]
+        broken = ImageCleaner(create_file(self.base.joinpath('broken.jpg'), data='not an image'))
+        images[0].register()
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            await prefetch_metadata(executor, images + [broken], small=True)
+        for image in images:
+            self.assertEqual(image.date, DATE_SPEC)
+            self.assertFalse(image.is_small)
+        self.assertTrue(broken._date_probed, 'No date in a broken file')  # pylint: disable=protected-access
+        self.assertIsNotNone(images[0]._image_data, 'Registered names need the fingerprint')  # pylint: disable=protected-access
+        self.assertIsNone(images[1]._image_data)  # pylint: disable=protected-access
+
+    async def test_prefetch_failure(self):
+        image = ImageCleaner(create_image_file(self.base.joinpath('one.jpg'), DATE_SPEC))
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            with patch('backend.extract.extract_metadata', new=_explode):
+                with self.assertLogs('Cleaner', level='DEBUG') as logs:
+                    await prefetch_metadata(executor, [image])
+                    self.assertTrue(logs.output[0].startswith('DEBUG:Cleaner:Metadata extraction failed'))
+        self.assertEqual(image.date, DATE_SPEC, 'Still found the slow way')
+
+    @patch('pathlib.Path.home')
+    async def test_parallel_import(self, home):
+        home.return_value = self.base
+        input_folder = self.base.joinpath('Input')
+        output_folder = self.base.joinpath('Output')
+        os.mkdir(output_folder)
+        for index in range(5):
+            create_image_file(input_folder.joinpath(f'{index}.jpg'), DATE_SPEC)
+        create_image_file(input_folder.joinpath('small.jpg'), DATE_SPEC, small=True)
+
+        cleaner = ImageClean('test_app', input=input_folder, output=output_folder, workers=2, check_small=True)
+        await cleaner.run()
+        for index in range(5):
+            self.assertTrue(output_folder.joinpath(DIR_SPEC).joinpath(f'{index}.jpg').exists())
+        self.assertTrue(output_folder.joinpath(cleaner.small_base).joinpath(DIR_SPEC).joinpath('small.jpg').exists())
+        self.assertIsNone(cleaner.executor, 'Pool is shut down')
+
+    @patch('pathlib.Path.home')
+    async def test_parallel_import_sidecar(self, home):
+        home.return_value = self.base
+        input_folder = self.base.joinpath('Input')
+        output_folder = self.base.joinpath('Output')
+        os.mkdir(output_folder)
+        image = create_image_file(input_folder.joinpath('edited.jpg'), DATE_SPEC)
+        write_sidecar(image, datetime(2001, 2, 3))
+
+        cleaner = ImageClean('test_app', input=input_folder, output=output_folder, workers=2, sidecar_dates=True)
+        await cleaner.run()
+        self.assertTrue(output_folder.joinpath('2001').joinpath('02').joinpath('03').joinpath('edited.jpg').exists(),
+                        'The sidecar wins over the date the pool found')
+        self.assertFalse(output_folder.joinpath(DIR_SPEC).joinpath('edited.jpg').exists())
+
+
+def _explode(*_args, **_kwargs):
+    raise ValueError('Worker failed')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Test Cases for the copy free file operations
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+# pylint: disable=import-error
+from backend.file_ops import copy_file, hard_link, reflink
+from Utilities.test_utilities import create_file
+
+
+class FileOpsTest(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.temp_base = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.source = create_file(Path(self.temp_base.name).joinpath('source.file'), data='some data')
+        self.destination = Path(self.temp_base.name).joinpath('destination.file')
+
+    def tearDown(self):
+        self.temp_base.cleanup()
+        super().tearDown()
+
+    def test_hard_link(self):
+        self.assertTrue(hard_link(self.source, self.destination))
+        self.assertEqual(os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+        self.assertFalse(hard_link(self.source, self.destination), 'Destination exists')
+
+    def test_copy_file(self):
+        with patch('backend.file_ops.PREALLOCATE_SIZE', 1):  # So it is preallocated
+            self.assertEqual(copy_file(self.source, self.destination), len('some data'))
+        self.assertEqual(self.destination.read_text(encoding='utf-8'), 'some data')
+        self.assertNotEqual(os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+
+    def test_copy_file_fallback(self):
+        create_file(self.destination, data='a lot more old data')
+        with patch('os.copy_file_range', side_effect=OSError('not supported'), create=True), \
+                patch('os.sendfile', side_effect=OSError('not supported'), create=True):
+            with self.assertLogs('Cleaner', level='DEBUG'):
+                self.assertEqual(copy_file(self.source, self.destination), len('some data'))
+        self.assertEqual(self.destination.read_text(encoding='utf-8'), 'some data', 'Old data is gone')
+
+    def test_copy_file_short(self):
+        with patch('os.copy_file_range', return_value=0, create=True):  # As some file systems do
+            with self.assertLogs('Cleaner', level='DEBUG') as logs:
+                self.assertEqual(copy_file(self.source, self.destination), len('some data'))
+            self.assertIn('Short copy', logs.output[0])
+        self.assertEqual(self.destination.read_text(encoding='utf-8'), 'some data', 'The next way copied all of it')
+
+    def test_copy_file_truncated(self):
+        stat = os.stat(self.source)
+        with patch('os.fstat') as fstat:  # The source is cut short after we looked at its size
+            fstat.return_value.st_size = stat.st_size + 100
+            with self.assertRaises(OSError):
+                copy_file(self.source, self.destination)
+        self.assertFalse(self.destination.exists(), 'Nothing is left behind')
+
+    def test_copy_file_head(self):
+        for patches in ([], ['os.copy_file_range'], ['os.copy_file_range', 'os.sendfile']):
+            with self.subTest(disabled=patches):
+                for name in patches:
+                    patcher = patch(name, side_effect=OSError('not supported'), create=True)
+                    patcher.start()
+                    self.addCleanup(patcher.stop)
+                self.assertEqual(copy_file(self.source, self.destination, head=b'new ', skip=5), len('new data'))
+                self.assertEqual(self.destination.read_text(encoding='utf-8'), 'new data')
+
+    def test_reflink(self):
+        if reflink(self.source, self.destination):  # pragma: no cover
+            self.assertEqual(self.destination.read_text(encoding='utf-8'), 'some data')
+            self.assertNotEqual(os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+        else:
+            self.assertFalse(self.destination.exists(), 'Nothing is left behind')
+
+    def test_reflink_unsupported(self):
+        with patch('backend.file_ops.fcntl.ioctl') as ioctl:
+            ioctl.side_effect = OSError(95, 'Operation not supported')
+            self.assertFalse(reflink(self.source, self.destination))
+        self.assertFalse(self.destination.exists(), 'Nothing is left behind')
+
+    def test_reflink_exists(self):
+        create_file(self.destination, data='other data')
+        self.assertFalse(reflink(self.source, self.destination))
+        self.assertEqual(self.destination.read_text(encoding='utf-8'), 'other data', 'Never overwrite')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -6,6 +6,7 @@ Test Cases for the Image Clean classes
 # pylint: disable=line-too-long
 # pylint: disable=missing-class-docstring
 # pylint: disable=missing-function-docstring
+import errno
 import os
 import platform
 import stat
@@ -16,9 +17,10 @@ from unittest.mock import patch
 import pytest
 
 # pylint: disable=import-error
-from backend.cleaner import CleanerBase, ImageCleaner
+from backend.cleaner import CleanerBase, ImageCleaner, make_cleaner_object
 from backend.image_clean import ImageClean
-from Utilities.test_utilities import create_file, create_image_file, count_files
+from backend.metadata import read_sidecar
+from Utilities.test_utilities import copy_file, create_file, create_image_file, count_files
 from Utilities.test_utilities import DIR_SPEC, YEAR_SPEC, DATE_SPEC, DEFAULT_NAME
 
 
@@ -672,6 +674,135 @@ class ActualScenarioTest(unittest.IsolatedAsyncioTestCase):
 
         self.assertTrue(input_file.exists())
 
+    @patch('pathlib.Path.home')  # Unchanged input files are not looked at again
+    async def test_import_manifest(self, home):
+        home.return_value = Path(self.temp_base.name)
+        unchanged = create_image_file(self.input_folder.joinpath('one.jpg'), DATE_SPEC)
+        changed = create_image_file(self.input_folder.joinpath('two.jpg'), DATE_SPEC)
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder)
+        await cleaner.run()
+        self.assertEqual(cleaner.skipped, 0)
+
+        CleanerBase.clear_caches()
+        create_image_file(changed, DATE_SPEC, text='changed')
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder)
+        with patch('backend.image_clean.make_cleaner_object', wraps=make_cleaner_object) as maker:
+            await cleaner.run()
+            self.assertNotIn(unchanged, [call.args[0] for call in maker.call_args_list], 'Skipped')
+            self.assertIn(changed, [call.args[0] for call in maker.call_args_list])
+        self.assertEqual(cleaner.skipped, 1)
+
+        CleanerBase.clear_caches()
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder, check_small=True)
+        await cleaner.run()
+        self.assertEqual(cleaner.skipped, 0, 'Different settings,  different decisions')
+
+    @patch('pathlib.Path.home')  # Files kept by one run are removed by a later one that does not keep originals
+    async def test_import_manifest_then_remove(self, home):
+        home.return_value = Path(self.temp_base.name)
+        original = create_image_file(self.input_folder.joinpath(DIR_SPEC).joinpath('one.jpg'), DATE_SPEC)
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder)
+        await cleaner.run()
+        self.assertTrue(original.exists())
+
+        CleanerBase.clear_caches()
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder, keep_originals=False)
+        await cleaner.run()
+        self.assertEqual(cleaner.skipped, 0, 'Not already imported,  it was kept last time')
+        self.assertFalse(original.exists())
+
+    @patch('pathlib.Path.home')  # A file that could not be copied is not in the manifest,  so it is tried again
+    async def test_import_manifest_failed_copy(self, home):
+        home.return_value = Path(self.temp_base.name)
+        original = create_image_file(self.input_folder.joinpath('one.jpg'), DATE_SPEC)
+        imported = self.output_folder.joinpath(DIR_SPEC).joinpath('one.jpg')
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder)
+        with patch('backend.transfer.copy_file', side_effect=OSError(errno.ENOSPC, 'No space left on device')), \
+                self.assertLogs('Cleaner', level='ERROR'):
+            await cleaner.run()
+        self.assertFalse(imported.exists())
+
+        CleanerBase.clear_caches()
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder)
+        await cleaner.run()
+        self.assertEqual(cleaner.skipped, 0)
+        self.assertTrue(imported.exists())
+        self.assertTrue(original.exists())
+
+    @patch('pathlib.Path.home')  # Exact copies end up sharing one file
+    async def test_consolidate(self, home):
+        home.return_value = Path(self.temp_base.name)
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder, consolidate=True)
+        original = create_image_file(self.output_folder.joinpath(DIR_SPEC), DATE_SPEC)
+        renamed = copy_file(original, self.output_folder.joinpath('Other'), new_name='renamed.jpg')
+        duplicate = copy_file(original, self.output_folder.joinpath(cleaner.duplicate_base).joinpath(DIR_SPEC))
+        different = create_image_file(self.output_folder.joinpath('Other').joinpath('different.jpg'), None)
+        size = os.stat(original).st_size
+
+        cleaner.setup()
+        self.assertEqual(cleaner.consolidate_duplicates(), (2, 2 * size))
+        self.assertEqual(cleaner.consolidate_duplicates(), (0, 0), 'Nothing left to do')
+        cleaner.teardown()
+        for path in (renamed, duplicate):
+            self.assertTrue(path.exists())
+            self.assertEqual(path.read_bytes(), original.read_bytes())
+        self.assertEqual(os.stat(different).st_nlink, 1)
+
+    @patch('pathlib.Path.home')  # Dates go in sidecars,  the images are never rewritten
+    async def test_sidecar_dates(self, home):
+        home.return_value = Path(self.temp_base.name)
+        original = create_image_file(self.input_folder.joinpath(DIR_SPEC).joinpath('undated.jpg'), None)
+        data = original.read_bytes()
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder, sidecar_dates=True,
+                             keep_originals=False)
+        await cleaner.run()
+        imported = self.output_folder.joinpath(DIR_SPEC).joinpath('undated.jpg')
+        self.assertEqual(imported.read_bytes(), data)
+        self.assertEqual(read_sidecar(imported), DATE_SPEC)
+        self.assertFalse(cleaner.library.sidecar_dates, 'Only while importing')
+
+    @patch('pathlib.Path.home')  # HEIC files are converted in a pool,  the JPEGs are imported and the originals kept
+    async def test_convert(self, home):
+        home.return_value = Path(self.temp_base.name)
+        heic = Path(__file__).parent.joinpath('data').joinpath('heic_image.HEIC')
+        original = copy_file(heic, self.input_folder.joinpath('phone'))
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder, do_convert=True,
+                             convert_workers=2, keep_originals=False, work_folder=Path(self.temp_base.name))
+        await cleaner.run()
+        imported = self.output_folder.joinpath('2021').joinpath('phone').joinpath('heic_image.jpg')
+        self.assertTrue(imported.exists())
+        migrated = self.output_folder.joinpath(cleaner.migration_base).joinpath('phone').joinpath('heic_image.HEIC')
+        self.assertEqual(migrated.read_bytes(), heic.read_bytes())
+        self.assertFalse(original.exists(), 'Moved to the migration folder')
+        self.assertEqual(list(Path(self.temp_base.name).glob('tmp*')), [], 'Conversions are cleaned up')
+
+    @patch('pathlib.Path.home')  # Same named HEIC files from different folders are both archived
+    async def test_convert_same_name(self, home):
+        home.return_value = Path(self.temp_base.name)
+        heic = Path(__file__).parent.joinpath('data').joinpath('heic_image.HEIC')
+        for folder in ('phone', 'camera'):
+            copy_file(heic, self.input_folder.joinpath(folder))
+        cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder, do_convert=True,
+                             keep_originals=False, work_folder=Path(self.temp_base.name))
+        await cleaner.run()
+        migrated = self.output_folder.joinpath(cleaner.migration_base)
+        for folder in ('phone', 'camera'):
+            self.assertFalse(self.input_folder.joinpath(folder).joinpath('heic_image.HEIC').exists())
+            self.assertEqual(migrated.joinpath(folder).joinpath('heic_image.HEIC').read_bytes(), heic.read_bytes())
+
+    @patch('pathlib.Path.home')  # The manifest has the HEIC input file,  not where it was archived
+    async def test_convert_manifest(self, home):
+        home.return_value = Path(self.temp_base.name)
+        heic = Path(__file__).parent.joinpath('data').joinpath('heic_image.HEIC')
+        original = copy_file(heic, self.input_folder.joinpath('phone'))
+        for expected in (0, 1):
+            CleanerBase.clear_caches()
+            cleaner = ImageClean(self.app_name, input=self.input_folder, output=self.output_folder, do_convert=True,
+                                 work_folder=Path(self.temp_base.name))
+            await cleaner.run()
+            self.assertEqual(cleaner.skipped, expected)
+            self.assertTrue(original.exists(), 'Kept')
+
 
 class InitTest(unittest.IsolatedAsyncioTestCase):
 
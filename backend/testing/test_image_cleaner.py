@@ -0,0 +1,61 @@
+"""
+Test Cases for the command line options that are checked before ImageClean is made
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+# pylint: disable=import-error
+from image_cleaner import main
+
+
+class CommandLineTest(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.temp_base = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.output_folder = Path(self.temp_base.name).joinpath('Output')
+        os.mkdir(self.output_folder)
+
+    def tearDown(self):
+        self.temp_base.cleanup()
+        super().tearDown()
+
+    @patch('builtins.print')
+    @patch('pathlib.Path.home')
+    def test_bad_numbers(self, home, my_print):
+        home.return_value = Path(self.temp_base.name)
+
+        for option in ('-nfour', '-n-1', '-j0', '-f0', '-w0', '-wmany'):
+            with self.assertRaises(SystemExit) as se:
+                main(["program_name", option, str(self.output_folder)])
+            self.assertEqual(se.exception.code, 5, f'Invalid number test {option}')
+        my_print.assert_called()
+
+    @patch('pathlib.Path.home')
+    def test_numbers(self, home):
+        home.return_value = Path(self.temp_base.name)
+
+        my_app = main(["program_name", "-n0", "-j2", "-f4", str(self.output_folder)])
+        self.assertEqual(my_app.workers, 2)
+        self.assertEqual(my_app.in_flight, 4)
+
+    @patch('builtins.print')
+    @patch('pathlib.Path.home')
+    def test_convert_needs_import(self, home, my_print):
+        home.return_value = Path(self.temp_base.name)
+
+        for option in ('--plan', '-w2'):
+            with self.assertRaises(SystemExit) as se:
+                main(["program_name", "-c", option, str(self.output_folder)])
+            self.assertEqual(se.exception.code, 6, f'Convert with {option}')
+        my_print.assert_called()
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+Test Cases for the run journal
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+# pylint: disable=import-error
+from backend.cleaner import ImageCleaner
+from backend.image_clean import ImageClean
+from backend.journal import Journal
+from backend.registry import DEFAULT_LIBRARY
+from backend.testing.base import TempFolderMixin
+from Utilities.test_utilities import copy_file, create_image_file, DATE_SPEC, DIR_SPEC
+
+
+class JournalTest(TempFolderMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.base.joinpath('journal.jsonl')
+
+    def test_pending(self):
+        journal = Journal(self.path)
+        journal.start(self.base.joinpath('in'), self.base.joinpath('out'))
+        finished = journal.intent('relocate', source='a', target='b')
+        interrupted = journal.intent('rollover', path='c')
+        journal.done(finished)
+        journal.folder_done(self.base.joinpath('in'))
+        journal.close()
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write('{"op": "relo')  # Killed half way through a write
+
+        journal = Journal(self.path)
+        self.assertEqual(list(journal.pending), [interrupted])
+        self.assertEqual(journal.pending[interrupted]['path'], 'c')
+        self.assertTrue(journal.is_done(self.base.joinpath('in')))
+        self.assertGreater(journal.intent('relocate'), interrupted, 'Ids are never reused')
+
+    def test_resume(self):
+        journal = Journal(self.path)
+        journal.start(self.base.joinpath('in'), self.base.joinpath('out'))
+        journal.folder_done(self.base.joinpath('in'))
+        journal.close()
+
+        journal = Journal(self.path)
+        journal.start(self.base.joinpath('in'), self.base.joinpath('out'))
+        journal.close()
+        self.assertTrue(Journal(self.path).is_done(self.base.joinpath('in')), 'Same run,  still done')
+
+        journal = Journal(self.path)
+        journal.start(self.base.joinpath('other'), self.base.joinpath('out'))
+        self.assertFalse(journal.is_done(self.base.joinpath('in')), 'A different run')
+        journal.finish()
+        self.assertFalse(self.path.exists())
+
+
+class RecoveryTest(TempFolderMixin, unittest.IsolatedAsyncioTestCase):
+
+    make_output = True
+
+    @patch('pathlib.Path.home')
+    async def test_interrupted_relocate(self, home):
+        home.return_value = Path(self.temp_base.name)
+        source = create_image_file(self.input_folder.joinpath('one.jpg'), DATE_SPEC)
+        target = copy_file(source, self.output_folder.joinpath(DIR_SPEC))  # The copy that was being made
+
+        cleaner = ImageClean('test_app', input=self.input_folder, output=self.output_folder)
+        journal = Journal(cleaner.journal_file)
+        journal.start(self.input_folder, self.output_folder)
+        journal.intent('relocate', source=source.as_posix(), target=target.as_posix())
+        journal.close()
+
+        cleaner.setup()
+        self.assertFalse(target.exists(), 'Rolled back')
+        self.assertTrue(source.exists())
+        cleaner.teardown()
+
+    @patch('pathlib.Path.home')
+    async def test_interrupted_rollover(self, home):
+        home.return_value = Path(self.temp_base.name)
+        destination = create_image_file(self.output_folder.joinpath('one.jpg'), DATE_SPEC)
+        create_image_file(self.output_folder.joinpath('one_1.jpg'), DATE_SPEC)  # one_0 was already moved on
+
+        cleaner = ImageClean('test_app', input=self.input_folder, output=self.output_folder)
+        journal = Journal(cleaner.journal_file)
+        journal.start(self.input_folder, self.output_folder)
+        journal.intent('rollover', path=destination.as_posix())
+        journal.close()
+
+        cleaner.setup()
+        self.assertFalse(destination.exists(), 'Rollover finished')
+        self.assertTrue(self.output_folder.joinpath('one_0.jpg').exists())
+        self.assertTrue(self.output_folder.joinpath('one_2.jpg').exists())
+        cleaner.teardown()
+
+    @patch('pathlib.Path.home')
+    async def test_resume(self, home):
+        home.return_value = Path(self.temp_base.name)
+        done = create_image_file(self.input_folder.joinpath('done').joinpath('one.jpg'), DATE_SPEC)
+        todo = create_image_file(self.input_folder.joinpath('todo').joinpath('two.jpg'), DATE_SPEC)
+
+        cleaner = ImageClean('test_app', input=self.input_folder, output=self.output_folder)
+        journal = Journal(cleaner.journal_file)
+        journal.start(self.input_folder, self.output_folder)
+        journal.folder_done(done.parent)
+        journal.close()
+
+        await cleaner.run()
+        imported = [path.name for path in self.output_folder.rglob('*.jpg')]
+        self.assertEqual(imported, ['two.jpg'], 'The finished folder was skipped')
+        self.assertTrue(todo.exists(), 'Originals are kept')
+        self.assertFalse(cleaner.journal_file.exists(), 'Completed runs leave no journal')
+
+    @patch('pathlib.Path.home')
+    async def test_operations_are_journaled(self, home):
+        home.return_value = Path(self.temp_base.name)
+        DEFAULT_LIBRARY.journal = Journal(Path(self.temp_base.name).joinpath('journal.jsonl'))
+        DEFAULT_LIBRARY.journal.start(self.input_folder, self.output_folder)
+        image = ImageCleaner(create_image_file(self.input_folder.joinpath('one.jpg'), DATE_SPEC))
+        copy_file(image.path, self.output_folder)
+        image.relocate_file(self.output_folder, rollover=True)
+        DEFAULT_LIBRARY.journal.close()
+        self.assertEqual(Journal(DEFAULT_LIBRARY.journal.path).pending, {}, 'Everything finished')
+        next_id = DEFAULT_LIBRARY.journal._next_id  # pylint: disable=protected-access
+        self.assertEqual(next_id, 2, 'A rollover and a relocate')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,228 @@
+"""
+Test Cases for the header-only EXIF reader
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import tempfile
+import unittest
+
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+from unittest.mock import patch
+
+import piexif
+from PIL import Image
+
+# pylint: disable=import-error
+from backend.file_ops import copy_file
+from backend.metadata import dimensions, exif_header, load_exif, movie_duration, probe_dimensions, read_exif, \
+    read_sidecar, sidecar_path, write_sidecar
+from Utilities.test_utilities import create_file, create_image_file, DATE_SPEC
+
+
+def box(kind: bytes, data: bytes, version: Optional[int] = None, flags: int = 0) -> bytes:
+    if version is not None:
+        data = bytes([version]) + flags.to_bytes(3, 'big') + data
+    return (len(data) + 8).to_bytes(4, 'big') + kind + data
+
+
+def heif_file(exif: Optional[bytes], primary_size: Tuple[int, int], other_size: Tuple[int, int]) -> bytes:
+    """
+    A HEIF file with no picture,  item 1 is the primary image and item 2 the Exif (kept in idat)
+    """
+    infe = [box(b'infe', (1).to_bytes(2, 'big') + b'\x00\x00hvc1\x00', version=2)]
+    iloc = b''
+    if exif:
+        infe.append(box(b'infe', (2).to_bytes(2, 'big') + b'\x00\x00Exif\x00', version=2))
+        iloc = ((2).to_bytes(2, 'big') + (1).to_bytes(2, 'big') + b'\x00\x00' + (1).to_bytes(2, 'big') +
+                (0).to_bytes(4, 'big') + len(exif).to_bytes(4, 'big'))  # construction method 1
+    ispe = [box(b'ispe', width.to_bytes(4, 'big') + height.to_bytes(4, 'big'), version=0)
+            for width, height in (other_size, primary_size)]
+    ipma = box(b'ipma', (1).to_bytes(4, 'big') + (1).to_bytes(2, 'big') + b'\x01\x82', version=0)
+    meta = box(b'meta', box(b'hdlr', b'\x00' * 20, version=0) + box(b'pitm', (1).to_bytes(2, 'big'), version=0) +
+               box(b'iinf', len(infe).to_bytes(2, 'big') + b''.join(infe), version=0) +
+               box(b'iloc', b'\x44\x00' + (1 if exif else 0).to_bytes(2, 'big') + iloc, version=1) +
+               box(b'iprp', box(b'ipco', b''.join(ispe)) + ipma) + box(b'idat', exif or b''), version=0)
+    return box(b'ftyp', b'heic\x00\x00\x00\x00mif1heic') + meta
+
+
+def movie_file(created: int, moov: bytes = b'', brand: Optional[bytes] = b'qt  ') -> bytes:
+    """
+    A movie with a big mdat before its moov,  created is seconds since 1904
+    """
+    timing = (600).to_bytes(4, 'big') + (7500).to_bytes(4, 'big')  # 12.5 seconds
+    mvhd = box(b'mvhd', created.to_bytes(4, 'big') + bytes(4) + timing + bytes(80), version=0)
+    start = box(b'ftyp', brand + b'\x00\x00\x00\x00' + brand) if brand else box(b'wide', b'')
+    return start + box(b'mdat', bytes(100000)) + box(b'moov', mvhd + moov)
+
+
+def apple_meta(date: bytes) -> bytes:
+    """
+    The meta box a phone writes,  keys then an ilst with items numbered by key
+    """
+    keys = [b'com.apple.quicktime.make', b'com.apple.quicktime.creationdate']
+    entries = b''.join((len(key) + 8).to_bytes(4, 'big') + b'mdta' + key for key in keys)
+    items = [box((1).to_bytes(4, 'big'), box(b'data', bytes(8) + b'Apple')),
+             box((2).to_bytes(4, 'big'), box(b'data', bytes(8) + date))]
+    return box(b'meta', box(b'hdlr', bytes(24)) + box(b'keys', (len(keys)).to_bytes(4, 'big') + entries, version=0) +
+               box(b'ilst', b''.join(items)))
+
+
+class MetadataTest(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.temp_base = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.base = Path(self.temp_base.name)
+
+    def tearDown(self):
+        self.temp_base.cleanup()
+        super().tearDown()
+
+    def test_jpeg(self):
+        path = create_image_file(self.base.joinpath('dated.jpg'), DATE_SPEC, small=True)
+        exif_dict = read_exif(path)
+        expected = piexif.load(str(path))['0th'][piexif.ImageIFD.DateTime]
+        self.assertEqual(exif_dict['0th'][piexif.ImageIFD.DateTime], expected)
+        self.assertEqual(dimensions(exif_dict), (360, 360))
+
+    def test_exif_dates(self):
+        path = self.base.joinpath('exif.jpg')
+        exif = {piexif.ExifIFD.DateTimeOriginal: b'1961:09:25 00:00:00',
+                piexif.ExifIFD.DateTimeDigitized: b'1961:09:26 00:00:00',
+                piexif.ExifIFD.PixelXDimension: 320, piexif.ExifIFD.PixelYDimension: 200}
+        Image.new('RGB', (320, 200), 'white').save(path, exif=piexif.dump({'Exif': exif}))
+        exif_dict = read_exif(path)
+        for tag, value in exif.items():
+            self.assertEqual(exif_dict['Exif'][tag], value)
+        self.assertEqual(dimensions({'Exif': exif_dict['Exif']}), (320, 200), 'From the tags')
+
+    def test_undated(self):
+        exif_dict = read_exif(create_image_file(self.base.joinpath('undated.jpg'), None))
+        self.assertEqual(exif_dict['0th'], {})
+        self.assertEqual(exif_dict['dimensions'], (400, 400))
+
+    def test_tiff(self):
+        path = self.base.joinpath('image.tiff')
+        Image.new('RGB', (64, 48), 'white').save(path, exif=piexif.dump({'0th': {
+            piexif.ImageIFD.DateTime: DATE_SPEC.strftime('%Y:%m:%d %H:%M:%S')}}))
+        exif_dict = read_exif(path)
+        self.assertEqual(exif_dict['0th'][piexif.ImageIFD.DateTime], b'1961:09:27 00:00:00')
+        self.assertEqual(dimensions(exif_dict), (64, 48))
+
+    def test_not_an_image(self):
+        path = create_file(self.base.joinpath('text.jpg'))
+        self.assertIsNone(read_exif(path))
+        self.assertIsNone(dimensions({}))
+        with self.assertRaises(piexif.InvalidImageDataError):
+            load_exif(path)
+
+    def test_truncated(self):
+        path = create_image_file(self.base.joinpath('whole.jpg'), DATE_SPEC)
+        truncated = self.base.joinpath('truncated.jpg')
+        truncated.write_bytes(path.read_bytes()[:30])
+        self.assertIsNone(read_exif(truncated), 'The EXIF is cut short')
+
+    def test_exif_header(self):
+        def change(exif_dict):
+            exif_dict['Exif'][piexif.ExifIFD.DateTimeDigitized] = b'1961:09:26 00:00:00'
+
+        jfif = self.base.joinpath('jfif.jpg')
+        Image.new('RGB', (32, 32), 'white').save(jfif)
+        for path in (create_image_file(self.base.joinpath('undated.jpg'), None),
+                     create_image_file(self.base.joinpath('dated.jpg'), DATE_SPEC), jfif):
+            with self.subTest(path=path.name):
+                exif_dict = piexif.load(str(path))
+                change(exif_dict)
+                expected = self.base.joinpath('expected.jpg')
+                piexif.insert(piexif.dump(exif_dict), str(path), str(expected))
+                head, skip = exif_header(path, change)
+                copy_file(path, self.base.joinpath('copy.jpg'), head, skip)
+                self.assertEqual(self.base.joinpath('copy.jpg').read_bytes(), expected.read_bytes())
+        with self.assertRaises(piexif.InvalidImageDataError):
+            exif_header(create_file(self.base.joinpath('text.jpg')), change)
+
+    def test_sidecar(self):
+        path = create_image_file(self.base.joinpath('image.jpg'), None)
+        self.assertIsNone(read_sidecar(path))
+        write_sidecar(path, DATE_SPEC)
+        self.assertEqual(sidecar_path(path).name, 'image.jpg.xmp')
+        self.assertEqual(read_sidecar(path), DATE_SPEC)
+
+        sidecar_path(path).write_text('<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF '
+                                      'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"><rdf:Description '
+                                      'xmlns:photoshop="http://ns.adobe.com/photoshop/1.0/"><photoshop:DateCreated>'
+                                      '1961-09-27</photoshop:DateCreated></rdf:Description></rdf:RDF></x:xmpmeta>')
+        self.assertEqual(read_sidecar(path), DATE_SPEC, 'Another program wrote it')
+        sidecar_path(path).write_text('<not xml')
+        with self.assertLogs('Cleaner', level='DEBUG'):
+            self.assertIsNone(read_sidecar(path))
+
+    def test_probe_dimensions(self):
+        for suffix, mode in (('png', 'RGB'), ('png', 'P'), ('bmp', 'RGB'), ('tiff', 'RGB'), ('jpg', 'L')):
+            with self.subTest(suffix=suffix, mode=mode):
+                path = self.base.joinpath(f'image.{suffix}')
+                Image.new(mode, (123, 45)).save(path)
+                self.assertEqual(probe_dimensions(path), (123, 45))
+        heic = Path(__file__).parent.joinpath('data').joinpath('heic_image.HEIC')
+        self.assertEqual(probe_dimensions(heic), (4032, 3024), 'The image,  not its tiles or thumbnail')
+        self.assertIsNone(probe_dimensions(create_file(self.base.joinpath('text.jpg'))))
+
+        truncated = self.base.joinpath('truncated.heic')
+        truncated.write_bytes(heic.read_bytes()[:200])
+        self.assertIsNone(probe_dimensions(truncated))
+
+    def test_heic(self):
+        heic = Path(__file__).parent.joinpath('data').joinpath('heic_image.HEIC')
+        exif_dict = read_exif(heic)
+        self.assertEqual(exif_dict['Exif'][piexif.ExifIFD.DateTimeOriginal], b'2021:10:07 14:27:20')
+        self.assertEqual(exif_dict['dimensions'], (4032, 3024), 'The grid image,  not a tile')
+
+    def test_heif_idat(self):
+        tiff = piexif.dump({'0th': {piexif.ImageIFD.DateTime: b'1961:09:27 00:00:00'}})[6:]
+        exif = b'\x00\x00\x00\x06Exif\x00\x00' + tiff  # The offset of the TIFF header,  then the Exif header
+        path = self.base.joinpath('built.heic')
+        path.write_bytes(heif_file(exif, primary_size=(300, 200), other_size=(640, 480)))
+        exif_dict = read_exif(path)
+        self.assertEqual(exif_dict['0th'][piexif.ImageIFD.DateTime], b'1961:09:27 00:00:00')
+        self.assertEqual(probe_dimensions(path), (300, 200), 'The primary item,  not the biggest')
+        path.write_bytes(heif_file(None, primary_size=(300, 200), other_size=(640, 480)))
+        self.assertEqual(read_exif(path), {'0th': {}, 'Exif': {}, 'dimensions': (300, 200)})
+
+    def test_movie(self):
+        path = self.base.joinpath('movie.mov')
+        created = 3716444840  # 2021-10-07 10:27:20 UTC
+        expected = datetime.fromtimestamp(created - 2082844800).strftime('%Y:%m:%d %H:%M:%S').encode()
+        path.write_bytes(movie_file(created))
+        self.assertEqual(read_exif(path), {'0th': {piexif.ImageIFD.DateTime: expected}, 'Exif': {}, 'duration': 12.5})
+        self.assertEqual(movie_duration(path), 12.5)
+        path.write_bytes(movie_file(0, brand=None))
+        self.assertEqual(read_exif(path), {'0th': {}, 'Exif': {}, 'duration': 12.5}, 'The camera did not know the time')
+
+        for name, moov in (('udta', box(b'udta', box(b'\xa9day', b'\x00\x19\x15\xc7' + b'1961-09-27T13:14:15+0100'))),
+                           ('keys', apple_meta(b'1961-09-27T13:14:15-0400')),
+                           ('ilst', box(b'udta', box(b'meta', box(b'hdlr', bytes(24), version=0) + box(b'ilst', box(
+                               b'\xa9day', box(b'data', bytes(8) + b'1961-09-27T13:14:15Z'))), version=0)))):
+            with self.subTest(name=name):
+                path.write_bytes(movie_file(0, moov, brand=b'isom'))
+                self.assertEqual(read_exif(path)['Exif'], {piexif.ExifIFD.DateTimeOriginal: b'1961:09:27 13:14:15'})
+        path.write_bytes(movie_file(0, box(b'udta', box(b'\xa9day', b'\x00\x04\x15\xc71961'))))
+        self.assertEqual(read_exif(path)['Exif'], {}, 'Not a date we understand')
+
+        path.write_bytes(movie_file(created)[:100028])
+        self.assertEqual(read_exif(path), {'0th': {}, 'Exif': {}}, 'No moov')
+        self.assertIsNone(movie_duration(path))
+        with patch.object(piexif, 'load') as piexif_load:
+            self.assertEqual(load_exif(path), {'0th': {}, 'Exif': {}})
+            piexif_load.assert_not_called()
+
+    @patch('backend.metadata.read_exif')
+    def test_fallback(self, reader):
+        reader.return_value = None
+        path = create_image_file(self.base.joinpath('dated.jpg'), DATE_SPEC)
+        self.assertIn(piexif.ImageIFD.DateTime, load_exif(path)['0th'], 'piexif read it')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Test Cases for import plans
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import io
+import json
+import os
+import unittest
+
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+# pylint: disable=import-error
+from backend.cleaner import CleanerBase
+from backend.image_clean import ImageClean, DUPLICATE, IMPORTED
+from backend.plan import COPY, KEEP, MOVE, REMOVE, Operation, Simulation
+from backend.testing.base import TempFolderMixin
+from Utilities.test_utilities import copy_file, create_file, create_image_file, DATE_SPEC
+
+
+def snapshot(path: Path):
+    return sorted((base, tuple(sorted(files))) for base, _, files in os.walk(path))
+
+
+class SimulationTest(TempFolderMixin, unittest.TestCase):
+
+    def test_apply(self):
+        source = create_file(self.base.joinpath('a.file'))
+        destination = self.base.joinpath('out').joinpath('a.file')
+        simulation = Simulation()
+        simulation.apply(Operation(COPY, source, destination))
+        self.assertTrue(simulation.exists(source))
+        self.assertTrue(simulation.exists(destination))
+        simulation.apply(Operation(MOVE, destination, source))
+        self.assertFalse(simulation.exists(destination))
+        self.assertFalse(destination.exists(), 'Only pretending')
+
+        simulation = Simulation()
+        simulation.apply(Operation(MOVE, source, destination))
+        simulation.revert(Operation(MOVE, source, destination))
+        self.assertTrue(simulation.exists(source), 'Forgotten')
+        self.assertFalse(simulation.exists(destination))
+
+    def test_json(self):
+        operation = Operation(REMOVE, Path('/in/a.jpg'), Path('/out/a.jpg'), decision=DUPLICATE, obj=object())
+        self.assertEqual(json.loads(operation.to_json()),
+                         {'action': 'remove', 'source': '/in/a.jpg', 'destination': '/out/a.jpg', 'rollover': False,
+                          'register': False, 'decision': 'duplicate'})
+        self.assertTrue(operation.removes)
+        self.assertFalse(operation.writes)
+        self.assertFalse(Operation(KEEP, Path('a'), Path('b')).removes)
+
+
+class PlanTest(TempFolderMixin, unittest.IsolatedAsyncioTestCase):
+
+    make_output = True
+
+    def setUp(self):
+        super().setUp()
+        self.first = create_image_file(self.input_folder.joinpath('a').joinpath('first.jpg'), DATE_SPEC)
+        self.again = copy_file(self.first, self.first.parent, new_name='again.jpg')  # Same content
+        self.other = create_image_file(self.input_folder.joinpath('b').joinpath('other.jpg'), DATE_SPEC)
+        create_file(self.input_folder.joinpath('notes.txt'))
+
+    @patch('pathlib.Path.home')
+    async def test_plan_matches_import(self, home):
+        home.return_value = Path(self.temp_base.name)
+        before = snapshot(Path(self.temp_base.name).joinpath('Input')), snapshot(self.output_folder)
+
+        cleaner = ImageClean('test_app', input=self.input_folder, output=self.output_folder, keep_originals=False)
+        cleaner.setup()
+        plan = list(cleaner.plan(self.input_folder))
+        cleaner.teardown()
+        self.assertEqual((snapshot(self.input_folder), snapshot(self.output_folder)), before, 'Nothing was touched')
+        self.assertEqual([operation.action for operation in plan], [MOVE, MOVE, MOVE])
+        self.assertEqual(sorted(operation.decision for operation in plan), [DUPLICATE, IMPORTED, IMPORTED],
+                         'The planned import of one copy makes the other a duplicate')
+        self.assertIsNone(cleaner.library.planner)
+
+        CleanerBase.clear_caches()
+        cleaner = ImageClean('test_app', input=self.input_folder, output=self.output_folder, keep_originals=False)
+        await cleaner.run()
+        for operation in plan:
+            self.assertTrue(operation.destination.exists(), f'{operation.destination} as planned')
+            self.assertFalse(operation.source.exists())
+
+    @patch('pathlib.Path.home')
+    async def test_plan_only(self, home):
+        home.return_value = Path(self.temp_base.name)
+        cleaner = ImageClean('test_app', input=self.input_folder, output=self.output_folder, plan=True, verbose=True)
+        output, progress = io.StringIO(), io.StringIO()
+        with redirect_stdout(output), redirect_stderr(progress):
+            await cleaner.run()
+        self.assertIn('Scanning Folder', progress.getvalue(), 'Progress goes to stderr')
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([line['action'] for line in lines], [COPY, COPY, COPY])
+        self.assertIn(self.output_folder.joinpath('1961').joinpath('b').joinpath('other.jpg').as_posix(),
+                      [line['destination'] for line in lines])
+        self.assertTrue(self.first.exists())
+        self.assertFalse(self.output_folder.joinpath('1961').exists(), 'Only planned')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
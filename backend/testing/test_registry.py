@@ -0,0 +1,111 @@
+"""
+Test Cases for the library registry
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import asyncio
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+# pylint: disable=import-error
+from backend.cleaner import FileCleaner, Folder
+from backend.image_clean import ImageClean
+from backend.registry import DEFAULT_LIBRARY, FileBucket, FileMap, Library
+from backend.testing.base import TempFolderMixin
+from Utilities.test_utilities import create_file, create_image_file, DATE_SPEC, DIR_SPEC
+
+
+class RegistryTest(TempFolderMixin, unittest.TestCase):
+
+    def test_bucket(self):
+        bucket = FileBucket()
+        first, second, third = object(), object(), object()
+        for value in (first, second, third):
+            bucket.append(value)
+        self.assertTrue(bucket.remove(second))
+        self.assertFalse(bucket.remove(second), 'Already gone')
+        self.assertEqual(list(bucket), [first, third], 'Registration order')
+        self.assertIs(bucket[1], third)
+        self.assertIn(first, bucket)
+
+    def test_file_map(self):
+        files = FileMap(shards=2)
+        values = [object() for _ in range(10)]
+        for index, value in enumerate(values):
+            files.add(f'KEY{index % 5}', value)
+        self.assertEqual(len(files), 5)
+        self.assertEqual(sorted(files), [f'KEY{index}' for index in range(5)])
+        self.assertTrue(files.remove('KEY0', values[0]))
+        self.assertFalse(files.remove('KEY1', values[0]), 'Not under that name')
+        self.assertTrue(files.remove('KEY0', values[5]))
+        self.assertNotIn('KEY0', files, 'The name goes with its last file')
+        self.assertEqual(files.get('KEY0'), None)
+        files.clear()
+        self.assertEqual(files, {})
+
+    def test_threaded_registration(self):
+        folder = Folder(self.base, self.base, cache=True)
+        objs = [FileCleaner(create_file(self.base.joinpath(f'file{index % 20}_{index}.file'), data=str(index)))
+                for index in range(200)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda obj: obj.register(), objs))
+        self.assertEqual(sum(len(bucket) for bucket in DEFAULT_LIBRARY.registry.files.values()), 200)
+        self.assertEqual(folder.count, 200)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda obj: obj.de_register(), objs[::2]))
+        self.assertEqual(folder.count, 100)
+        self.assertEqual(len(DEFAULT_LIBRARY.registry.index), 100)
+
+    def test_library(self):
+        library = Library()
+        obj = FileCleaner(create_file(self.base.joinpath('a.file')), library=library)
+        obj.register(base_folder=self.base)
+        self.assertIn('A', library.registry.files)
+        self.assertIsNotNone(Folder.get_folder(self.base, library), 'Its folder is in the same library')
+        self.assertEqual(DEFAULT_LIBRARY.registry.files, {}, 'Nothing else is')
+        library.clear()
+        self.assertEqual(library.registry.files, {})
+
+    @patch('pathlib.Path.home')
+    def test_two_libraries(self, home):
+        home.return_value = self.base
+        apps = []
+        for name in ('one', 'two'):
+            output_folder = self.base.joinpath(name)
+            create_image_file(output_folder.joinpath(DIR_SPEC).joinpath(f'{name}.jpg'), DATE_SPEC)
+            apps.append(ImageClean(f'test_{name}', output=output_folder, input=output_folder))
+        for app in apps:
+            app.setup()
+            app.teardown()
+        self.assertEqual(list(apps[0].registry.files), ['ONE'])
+        self.assertEqual(list(apps[1].registry.files), ['TWO'], 'Each library has its own')
+
+    @patch('pathlib.Path.home')
+    def test_concurrent_libraries(self, home):
+        home.return_value = self.base
+        apps = []
+        for name in ('one', 'two'):
+            input_folder, output_folder = self.base.joinpath(f'{name}_in'), self.base.joinpath(name)
+            output_folder.mkdir()
+            for index in range(10):
+                create_image_file(input_folder.joinpath(f'{name}{index}.jpg'), DATE_SPEC)
+            apps.append(ImageClean(f'test_{name}', output=output_folder, input=input_folder, in_flight=2,
+                                   sidecar_dates=name == 'two'))
+
+        async def run_both():
+            await asyncio.gather(*(app.run() for app in apps))
+
+        asyncio.run(run_both())
+        for app, name, other in ((apps[0], 'one', 'two'), (apps[1], 'two', 'one')):
+            imported = sorted(path.name for path in app.output_folder.joinpath(DIR_SPEC).glob('*.jpg'))
+            self.assertEqual(imported, sorted(f'{name}{index}.jpg' for index in range(10)))
+            self.assertEqual(sorted(app.registry.files), sorted(f'{name.upper()}{index}' for index in range(10)),
+                             f'Nothing from {other}')
+            self.assertFalse(app.library.sidecar_dates, 'Detached once it is done')
+        self.assertEqual(DEFAULT_LIBRARY.registry.files, {}, 'Neither used the default library')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Test Cases for near duplicate detection
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import os
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+# pylint: disable=import-error
+from backend.cleaner import CleanerBase, ImageCleaner
+from backend.image_clean import ImageClean
+from backend.similarity import BKTree, dhash, hamming
+from backend.testing.base import TempFolderMixin
+from Utilities.test_utilities import count_files, create_file
+
+
+def create_pattern(path: Path, size=(400, 300), flip: bool = False, quality: int = 95) -> Path:
+    """
+    An image with some structure to it,  so the hash is not just a blank page
+    """
+    if not path.parent.exists():
+        os.makedirs(path.parent)
+    radial = Image.radial_gradient('L').crop((0, 0, 192, 160))
+    linear = Image.linear_gradient('L').rotate(90).crop((0, 0, 192, 160))
+    canvas = Image.merge('RGB', (radial, linear, Image.new('L', radial.size, 128))).resize(size)
+    if flip:
+        canvas = canvas.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    canvas.save(path, quality=quality)
+    return path
+
+
+class HashTest(TempFolderMixin, unittest.TestCase):
+
+    def test_hamming(self):
+        self.assertEqual(hamming(0, 0), 0)
+        self.assertEqual(hamming(0b1010, 0b0101), 4)
+
+    def test_dhash(self):
+        original = create_pattern(self.base.joinpath('original.jpg'))
+        resized = create_pattern(self.base.joinpath('resized.jpg'), size=(200, 150), quality=60)
+        different = create_pattern(self.base.joinpath('different.jpg'), flip=True)
+        with Image.open(original) as one, Image.open(resized) as two, Image.open(different) as three:
+            first, second, third = dhash(one), dhash(two), dhash(three)
+        self.assertLessEqual(hamming(first, second), 4, 'Re-encoded and resized')
+        self.assertGreater(hamming(first, third), 16, 'Really different')
+
+    def test_image_cleaner(self):
+        image = ImageCleaner(create_pattern(self.base.joinpath('original.jpg')))
+        self.assertIsNotNone(image.perceptual_hash)
+        self.assertIsNone(ImageCleaner(create_file(self.base.joinpath('bad.jpg'))).perceptual_hash)
+        self.assertIsNone(ImageCleaner(create_file(self.base.joinpath('movie.mov'))).perceptual_hash)
+        self.assertIsNone(CleanerBase(self.base.joinpath('text.txt')).perceptual_hash)
+
+
+class BKTreeTest(unittest.TestCase):
+
+    def test_search(self):
+        tree = BKTree()
+        self.assertEqual(tree.search(0, 64), [])
+        values = [0b0, 0b1, 0b11, 0b111, 0b1111_0000, 0b1111_1111]
+        items = {value: f'item{value}' for value in values}
+        for value in values:
+            tree.add(value, items[value])
+        tree.add(0b1, 'again')
+        self.assertEqual(len(tree), len(values) + 1)
+
+        self.assertEqual(tree.search(0, 0), [(0, 'item0')])
+        self.assertEqual(tree.search(0, 1), [(0, 'item0'), (1, 'item1'), (1, 'again')])
+        self.assertEqual({item for _, item in tree.search(0b1111_1111, 4)}, {'item255', 'item240'})
+        self.assertEqual(len(tree.search(0, 64)), len(values) + 1)
+
+        tree.remove(items[0])
+        self.assertEqual(tree.search(0, 0), [])
+        self.assertEqual(len(tree), len(values))
+
+    def test_matches_linear_scan(self):
+        tree = BKTree()
+        values = [(index * 2654435761) & 0xFFFF for index in range(500)]
+        for index, value in enumerate(values):
+            tree.add(value, index)
+        for probe in (0, 0xFFFF, 12345):
+            expected = {index for index, value in enumerate(values) if hamming(probe, value) <= 3}
+            self.assertEqual({item for _, item in tree.search(probe, 3)}, expected)
+
+
+class NearDuplicateImportTest(TempFolderMixin, unittest.IsolatedAsyncioTestCase):
+
+    make_output = True
+
+    def setUp(self):
+        super().setUp()
+        os.mkdir(self.input_folder)
+
+    @patch('pathlib.Path.home')
+    async def test_resized_copy(self, home):
+        home.return_value = Path(self.temp_base.name)
+        create_pattern(self.output_folder.joinpath('Vacation').joinpath('original.jpg'))
+        create_pattern(self.input_folder.joinpath('small_copy.jpg'), size=(200, 150), quality=60)
+
+        cleaner = ImageClean('test_app', input=self.input_folder, output=self.output_folder, similarity=4)
+        await cleaner.run()
+        duplicates = self.output_folder.joinpath(cleaner.duplicate_base)
+        self.assertEqual(count_files(duplicates, 'small_copy.jpg'), 1, 'Treated as a duplicate')
+
+        CleanerBase.clear_caches()
+        cleaner = ImageClean('test_app', input=self.input_folder, output=self.output_folder, similarity=0)
+        await cleaner.run()
+        self.assertEqual(count_files(self.output_folder, 'small_copy.jpg'), 2, 'Without similarity it is new')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
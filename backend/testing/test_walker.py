@@ -0,0 +1,59 @@
+"""
+Test Cases for the folder walker
+"""
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+# pylint: disable=import-error
+from backend.walker import scan_folder, walk
+from Utilities.test_utilities import create_file
+
+
+class WalkerTest(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.temp_base = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.root = Path(self.temp_base.name)
+        create_file(self.root.joinpath('a.file'))
+        create_file(self.root.joinpath('one').joinpath('b.file'))
+        create_file(self.root.joinpath('one').joinpath('two').joinpath('c.file'))
+        os.mkdir(self.root.joinpath('empty'))
+
+    def tearDown(self):
+        self.temp_base.cleanup()
+        super().tearDown()
+
+    def test_scan(self):
+        with patch('os.stat') as stat:
+            scan = scan_folder(self.root)
+            stat.assert_not_called()
+        self.assertEqual(scan.path, self.root)
+        self.assertEqual(sorted(entry.name for entry in scan.folders), ['empty', 'one'])
+        self.assertEqual([entry.name for entry in scan.files], ['a.file'])
+        self.assertEqual(scan.count, 3)
+
+    def test_top_down(self):
+        order = [scan.path for scan in walk(self.root)]
+        self.assertEqual(order[0], self.root)
+        self.assertLess(order.index(self.root.joinpath('one')), order.index(self.root.joinpath('one', 'two')))
+        self.assertEqual(len(order), 4)
+
+    def test_bottom_up(self):
+        order = [scan.path for scan in walk(self.root, top_down=False)]
+        self.assertEqual(order[-1], self.root)
+        self.assertGreater(order.index(self.root.joinpath('one')), order.index(self.root.joinpath('one', 'two')))
+
+    def test_prune(self):
+        order = [scan.path for scan in walk(self.root, prune=lambda entry: entry.name == 'one')]
+        self.assertEqual(sorted(order), [self.root, self.root.joinpath('empty')])
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,308 @@
+"""
+Relocating a file,  the file system half of the cleaner objects (see CleanerBase).   An operation is planned (see
+plan_relocate) and then either simulated or done,  and the doing is split again into transfer,  which is safe on a
+worker thread,  and finish which updates the registry.
+"""
+import logging
+import os
+import threading
+
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# pylint: disable=import-error
+from backend.file_ops import copy_file, hard_link, reflink
+from backend.metadata import sidecar_path
+from backend.plan import COPY, KEEP, MOVE, REMOVE, Operation, Outcome
+from backend.registry import DEFAULT_LIBRARY, Library, registry_key
+
+logger = logging.getLogger('Cleaner')
+
+move_counts: Dict[str, int] = {'renamed': 0, 'cloned': 0, 'linked': 0, 'bytes_avoided': 0}  # Data we did not copy
+counts_lock = threading.Lock()  # Files can be relocated on worker threads (see PlanExecutor)
+
+
+def count(counts: Dict[str, int], key: str, value: int = 1):
+    """
+    Bump one of the counters
+    :param counts: stat_counts or move_counts
+    :param key:
+    :param value:
+    :return:
+    """
+    with counts_lock:
+        counts[key] += value
+
+
+class TransferMixin:
+    """
+    Relocating files,  for CleanerBase.   It relies on the registration and stat caching of CleanerBase,  and on
+    updates_metadata/set_date which only do something for images.
+    """
+    # pylint: disable=too-many-arguments
+    def relocate_file(self, new_path: Path, base_folder: Path = None, *, remove: bool = False, rollover: bool = True,
+                      register: bool = False, decision: str = '') -> Optional[Operation]:
+        """
+        :param new_path: A string representation of the folder
+        :param base_folder: The root of the output folder
+        :param remove: A boolean (default: False) Once successful on the relocate,   remove the original
+        :param rollover: A boolean (default: True) rollover an existing file if it exists otherwise ignore
+        :param register: A boolean (default:False), register this value after the move
+        :param decision: Why we are relocating,  only used to describe the operation
+        directory does not exist abort!
+        :return: The operation that was done (or simulated if a planner is attached)
+        """
+        operation = self.plan_relocate(new_path, base_folder=base_folder, remove=remove, rollover=rollover,
+                                       register=register, decision=decision)
+        if operation:
+            if self.library.planner:
+                self.simulate(operation)
+            else:
+                self.execute(operation)
+        return operation
+
+    # pylint: disable=too-many-arguments
+    def plan_relocate(self, new_path: Path, base_folder: Path = None, *, remove: bool = False, rollover: bool = True,
+                      register: bool = False, decision: str = '') -> Optional[Operation]:
+        """
+        Work out what relocate_file would do,  see relocate_file for the parameters
+        :return: The operation or None if there is nothing to do
+        """
+        if not new_path:
+            return None
+        new_file = new_path.joinpath(self.path.name)
+        if self.path == new_file:  # pragma: no cover
+            logger.debug('Will not copy to myself %s', new_file)
+            return None
+        exists = self.library.planner.exists(new_file) if self.library.planner else new_file.exists()
+        if exists and not rollover:
+            logger.debug('Will not overwrite %s', new_file)
+            action = REMOVE if remove else KEEP
+        else:
+            action = MOVE if remove else COPY
+        return Operation(action, self.path, new_file, rollover=exists and rollover, register=register,
+                         base_folder=base_folder, decision=decision, obj=self)
+
+    def execute(self, operation: Operation):
+        """
+        Relocate the file as planned
+        :param operation: from plan_relocate
+        :return:
+        """
+        self.finish(operation, self.transfer(operation))
+
+    def transfer(self, operation: Operation) -> Outcome:
+        """
+        The file system half of execute.   The registry is left alone (see finish) so this is safe on a worker thread,
+        the catalog and journal can cope with that.   Only the operation says where the file is,  so this also works
+        for an object that has been through a plan.
+        :param operation: from plan_relocate
+        :return: What was done
+        """
+        source, new_file = operation.source, operation.destination
+        ident = None
+        os.makedirs(new_file.parent, exist_ok=True)
+        if operation.rollover:
+            logger.debug('Rolling over %s', new_file)
+            self.rollover_file(new_file, self.library)
+
+        if operation.writes:
+            if self.library.journal:
+                ident = self.library.journal.intent('relocate', source=source.as_posix(), target=new_file.as_posix())
+            copied, renamed, written, dated = self.place_file(source, new_file, operation.removes)
+        else:
+            copied, renamed, written, dated = True, False, 0, False  # It is already there
+
+        removed = renamed
+        if operation.removes and copied and not renamed:
+            try:
+                os.unlink(source)
+                removed = True
+                if self.library.catalog:
+                    self.library.catalog.remove_file(source)
+            except OSError as error:   # pragma: no cover
+                logger.debug('%s could not be removed (%s)', source, error)
+        if ident is not None:
+            self.library.journal.done(ident)
+        if copied and not dated:
+            self.set_date(new_file)
+        return Outcome(copied, renamed, removed, written)
+
+    def place_file(self, source: Path, new_file: Path, move: bool) -> Tuple[bool, bool, int, bool]:
+        """
+        Put the content of source at new_file the cheapest way we can,  a rename if it is a move,  a link if we are
+        linking files and failing those a copy
+        :param source:
+        :param new_file: This must not exist
+        :param move: The source is going away
+        :return: (copied,  renamed,  bytes written,  dated as it was copied)
+        """
+        if move and self.move_file(source, new_file):
+            return True, True, 0, False
+        if self.library.link_files and self.link_file(source, new_file):
+            return True, False, 0, False
+        try:
+            written, dated = self.copy_content(source, new_file)
+        except PermissionError as error:  # pragma: no cover
+            logger.error('Can not write to %s - %s', new_file.parent, error)
+            return False, False, 0, False
+        if self.library.catalog:
+            self.library.catalog.add_file(new_file)
+        return True, False, written, dated
+
+    def finish(self, operation: Operation, outcome: Outcome):
+        """
+        The registry half of execute,  it must run on the main thread
+        :param operation: from plan_relocate
+        :param outcome: from transfer
+        :return:
+        """
+        if outcome.removed:
+            self.de_register()
+        if outcome.copied:
+            self.path = operation.destination
+            if not outcome.renamed:  # A rename keeps the same inode,  so what we know about the file still holds
+                self.invalidate_stat()
+        if operation.register and outcome.copied:
+            self.register(base_folder=operation.base_folder)
+
+    def simulate(self, operation: Operation):
+        """
+        Pretend to relocate the file,  the registry is updated as if we had but nothing on disk changes.   The object
+        keeps reading its content from where it really is (origin).
+        :param operation: from plan_relocate
+        :return:
+        """
+        self.library.planner.apply(operation)
+        if operation.removes:
+            self.de_register()
+        if operation.writes and not self.origin:
+            self.origin = self.path
+        self.path = operation.destination
+        if operation.register:
+            self.register(base_folder=operation.base_folder)
+
+    def revert(self, operation: Operation):
+        """
+        Undo simulate for an operation that could not be done,  so later decisions see the file where it really is
+        :param operation: from plan_relocate
+        :return:
+        """
+        if self.library.planner:
+            self.library.planner.revert(operation)
+        if self.path != operation.destination:  # It was never simulated,  or it has been planned somewhere else since
+            return
+        if operation.register:
+            self.de_register()
+        self.path = operation.source
+        if self.origin == operation.source:
+            self.origin = None
+
+    def source_stat(self, source: Path) -> Optional[os.stat_result]:
+        """
+        Stat the source of an operation,  from the cache if it is where our content is
+        :param source:
+        :return: stat result or None if the file does not exist
+        """
+        if source == self.content_path:
+            return self.stat()
+        try:
+            return os.stat(source)
+        except FileNotFoundError:
+            return None
+
+    def move_file(self, source: Path, new_file: Path) -> bool:
+        """
+        Within a file system a move is just a rename,  there is no need to copy the data
+        :param source: Where the file is now
+        :param new_file: The destination,  it must not exist and its folder must
+        :return: True if the file was moved,  False if it still needs to be copied
+        """
+        stat = self.source_stat(source)
+        if not stat or stat.st_dev != os.stat(new_file.parent).st_dev:
+            return False
+        try:
+            os.rename(source, new_file)
+        except OSError as error:  # pragma: no cover
+            logger.debug('Could not rename %s to %s (%s)', source, new_file, error)
+            return False
+        if self.library.catalog:
+            self.library.catalog.rename_file(source, new_file)
+        count(move_counts, 'renamed')
+        count(move_counts, 'bytes_avoided', stat.st_size)
+        return True
+
+    def link_file(self, source: Path, new_file: Path) -> bool:
+        """
+        Share the data with the new file rather than copying it.   A reflink is always safe,  a hard link only if we
+        are not going to change the file (see updates_metadata) since that would change the original too.
+        :param source: Where the file is now
+        :param new_file: The destination,  it must not exist and its folder must
+        :return: True if the new file was made,  False if it still needs to be copied
+        """
+        stat = self.source_stat(source)
+        if not stat or stat.st_dev != os.stat(new_file.parent).st_dev:
+            return False
+        if reflink(source, new_file):
+            count(move_counts, 'cloned')
+        elif not self.updates_metadata and hard_link(source, new_file):
+            count(move_counts, 'linked')
+        else:
+            return False
+        count(move_counts, 'bytes_avoided', stat.st_size)
+        if self.library.catalog:
+            self.library.catalog.add_file(new_file)
+        return True
+
+    def copy_content(self, source: Path, new_file: Path) -> Tuple[int, bool]:
+        """
+        Copy the data to the new file
+        :param source: Where the file is now
+        :param new_file: The destination
+        :return: (bytes written,  True if the copy already has the date set_date would give it)
+        """
+        return copy_file(source, new_file), False
+
+    @staticmethod
+    def rollover_file(destination: Path, library: Optional[Library] = None):
+        """
+        Allow up to 20 copies of a file before removing the oldest
+        file.type
+        file_0.type
+        file_1.type
+        etc
+        :param destination:
+        :param library: The library the file is in,  if it is in one
+        :return:
+        """
+        library = library if library else DEFAULT_LIBRARY
+        # The files under these paths are changing
+        for value in library.registry.files.get(registry_key(destination), []):
+            if value.path.parent == destination.parent:
+                value.forget_content()
+        if destination.exists():
+            ident = None
+            if library.journal:
+                ident = library.journal.intent('rollover', path=destination.as_posix())
+            for increment in reversed(range(20)):  # 19 -> 0
+                old_path = destination.parent.joinpath(f'{destination.stem}_{increment}{destination.suffix}')
+                if old_path.exists():
+                    new_path = destination.parent.joinpath(f'{destination.stem}_{increment + 1}{destination.suffix}')
+                    if new_path.exists():
+                        os.unlink(new_path)
+                    TransferMixin._rollover_rename(old_path, new_path, library)
+            new_path = destination.parent.joinpath(f'{destination.stem}_0{destination.suffix}')
+            TransferMixin._rollover_rename(destination, new_path, library)
+            if ident is not None:
+                library.journal.done(ident)
+
+    @staticmethod
+    def _rollover_rename(old_path: Path, new_path: Path, library: Library):
+        os.rename(old_path, new_path)
+        if library.catalog:
+            library.catalog.rename_file(old_path, new_path)
+        old_sidecar, new_sidecar = sidecar_path(old_path), sidecar_path(new_path)
+        if old_sidecar.exists():  # Its sidecar rolls over with it
+            os.replace(old_sidecar, new_sidecar)
+        elif new_sidecar.exists():  # This belonged to the file that was replaced
+            os.unlink(new_sidecar)
@@ -0,0 +1,71 @@
+"""
+A single scandir based folder walker used by registration,  import and audit.   Entries are os.DirEntry objects,  so
+the file type comes from the directory listing (no stat per entry) and any stat done is cached on the entry.
+"""
+import os
+
+from pathlib import Path
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+
+class FolderScan(NamedTuple):
+    """
+    The result of listing one folder
+    """
+    path: Path
+    folders: List[os.DirEntry]
+    files: List[os.DirEntry]
+
+    @property
+    def count(self) -> int:
+        """
+        :return: The number of members of this folder
+        """
+        return len(self.folders) + len(self.files)
+
+
+def scan_folder(path: Path) -> FolderScan:
+    """
+    List a folder once,  splitting it into sub-folders and files
+    :param path:
+    :return: FolderScan
+    """
+    folders, files = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                folders.append(entry)
+            else:
+                files.append(entry)
+    return FolderScan(path, folders, files)
+
+
+def stat_entry(entry: os.DirEntry) -> Optional[os.stat_result]:
+    """
+    The (cached) stat of a listed entry,  it may have gone away or be a broken link
+    :param entry:
+    :return: stat result or None
+    """
+    try:
+        return entry.stat()
+    except OSError:
+        return None
+
+
+def walk(path: Path, prune: Optional[Callable[[os.DirEntry], bool]] = None,
+         top_down: bool = True) -> Iterator[FolderScan]:
+    """
+    Walk a folder tree,  each folder is listed exactly once.
+    :param path: Where to start
+    :param prune: Called for each sub-folder,  return True to skip it (and everything below it)
+    :param top_down: Yield a folder before its sub-folders (default) or after them
+    :return: FolderScan for each folder
+    """
+    scan = scan_folder(path)
+    if top_down:
+        yield scan
+    for entry in scan.folders:
+        if not (prune and prune(entry)):
+            yield from walk(Path(entry.path), prune=prune, top_down=top_down)
+    if not top_down:
+        yield scan
@@ -59,7 +59,7 @@ def short_help() -> str:
     Build short help
     :return:
     """
-    return f'{APP_NAME} -hcrdsv -i <import_folder> image_folder\n' \
+    return f'{APP_NAME} -hcrlkxdsv [--plan] -n <distance> -j <workers> -f <files> -w <copies> -i <import_folder> image_folder\n' \
            '\n\n-h: This help' \
            '\nThis application will reorganize image files into a folder structure that is human friendly' \
            '\nGo to https://github.com/sagshome/ImageClean/wiki for details'
@@ -75,13 +75,64 @@ def app_help(app: ImageClean) -> str:  # pragma: no cover
            '\n\n-c: Converted (HEIC) files to JPG files. The original HEIC files are saved into the' \
            f'"{app.migration_base}" folder' \
            '\n-r: Remove imported files. if the file is imported successfully,  the original file is removed' \
+           '\n-l: Link imported files. when keeping originals on the same file system,  reflink or hard link them' \
+           ' into the image folder rather than copying them' \
+           '\n-k: Keep one copy. exact copies in the image folder (including duplicates) are replaced by links to a' \
+           ' single copy' \
+           '\n-x: XMP dates. dates worked out from names or folders go in an XMP sidecar (image.jpg.xmp),  so images' \
+           ' are never rewritten and can always be linked or moved' \
            '\n-d: Process Duplicates. look for and exact files in duplicate directories - and pick the best' \
-           f'\n-s: Check for small files (save in "{app.small_base}" folder) - This WILL slow down processing' \
+           f'\n-s: Check for small files (save in "{app.small_base}" folder)' \
+           '\n-n: Near duplicates. pictures within this perceptual distance (try 4) of one in the library are treated' \
+           ' as duplicates' \
+           '\n-j: Jobs. extract image metadata with this many processes (default 1)' \
+           '\n-f: Files in flight. how many files of a folder are read and copied at once (default 8)' \
+           '\n-w: Writers. plan the whole import first,  then copy up to this many files at once per disk' \
            '\n-v: Verbose,  blather on to the terminal' \
+           '\n--verify-movies: Compare big movies in full,  not just on their size,  duration and samples' \
+           '\n--convert-workers: With -c,  convert HEIC files in this many processes (default one per CPU)' \
+           '\n--work: With -c,  write conversions under this folder (a tmpfs is ideal,  default is $TMPDIR)' \
+           '\n--plan: Do not import anything,  write what would be done to the terminal (one JSON object per line)' \
            '\n-i import folder - where we are importing from (default is just process image_folder)' \
            '\n\nimage folder - where to image files are saved'
 
 
+SWITCHES = {'-c': ('do_convert', True),  # option -> (ImageClean argument,  value when it is given)
+            '-r': ('keep_originals', False),
+            '-l': ('link_files', True),
+            '-k': ('consolidate', True),
+            '-x': ('sidecar_dates', True),
+            '-s': ('check_small', True),
+            '-d': ('check_duplicates', True),
+            '-v': ('verbose', True),
+            '--plan': ('plan', True),
+            '--verify-movies': ('verify_movies', True)}
+
+NUMBERS = {'-n': ('similarity', 0),  # option -> (ImageClean argument,  the smallest value that makes sense)
+           '-j': ('workers', 1),
+           '-f': ('in_flight', 1),
+           '-w': ('io_workers', 1),
+           '--convert-workers': ('convert_workers', 0)}
+
+
+def number(opt: str, arg: str) -> int:
+    """
+    Check the value of a numeric option,  exits if it is not a number or is too small
+    :param opt: see NUMBERS
+    :param arg: what was given
+    :return: the value
+    """
+    minimum = NUMBERS[opt][1]
+    try:
+        value = int(arg)
+    except ValueError:
+        value = None
+    if value is None or value < minimum:
+        print(f'{opt} needs a whole number of at least {minimum},  not {arg}\n\n{short_help()}')
+        sys.exit(5)
+    return value
+
+
 async def run(app):  # pragma: no cover
     """
     This is needed to support async requirement of APP.run()
@@ -97,7 +148,8 @@ def main(arg_strings=None) -> ImageClean:
     :return: None
     """
     try:
-        opts, args = getopt.getopt(arg_strings[1:], 'hcrsdvi:', [])
+        opts, args = getopt.getopt(arg_strings[1:], 'hcrlkxsdvi:n:j:f:w:',
+                                   ['plan', 'verify-movies', 'convert-workers=', 'work='])
     except getopt.GetoptError:
         print(f'Invalid syntax: {sys.argv[1:]}\n\n')
         print(short_help())
@@ -111,24 +163,32 @@ def main(arg_strings=None) -> ImageClean:
     options = {'output': Path(args[0]),
                'do_convert': False,
                'keep_originals': True,
+               'link_files': False,
+               'consolidate': False,
+               'sidecar_dates': False,
+               'verify_movies': False,
+               'plan': False,
                'verbose': False,
                'check_small': False,
+               'similarity': 0,
+               'workers': 1,
+               'in_flight': 8,
+               'io_workers': 0,
+               'convert_workers': 0,
+               'work_folder': None,
                'check_duplicates': False}
 
     for opt, arg in opts:  # pragma: no cover
         if opt == '-h':
             print(app_help)
             sys.exit(2)
-        elif opt == '-c':
-            options['do_convert'] = True
-        elif opt == '-r':
-            options['keep_originals'] = False
-        elif opt == '-s':
-            options['check_small'] = True
-        elif opt == '-d':
-            options['check_duplicates'] = True
-        elif opt == '-v':
-            options['verbose'] = True
+        elif opt in SWITCHES:
+            name, value = SWITCHES[opt]
+            options[name] = value
+        elif opt in NUMBERS:
+            options[NUMBERS[opt][0]] = number(opt, arg)
+        elif opt == '--work':
+            options['work_folder'] = Path(arg)
         elif opt == '-i':
             try:
                 os.stat(arg)
@@ -137,6 +197,11 @@ def main(arg_strings=None) -> ImageClean:
                 sys.exit(3)
             options['input'] = Path(arg)
 
+    if options['do_convert'] and (options['plan'] or options['io_workers']):
+        print(f'-c can not be used with --plan or -w,  HEIC files are only converted as each folder is imported'
+              f'\n\n{short_help()}')
+        sys.exit(6)
+
     if 'input' not in options:
         options['input'] = options['output']
 